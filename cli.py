@@ -7,28 +7,42 @@ if len(sys.argv) < 2:
 args = sys.argv[1]
 assert args is None or args == "dev" or args == "prod"
 
+
+def run_in_container(code: str):
+    os.system(
+        " ".join(
+            [
+                "docker",
+                "exec",
+                "-it",
+                f"cu2m-cu2m-backend{'-dev' if args == 'dev' else ''}-1",
+                "python3",
+                "-c",
+                f'"{code}"',
+            ]
+        )
+    )
+
+
 while True:
-    line = input("To create a new user, type 'create [email]', or 'exit' to quit: ")
+    line = input(
+        "To create a new user, type 'create [email]', to reload course data, type 'reload', or 'exit' to quit: "
+    )
     if line == "exit":
         break
     elif line.startswith("create "):
         email = line.split(" ")[1]
         print(f"Creating user with email: {email}")
         data = {"email": email}
-        os.system(
-            " ".join(
-                [
-                    "docker",
-                    "exec",
-                    "-it",
-                    f"cu2m-cu2m-backend{'-dev' if args == 'dev' else ''}-1",
-                    "python3",
-                    "-c",
-                    "\"import requests; print(requests.post('http://127.0.0.1:5000/api/user/license', json={data}).json())\"".format(
-                        data=data.__str__()
-                    ),
-                ]
+        run_in_container(
+            "import requests; print(requests.post('http://127.0.0.1:5000/api/user/license', json={data}).json())".format(
+                data=data.__str__()
             )
         )
+    elif line == "reload":
+        print("Reloading course data")
+        run_in_container(
+            "import requests; print(requests.post('http://127.0.0.1:5000/api/courses/reload').json())"
+        )
     else:
         print("Invalid command. Please try again.")
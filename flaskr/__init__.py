@@ -16,6 +16,9 @@ from flaskr.api.exceptions import (
     NotFound,
 )
 from flaskr.api.respmodels import ResponseModel
+from flaskr.db.catalog import get_catalog
+from flaskr.db.course_queries import start_course_query_flusher
+from flaskr.db.courses import enable_course_search_cache_warming
 from flaskr.db.database import init_db
 from flaskr.utils import RequestFormatter
 
@@ -81,6 +84,13 @@ def create_app(test_config: dict[str, Any] | None = None):
 
     # Initialize database
     init_db()
+    # Background work of this worker, tests run it explicitly instead
+    if not app.testing:
+        enable_course_search_cache_warming()
+        start_course_query_flusher()
+    # Load the course catalog ahead of the first request, which also warms the
+    # course search cache when enabled above
+    get_catalog()
 
     try:
         os.makedirs(app.instance_path)
@@ -2,7 +2,15 @@ from flask import Blueprint
 from flask import current_app as app
 from flask_pydantic import validate  # type: ignore
 
-from flaskr.api import course_plans, courses, health, ping, semester_plans, user
+from flaskr.api import (
+    course_plans,
+    courses,
+    health,
+    ping,
+    semester_plans,
+    user,
+    workspace,
+)
 from flaskr.api.exceptions import MethodNotAllowed
 from flaskr.api.respmodels import RootResponseModel
 
@@ -28,3 +36,4 @@ route.register_blueprint(courses.route)
 route.register_blueprint(user.route)
 route.register_blueprint(course_plans.route)
 route.register_blueprint(semester_plans.route)
+route.register_blueprint(workspace.route)
@@ -0,0 +1,15 @@
+from flask import request
+
+from flaskr.api.exceptions import BadRequest
+
+
+def parse_flag(name: str):
+    """
+    Parse an optional boolean query flag.
+    """
+    flag = request.args.get(name)
+    if flag and flag.lower() not in ["true", "false"]:
+        raise BadRequest(
+            debug_info=f"{name.capitalize()} flag can only be a boolean value (true or false)."
+        )
+    return flag is not None and flag.lower() == "true"
@@ -1,35 +1,141 @@
+import os
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from typing import Callable, ParamSpec, TypeVar
 
 from flask import session
+from pydantic import ValidationError
 
 from flaskr.api.exceptions import Unauthorized
-from flaskr.db.user import get_user_by_username
+from flaskr.db.models import SessionClaims, User
+from flaskr.db.user import get_cached_user_by_username, get_user_credentials
 
 P = ParamSpec("P")
 R = TypeVar("R")
 
+# Seconds a session stays valid after logging in
+SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", str(14 * 24 * 60 * 60)))
+# Seconds the claims of a session are trusted before they are checked against
+# the user again, which bounds how long a revoked session keeps working
+SESSION_REVALIDATE_INTERVAL = int(os.getenv("SESSION_REVALIDATE_INTERVAL", "300"))
+
+
+def start_session(user: User):
+    """
+    Log a user in to the current session.
+    """
+    assert user.id is not None, "User ID will never be None here"
+    now = datetime.now(timezone.utc)
+    claims = SessionClaims(
+        user_id=user.id,
+        username=user.username,
+        major=user.major,
+        credential_version=user.credential_version,
+        expires_at=now + timedelta(seconds=SESSION_LIFETIME),
+        checked_at=now,
+    )
+    session["username"] = user.username
+    session["claims"] = claims.model_dump(mode="json")
+
+
+def end_session():
+    """
+    Log the user out of the current session.
+    """
+    session.pop("username", None)
+    session.pop("claims", None)
+
+
+def get_session_claims():
+    """
+    Return the claims of the user logged in to the current session, or None if
+    there is none.
+
+    The claims come from the session cookie without any database query. Once
+    every `SESSION_REVALIDATE_INTERVAL` seconds they are checked against the
+    user, and the session ends if the user was deleted or changed its password.
+    """
+    data = session.get("claims")
+    if data is None:
+        # Sessions started before claims were introduced only hold a username
+        username = session.get("username")
+        user = get_cached_user_by_username(username) if username else None
+        if not user:
+            return None
+        start_session(user)
+        data = session["claims"]
+
+    try:
+        claims = SessionClaims.model_validate(data)
+    except ValidationError:
+        end_session()
+        return None
+
+    now = datetime.now(timezone.utc)
+    if claims.expires_at <= now:
+        end_session()
+        return None
+
+    if now - claims.checked_at >= timedelta(seconds=SESSION_REVALIDATE_INTERVAL):
+        credentials = get_user_credentials(claims.user_id)
+        if (
+            not credentials
+            or credentials["credential_version"] != claims.credential_version
+        ):
+            end_session()
+            return None
+        claims.username = credentials["username"]
+        claims.major = credentials["major"]
+        claims.checked_at = now
+        session["username"] = claims.username
+        session["claims"] = claims.model_dump(mode="json")
+    return claims
+
+
+def _get_claims_user(claims: SessionClaims):
+    user = get_cached_user_by_username(claims.username)
+    if not user or user.id != claims.user_id:
+        return None
+    # The user may be more recent than claims awaiting revalidation
+    if user.credential_version != claims.credential_version:
+        end_session()
+        return None
+    return user
+
+
+def get_session_user():
+    """
+    Return the user logged in to the current session, or None if there is none.
+    """
+    claims = get_session_claims()
+    return _get_claims_user(claims) if claims else None
+
 
 def auth_guard(func: Callable[P, R]) -> Callable[P, R]:
     """
     Decorator to check if the user is logged in before executing the route function.
 
-    use `user` in the function parameters to access the user object.
+    use `user` in the function parameters to access the user object, or `claims`
+    to access the session claims, which does not query the database.
 
-    Warning: `user` variable from this decorator will overwrite path parameter `user` if it exists.
+    Warning: `user` and `claims` variables from this decorator will overwrite path
+    parameters of the same name if they exist.
     """
-    # Check if the function has a parameter named "user"
-    # If it does, we will pass the user object to that parameter
+    # Check if the function has a parameter named "user" or "claims"
+    # If it does, we will pass the user object or claims to that parameter
     has_user = "user" in func.__annotations__
+    has_claims = "claims" in func.__annotations__
 
     @wraps(func)
     def wrapper(*args: P.args, **kwargs: P.kwargs):
-        username = session.get("username")
-        user = get_user_by_username(username=username) if username else None
-        if not user:
+        claims = get_session_claims()
+        user = _get_claims_user(claims) if claims and has_user else None
+        if not claims or (has_user and not user):
             raise Unauthorized()
         if has_user:
             kwargs["user"] = user
+        if has_claims:
+            kwargs["claims"] = claims
         return func(*args, **kwargs)
 
     return wrapper
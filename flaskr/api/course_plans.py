@@ -1,26 +1,37 @@
-from flask import Blueprint
+from datetime import datetime, timezone
+
+from flask import Blueprint, request
 from flask_pydantic import validate  # type: ignore
 
 from flaskr.api.auth_guard import auth_guard
-from flaskr.api.exceptions import InternalError, NotFound
+from flaskr.api.exceptions import BadRequest, InternalError, NotFound
+from flaskr.api.hydrate import hydrate_semester_plans, parse_hydrate
 from flaskr.api.reqmodels import (
     CoursePlanCreateRequestModel,
     CoursePlanUpdateRequestModel,
 )
 from flaskr.api.respmodels import (
     CoursePlanResponseModel,
+    CoursePlanSyncData,
+    CoursePlanSyncResponseModel,
     CoursePlanWithSemestersData,
     CoursePlanWithSemestersResponseModel,
 )
 from flaskr.db.course_plans import (
+    clone_course_plan,
     create_course_plan,
     delete_course_plan,
     get_all_course_plans,
-    get_course_plan,
+    get_course_plan_changes,
+    get_course_plan_with_semesters,
     update_course_plan,
 )
-from flaskr.db.models import CoursePlanRead, CoursePlanUpdate, SemesterPlanRead, User
-from flaskr.db.semester_plans import get_semester_plans_by_course_plan
+from flaskr.db.models import (
+    CoursePlanRead,
+    CoursePlanUpdate,
+    SemesterPlanRead,
+    SessionClaims,
+)
 from flaskr.utils import PydanticObjectId
 
 route = Blueprint("course-plans", __name__, url_prefix="/course-plans")
@@ -29,30 +40,62 @@ route = Blueprint("course-plans", __name__, url_prefix="/course-plans")
 @route.route("/", methods=["GET"])
 @auth_guard
 @validate(response_by_alias=True)
-def read_all(user: User):
-    assert user.id is not None, "User ID will never be None here"
+def read_all(claims: SessionClaims):
+    """
+    Return all course plans of the user, or with `since`, an ISO 8601 time
+    taken from `synced_at` of the previous sync, the course plans changed
+    since then and the IDs of the deleted ones.
+
+    If the deletions since then are no longer known, `full_sync` is set and
+    all course plans are returned, replacing the ones of the client.
+    """
+    if "since" in request.args:
+        try:
+            since = datetime.fromisoformat(request.args["since"])
+        except ValueError:
+            raise BadRequest(debug_info="Invalid since value (should be ISO 8601).")
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        synced_at, full_sync, course_plans, deleted = get_course_plan_changes(
+            claims.user_id, since
+        )
+        return (
+            CoursePlanSyncResponseModel(
+                data=CoursePlanSyncData(
+                    synced_at=synced_at,
+                    full_sync=full_sync,
+                    course_plans=[
+                        CoursePlanRead.model_validate(plan.model_dump())
+                        for plan in course_plans
+                    ],
+                    deleted=deleted,
+                )
+            ),
+            200,
+        )
+
     res = [
         CoursePlanRead.model_validate(plan.model_dump())
-        for plan in get_all_course_plans(user.id)
+        for plan in get_all_course_plans(claims.user_id)
     ]
     return CoursePlanResponseModel(data=res), 200
 
 
 @route.route("/<course_plan_id>", methods=["GET"])
 @auth_guard
-@validate(response_by_alias=True)
-def read_one(course_plan_id: PydanticObjectId, user: User):
-    assert user.id is not None, "User ID will never be None here"
-    course_plan = get_course_plan(course_plan_id, user.id)
-    if not course_plan:
+@validate(response_by_alias=True, exclude_none=True)
+def read_one(course_plan_id: PydanticObjectId, claims: SessionClaims):
+    hydrate = parse_hydrate()
+    res = get_course_plan_with_semesters(course_plan_id, claims.user_id)
+    if not res:
         raise NotFound(debug_info="Course plan not found")
+    course_plan, semester_plans = res
     course_plan_read = CoursePlanRead.model_validate(course_plan.model_dump())
-
-    assert course_plan_read.id is not None, "Course plan ID will never be None here"
-    semester_plans = get_semester_plans_by_course_plan(course_plan_read.id)
     semester_plans_read = [
         SemesterPlanRead.model_validate(sp.model_dump()) for sp in semester_plans
     ]
+    if hydrate:
+        hydrate_semester_plans(semester_plans_read, hydrate)
     return (
         CoursePlanWithSemestersResponseModel(
             data=CoursePlanWithSemestersData(
@@ -67,10 +110,9 @@ def read_one(course_plan_id: PydanticObjectId, user: User):
 @route.route("/", methods=["POST"])
 @auth_guard
 @validate(response_by_alias=True)
-def create(body: CoursePlanCreateRequestModel, user: User):
-    assert user.id is not None, "User ID will never be None here"
+def create(body: CoursePlanCreateRequestModel, claims: SessionClaims):
     res = create_course_plan(
-        description=body.description, name=body.name, user_id=user.id
+        description=body.description, name=body.name, user_id=claims.user_id
     )
     if not res:
         raise InternalError(debug_info="Unexpected Error: Course plan not created")
@@ -81,19 +123,42 @@ def create(body: CoursePlanCreateRequestModel, user: User):
     )
 
 
+@route.route("/<course_plan_id>/clone", methods=["POST"])
+@auth_guard
+@validate(response_by_alias=True)
+def clone(course_plan_id: PydanticObjectId, claims: SessionClaims):
+    res = clone_course_plan(course_plan_id, claims.user_id)
+    if not res:
+        raise NotFound(debug_info="Course plan not found")
+    course_plan, semester_plans = res
+    return (
+        CoursePlanWithSemestersResponseModel(
+            data=CoursePlanWithSemestersData(
+                course_plan=CoursePlanRead.model_validate(course_plan.model_dump()),
+                semester_plans=[
+                    SemesterPlanRead.model_validate(sp.model_dump())
+                    for sp in semester_plans
+                ],
+            ),
+        ),
+        200,
+    )
+
+
 @route.route("/<course_plan_id>", methods=["PATCH"])
 @auth_guard
 @validate(response_by_alias=True)
 def update(
-    course_plan_id: PydanticObjectId, body: CoursePlanUpdateRequestModel, user: User
+    course_plan_id: PydanticObjectId,
+    body: CoursePlanUpdateRequestModel,
+    claims: SessionClaims,
 ):
-    assert user.id is not None, "User ID will never be None here"
     res = update_course_plan(
         course_plan_id=course_plan_id,
         course_plan_update=CoursePlanUpdate.model_validate(
             body.model_dump(exclude_none=True)
         ),
-        user_id=user.id,
+        user_id=claims.user_id,
     )
     if not res:
         raise NotFound(debug_info="Course plan not found")
@@ -104,9 +169,8 @@ def update(
 @route.route("/<course_plan_id>", methods=["DELETE"])
 @auth_guard
 @validate(response_by_alias=True)
-def delete(course_plan_id: PydanticObjectId, user: User):
-    assert user.id is not None, "User ID will never be None here"
-    res = delete_course_plan(course_plan_id=course_plan_id, user_id=user.id)
+def delete(course_plan_id: PydanticObjectId, claims: SessionClaims):
+    res = delete_course_plan(course_plan_id=course_plan_id, user_id=claims.user_id)
     if not res:
         raise NotFound(debug_info="Course plan not found")
     return CoursePlanResponseModel(), 200
@@ -1,52 +1,61 @@
-from flask import Blueprint, request
+import gzip
+import os
+import re
+from hashlib import sha256
+from threading import Thread
+
+from flask import Blueprint, Response, current_app, request, send_file, url_for
 from flask_pydantic import validate  # type: ignore
 
-from flaskr.api.exceptions import BadRequest
-from flaskr.api.respmodels import CoursesResponseModel
-from flaskr.db.courses import get_all_courses, get_courses
+from flaskr.api.args import parse_flag
+from flaskr.api.auth_guard import get_session_claims
+from flaskr.api.exceptions import BadRequest, MethodNotAllowed, NotFound, Unauthorized
+from flaskr.api.respmodels import (
+    CourseChangesData,
+    CourseChangesResponseModel,
+    CourseOriginalResponseModel,
+    CourseResponseModel,
+    CourseShardsData,
+    CourseShardsResponseModel,
+    CoursesResponseModel,
+    ResponseModel,
+)
+from flaskr.db.course_related import RELATED_COURSES_COUNT
+from flaskr.db.course_shards import get_course_shard_index, get_course_shard_path
+from flaskr.db.courses import (
+    filter_courses,
+    get_all_courses,
+    get_course,
+    get_course_changes,
+    get_course_original,
+    get_courses,
+    get_related_courses,
+)
+from flaskr.db.database import reload_course_data
 from flaskr.db.models import Course
 
 route = Blueprint("courses", __name__, url_prefix="/courses")
 
+# Seconds clients may cache a single course before revalidating with its ETag
+COURSE_MAX_AGE = 24 * 60 * 60
+# Seconds clients may cache the department shard index
+COURSE_SHARD_INDEX_MAX_AGE = 5 * 60
+# Shard URLs change with their content, so shards never need revalidation
+COURSE_SHARD_MAX_AGE = 365 * 24 * 60 * 60
+# e.g. "CSCI.0123456789abcdef.json.gz"
+COURSE_SHARD_FILENAME_REGEX = re.compile(r"^([A-Z]{4})\.([0-9a-f]{16})\.json\.gz$")
 
-@route.route("/", methods=["GET"])
-@validate(response_by_alias=True, exclude_none=True)
-def courses():
-    keywords = request.args.getlist("keywords[]")
+
+def _parse_projection():
+    """
+    Build the course projection from the `basic` flag and the `includes[]` or
+    `excludes[]` query arguments.
+    """
     excludes = request.args.getlist("excludes[]")
     includes = request.args.getlist("includes[]")
-    page = request.args.get("page", default="1")
-    limit = request.args.get("limit", default="100")
 
     # A flag for frontend developers' convenience sake
-    basic = request.args.get("basic")
-    if basic and basic.lower() not in ["true", "false"]:
-        raise BadRequest(
-            debug_info="Basic flag can only be a boolean value (true or false)."
-        )
-    else:
-        basic = bool(basic)
-
-    # A flag for comparing course code only
-    strict = request.args.get("strict")
-    if strict and strict.lower() not in ["true", "false"]:
-        raise BadRequest(
-            debug_info="Strict flag can only be a boolean value (true or false)."
-        )
-    else:
-        strict = bool(strict)
-
-    # Verify limit value
-    if not limit.isdigit() or not page.isdigit():
-        raise BadRequest(
-            debug_info="Invalid limit or page value (should be a positive 8-byte integer)."
-        )
-    else:
-        limit, page = int(limit), int(page)
-
-    # Verify page * limit - 1 value
-    if not (0 < page < 2**31) or not (0 < limit < 2**31):
-        raise BadRequest(debug_info="Invalid page and/or limit value.")
+    basic = parse_flag("basic")
 
     # Includes and excludes list cannot exist together due to potential conflict
     if includes and excludes:
@@ -79,15 +88,235 @@ def courses():
     # Must return ID for pagination
     if projection:
         projection["_id"] = True
+    return projection
+
+
+@route.route("/", methods=["GET"])
+@validate(response_by_alias=True, exclude_none=True)
+def courses():
+    keywords = request.args.getlist("keywords[]")
+    # Field-qualified query, e.g. "dept:CSCI units:>=3 operating systems"
+    q = request.args.get("q")
+    page = request.args.get("page", default="1")
+    limit = request.args.get("limit", default="100")
+
+    projection = _parse_projection()
+
+    # A flag for comparing course code only
+    strict = parse_flag("strict")
+
+    # Verify limit value
+    if not limit.isdigit() or not page.isdigit():
+        raise BadRequest(
+            debug_info="Invalid limit or page value (should be a positive 8-byte integer)."
+        )
+    else:
+        limit, page = int(limit), int(page)
+
+    # Verify page * limit - 1 value
+    if not (0 < page < 2**31) or not (0 < limit < 2**31):
+        raise BadRequest(debug_info="Invalid page and/or limit value.")
+
+    if q is not None and keywords:
+        raise BadRequest(
+            debug_info="You cannot use both q and keywords argument at the same time."
+        )
 
-    courses = None
-    if not keywords:
-        courses = get_all_courses(projection, page, limit)
+    # A flag for leaving out the courses not open to the major of the user
+    major = None
+    if parse_flag("for_me"):
+        claims = get_session_claims()
+        if not claims:
+            raise Unauthorized(debug_info="Log in to filter courses by your major.")
+        major = claims.major
+
+    # A flag for adding match spans and a description snippet to search results
+    highlight = parse_flag("highlight")
+
+    courses, degraded = None, False
+    if q is not None:
+        try:
+            courses, degraded = filter_courses(
+                q, projection, page, limit, major, highlight
+            )
+        except ValueError as e:
+            raise BadRequest(debug_info=f"Invalid query: {e}")
+    elif not keywords:
+        courses = get_all_courses(projection, page, limit, major)
     else:
-        courses = get_courses(keywords, projection, page, limit, strict)
+        courses, degraded = get_courses(
+            keywords, projection, page, limit, strict, major, highlight
+        )
 
     return CoursesResponseModel.model_validate(
         {
             "data": courses,
+            "degraded": degraded or None,
         }
     )
+
+
+@route.route("/changes", methods=["GET"])
+@validate(response_by_alias=True, exclude_none=True)
+def changes():
+    """
+    Return the courses added, changed or removed after catalog version `since`.
+
+    If the changes cannot be reconstructed from the recorded history,
+    `full_sync` is set and the client should fetch the whole catalog again.
+    """
+    since = request.args.get("since", default="")
+    if not since.isdigit():
+        raise BadRequest(
+            debug_info="Invalid since value (should be a non-negative integer)."
+        )
+
+    version, full_sync, course_changes = get_course_changes(int(since))
+    return CourseChangesResponseModel(
+        data=CourseChangesData(
+            version=version, full_sync=full_sync, changes=course_changes
+        )
+    )
+
+
+@route.route("/shards", methods=["GET"])
+@validate(response_by_alias=True)
+def shards():
+    """
+    Return the URL of the course shard of every department.
+
+    A shard holds all courses of a department as precompressed JSON. Its URL
+    contains a digest of its content, so it can be cached forever by clients
+    and proxies, while this index is only cached briefly.
+    """
+    catalog_version, shard_index = get_course_shard_index()
+    shard_urls = {
+        department: url_for(".shard", filename=f"{department}.{digest}.json.gz")
+        for department, digest in sorted(shard_index.items())
+    }
+    headers = {"Cache-Control": f"public, max-age={COURSE_SHARD_INDEX_MAX_AGE}"}
+    return (
+        CourseShardsResponseModel(
+            data=CourseShardsData(version=catalog_version, shards=shard_urls)
+        ),
+        200,
+        headers,
+    )
+
+
+@route.route("/shards/<filename>", methods=["GET"])
+def shard(filename: str):
+    """
+    Serve a gzip-compressed department shard straight from the disk.
+
+    Shards are written to the `course_shards` folder of the instance path on
+    first use, a reverse proxy may serve that folder directly instead.
+    """
+    match = COURSE_SHARD_FILENAME_REGEX.match(filename)
+    path = (
+        get_course_shard_path(
+            match[1],
+            match[2],
+            os.path.join(current_app.instance_path, "course_shards"),
+        )
+        if match
+        else None
+    )
+    if not path:
+        raise NotFound(debug_info="Course shard not found")
+
+    if request.accept_encodings["gzip"]:
+        response = send_file(path, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+        # The file name would suggest a download of the compressed file
+        del response.headers["Content-Disposition"]
+    else:
+        with open(path, "rb") as f:
+            response = Response(gzip.decompress(f.read()), mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = (
+        f"public, max-age={COURSE_SHARD_MAX_AGE}, immutable"
+    )
+    return response
+
+
+@route.route("/<code>", methods=["GET"])
+@validate(response_by_alias=True, exclude_none=True)
+def course(code: str):
+    """
+    Return a single course by its exact code.
+
+    Accepts the same `basic`, `includes[]` and `excludes[]` arguments as the
+    course listing. Responses are tagged with the catalog version so clients
+    can revalidate cheaply.
+    """
+    projection = _parse_projection()
+    course, version_tag = get_course(code.upper(), projection)
+    if not course:
+        raise NotFound(debug_info="Course not found")
+
+    if not version_tag:
+        return CourseResponseModel.model_validate({"data": course})
+
+    etag = sha256(
+        "{version_tag}:{code}:{projection}".format(
+            version_tag=version_tag, code=course["code"], projection=sorted(projection)
+        ).encode()
+    ).hexdigest()
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={COURSE_MAX_AGE}",
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return CourseResponseModel.model_validate({"data": course}), 200, headers
+
+
+@route.route("/<code>/original", methods=["GET"])
+@validate(response_by_alias=True)
+def original(code: str):
+    """
+    Return the original source text of a course, which is not part of course listings.
+    """
+    course_original = get_course_original(code.upper())
+    if not course_original:
+        raise NotFound(debug_info="Course not found")
+    return CourseOriginalResponseModel(data=course_original)
+
+
+@route.route("/<code>/related", methods=["GET"])
+@validate(response_by_alias=True, exclude_none=True)
+def related(code: str):
+    """
+    Return the courses most similar to a course by title and description.
+
+    Accepts the same `basic`, `includes[]` and `excludes[]` arguments as the
+    course listing, and a `limit` of at most `RELATED_COURSES_COUNT` courses.
+    """
+    projection = _parse_projection()
+    limit = request.args.get("limit", default="10")
+    if not limit.isdigit() or not 0 < int(limit) <= RELATED_COURSES_COUNT:
+        raise BadRequest(
+            debug_info=f"Invalid limit value (should be between 1 and {RELATED_COURSES_COUNT})."
+        )
+
+    courses = get_related_courses(code.upper(), projection, int(limit))
+    if courses is None:
+        raise NotFound(debug_info="Course not found")
+    return CoursesResponseModel.model_validate({"data": courses})
+
+
+@route.route("/reload", methods=["POST"])
+@validate()
+def reload():
+    """
+    Ingest the course data file again in the background if its version is newer.
+
+    Every worker swaps to the new catalog on its next version check.
+    """
+    if request.remote_addr == "127.0.0.1":
+        Thread(target=reload_course_data, daemon=True).start()
+        return ResponseModel(), 202
+    raise MethodNotAllowed(
+        debug_info="User attempt to access course reload endpoint from a remote address"
+    )
@@ -0,0 +1,50 @@
+from flask import request
+
+from flaskr.api.exceptions import BadRequest
+from flaskr.db.courses import get_courses_by_codes
+from flaskr.db.models import Course, CourseRead, SemesterPlanRead
+
+# Course fields embedded in semester plans for every `hydrate` argument value
+HYDRATE_COURSE_FIELDS = {
+    "basic": ["code", "title", "units"],
+    "full": list(Course.model_fields),
+}
+
+
+def parse_hydrate():
+    """
+    Parse the optional `hydrate` query argument, either "basic" or "full".
+    """
+    hydrate = request.args.get("hydrate")
+    if hydrate is not None and hydrate not in HYDRATE_COURSE_FIELDS:
+        raise BadRequest(debug_info="Hydrate can only be basic or full.")
+    return hydrate
+
+
+def get_course_details(codes: list[str], hydrate: str):
+    """
+    Fetch the courses with the given codes, limited to the fields of the
+    `hydrate` argument value. Unknown codes are left out.
+    """
+    projection = {
+        field: False
+        for field in Course.model_fields
+        if field not in HYDRATE_COURSE_FIELDS[hydrate]
+    }
+    return [
+        CourseRead.model_validate(course)
+        for course in get_courses_by_codes(codes, projection)
+    ]
+
+
+def hydrate_semester_plans(semester_plans: list[SemesterPlanRead], hydrate: str):
+    """
+    Embed the courses of semester plans as `course_details`, resolving the
+    codes of all the plans at once. Unknown codes are left out.
+    """
+    codes = [code for semester_plan in semester_plans for code in semester_plan.courses]
+    courses = {course.code: course for course in get_course_details(codes, hydrate)}
+    for semester_plan in semester_plans:
+        semester_plan.course_details = [
+            courses[code] for code in semester_plan.courses if code in courses
+        ]
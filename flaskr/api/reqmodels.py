@@ -2,18 +2,23 @@ import re
 from typing import Optional
 
 # from flask_pydantic import ValidationError
-from pydantic import BaseModel, ValidationError, field_validator
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from pydantic_core import PydanticCustomError
 
 from flaskr.db.models import (
+    COURSE_CODE_PATTERN,
     CoursePlanCreate,
     SemesterPlanCreate,
+    SemesterPlanOperation,
     SemesterPlanUpdate,
     UserCreate,
 )
+from flaskr.utils import PydanticObjectId
 
 USERNAME_REGEX = re.compile(r"^[a-zA-Z0-9_]{5,20}$")
 NAME_REGEX = re.compile(r"^[a-zA-Z]{2,20}$")
+# Maximum number of operations in a semester plan batch
+SEMESTER_PLAN_BATCH_LIMIT = 100
 
 
 class UserNameValidator(BaseModel):
@@ -83,6 +88,33 @@ class SemesterPlanUpdateRequestModel(SemesterPlanUpdate, BaseModel):
     """
 
 
+class SemesterPlanCourseRequestModel(BaseModel):
+    """
+    Model for adding a course to a semester plan.
+    """
+
+    code: str = Field(pattern=COURSE_CODE_PATTERN)
+
+
+class SemesterPlanCourseMoveRequestModel(BaseModel):
+    """
+    Model for moving a course to another semester plan of the same course plan.
+    """
+
+    target_semester_plan_id: PydanticObjectId
+
+
+class SemesterPlanBatchRequestModel(BaseModel):
+    """
+    Model for a batch of operations on the semester plans of a course plan.
+    """
+
+    course_plan_id: PydanticObjectId
+    operations: list[SemesterPlanOperation] = Field(
+        min_length=1, max_length=SEMESTER_PLAN_BATCH_LIMIT
+    )
+
+
 class UserForgotPasswordModel(BaseModel):
     email: str
 
@@ -1,9 +1,19 @@
-from typing import Any, List, Literal, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, computed_field
 
 from flaskr.api.exceptions import APIExceptions
-from flaskr.db.models import CoursePlanRead, CourseRead, SemesterPlanRead, UserRead
+from flaskr.db.models import (
+    CourseChange,
+    CourseOriginal,
+    CoursePlanRead,
+    CourseRead,
+    SemesterPlanOperationResult,
+    SemesterPlanRead,
+    UserRead,
+)
+from flaskr.utils import PydanticObjectId
 
 
 class ResponseModel(BaseModel):
@@ -29,6 +39,35 @@ class HealthResponseModel(ResponseModel):
 
 class CoursesResponseModel(ResponseModel):
     data: list[CourseRead] | None = None
+    # Set when the search ran out of time and only matched course codes
+    degraded: bool | None = None
+
+
+class CourseResponseModel(ResponseModel):
+    data: CourseRead | None = None
+
+
+class CourseOriginalResponseModel(ResponseModel):
+    data: CourseOriginal | None = None
+
+
+class CourseChangesData(BaseModel):
+    version: int | None
+    full_sync: bool
+    changes: List[CourseChange]
+
+
+class CourseChangesResponseModel(ResponseModel):
+    data: CourseChangesData | None = None
+
+
+class CourseShardsData(BaseModel):
+    version: int | None
+    shards: Dict[str, str]
+
+
+class CourseShardsResponseModel(ResponseModel):
+    data: CourseShardsData | None = None
 
 
 class UserResponseModel(ResponseModel):
@@ -39,10 +78,35 @@ class SemesterPlanResponseModel(ResponseModel):
     data: SemesterPlanRead | None = None
 
 
+class SemesterPlanMoveData(BaseModel):
+    source: SemesterPlanRead
+    target: SemesterPlanRead
+
+
+class SemesterPlanMoveResponseModel(ResponseModel):
+    data: SemesterPlanMoveData | None = None
+
+
+class SemesterPlanBatchResponseModel(ResponseModel):
+    data: List[SemesterPlanOperationResult] | None = None
+
+
 class CoursePlanResponseModel(ResponseModel):
     data: CoursePlanRead | list[CoursePlanRead] | None = None
 
 
+class CoursePlanSyncData(BaseModel):
+    # Time to pass as `since` in the next sync
+    synced_at: datetime
+    full_sync: bool
+    course_plans: List[CoursePlanRead]
+    deleted: List[PydanticObjectId]
+
+
+class CoursePlanSyncResponseModel(ResponseModel):
+    data: CoursePlanSyncData | None = None
+
+
 class CoursePlanWithSemestersData(BaseModel):
     course_plan: CoursePlanRead
     semester_plans: List[SemesterPlanRead]
@@ -52,5 +116,16 @@ class CoursePlanWithSemestersResponseModel(ResponseModel):
     data: CoursePlanWithSemestersData | None = None
 
 
+class WorkspaceData(BaseModel):
+    user: UserRead
+    course_plans: List[CoursePlanWithSemestersData]
+    # Only with the `courses` flag
+    courses: List[CourseRead] | None = None
+
+
+class WorkspaceResponseModel(ResponseModel):
+    data: WorkspaceData | None = None
+
+
 class LicenseKeyResponseModel(ResponseModel):
     data: str
@@ -4,18 +4,31 @@ from flask import Blueprint
 from flask_pydantic import validate  # type: ignore
 
 from flaskr.api.auth_guard import auth_guard
-from flaskr.api.exceptions import DuplicateResource, NotFound
+from flaskr.api.exceptions import BadRequest, DuplicateResource, NotFound
+from flaskr.api.hydrate import hydrate_semester_plans, parse_hydrate
 from flaskr.api.reqmodels import (
+    SemesterPlanBatchRequestModel,
+    SemesterPlanCourseMoveRequestModel,
+    SemesterPlanCourseRequestModel,
     SemesterPlanCreateRequestModel,
     SemesterPlanUpdateRequestModel,
 )
-from flaskr.api.respmodels import SemesterPlanResponseModel
+from flaskr.api.respmodels import (
+    SemesterPlanBatchResponseModel,
+    SemesterPlanMoveData,
+    SemesterPlanMoveResponseModel,
+    SemesterPlanResponseModel,
+)
 from flaskr.db.course_plans import get_course_plan  # Corrected the import
-from flaskr.db.models import SemesterPlanRead, User
+from flaskr.db.models import CourseCode, SemesterPlanRead, SessionClaims
 from flaskr.db.semester_plans import (
+    add_semester_plan_course,
+    apply_semester_plan_operations,
     create_semester_plan,
     delete_semester_plan,
     get_semester_plan,
+    move_semester_plan_course,
+    remove_semester_plan_course,
     update_semester_plan,
 )
 from flaskr.utils import PydanticObjectId
@@ -25,36 +38,40 @@ route = Blueprint("semester_plans", __name__, url_prefix="/semester-plans")
 
 @route.route("/<semester_plan_id>", methods=["GET"])
 @auth_guard
-@validate(response_by_alias=True)
-def get_one_semester_plan(semester_plan_id: PydanticObjectId, user: User):
+@validate(response_by_alias=True, exclude_none=True)
+def get_one_semester_plan(semester_plan_id: PydanticObjectId, claims: SessionClaims):
     """
-    Return the SemesterPlan with the specified id.
+    Return the SemesterPlan with the specified id, with its courses embedded
+    if the `hydrate` argument is given.
     """
-    assert user.id is not None, "User ID will never be None here"
-    semester_plan = get_semester_plan(semester_plan_id)
-
-    # Ensure the semester plan exists or the course plan belongs to the user
-    if not semester_plan or not get_course_plan(semester_plan.course_plan_id, user.id):
+    hydrate = parse_hydrate()
+    # Ensure the semester plan exists and belongs to the user
+    semester_plan = get_semester_plan(semester_plan_id, claims.user_id)
+    if not semester_plan:
         raise NotFound(debug_info="Semester plan not found")
     semester_read = SemesterPlanRead.model_construct(**semester_plan.model_dump())
+    if hydrate:
+        hydrate_semester_plans([semester_read], hydrate)
     return SemesterPlanResponseModel(data=semester_read), 200
 
 
 @route.route("/", methods=["POST"])
 @auth_guard
 @validate(response_by_alias=True)
-def post_one_semester_plan(body: SemesterPlanCreateRequestModel, user: User):
+def post_one_semester_plan(body: SemesterPlanCreateRequestModel, claims: SessionClaims):
     """
     Create a SemesterPlan with the given parameters.
     """
-    assert user.id is not None, "User ID will never be None here"
     # Ensure the course plan exists and belongs to the user
-    course_plan = get_course_plan(body.course_plan_id, user.id)
+    course_plan = get_course_plan(body.course_plan_id, claims.user_id)
     if not course_plan:
         raise NotFound(debug_info="Course plan not found")
 
     semester_plan = create_semester_plan(
-        course_plan_id=body.course_plan_id, semester=body.semester, year=body.year
+        course_plan_id=body.course_plan_id,
+        semester=body.semester,
+        year=body.year,
+        user_id=claims.user_id,
     )
     if not semester_plan:
         raise DuplicateResource(debug_info="Semester plan with same semester and year already exists")
@@ -66,38 +83,109 @@ def post_one_semester_plan(body: SemesterPlanCreateRequestModel, user: User):
 @auth_guard
 @validate(response_by_alias=True)
 def patch_one_semester_plan(
-    semester_plan_id: PydanticObjectId, body: SemesterPlanUpdateRequestModel, user: User
+    semester_plan_id: PydanticObjectId,
+    body: SemesterPlanUpdateRequestModel,
+    claims: SessionClaims,
 ):
-    assert user.id is not None, "User ID will never be None here"
-    # Ensure the semester plan exists or the course plan belongs to the user
-    semester_plan = get_semester_plan(semester_plan_id)
-    if not semester_plan or not get_course_plan(semester_plan.course_plan_id, user.id):
+    # Ensure the semester plan exists and belongs to the user
+    updated_plan = update_semester_plan(semester_plan_id, body, claims.user_id)
+    if not updated_plan:
         raise NotFound(debug_info="Semester plan not found")
-
-    updated_plan = update_semester_plan(semester_plan_id, body)
-    semester_read = (
-        SemesterPlanRead.model_construct(**updated_plan.model_dump())
-        if updated_plan
-        else None
-    )
+    semester_read = SemesterPlanRead.model_construct(**updated_plan.model_dump())
     return SemesterPlanResponseModel(data=semester_read), 200
 
 
 @route.route("/<semester_plan_id>", methods=["DELETE"])
 @auth_guard
 @validate(response_by_alias=True)
-def delete_one_semester_plan(semester_plan_id: PydanticObjectId, user: User):
-    assert user.id is not None, "User ID will never be None here"
-    semester_plan = get_semester_plan(semester_plan_id)
-    # Ensure the semester plan exists or the course plan belongs to the user
-    if not semester_plan or not get_course_plan(semester_plan.course_plan_id, user.id):
+def delete_one_semester_plan(semester_plan_id: PydanticObjectId, claims: SessionClaims):
+    # Ensure the semester plan exists and belongs to the user
+    deleted_plan = delete_semester_plan(semester_plan_id, claims.user_id)
+    if not deleted_plan:
         raise NotFound(debug_info="Semester plan not found")
+    semester_read = SemesterPlanRead.model_construct(**deleted_plan.model_dump())
+
+    return SemesterPlanResponseModel(data=semester_read), 200
+
+
+@route.route("/<semester_plan_id>/courses", methods=["POST"])
+@auth_guard
+@validate(response_by_alias=True)
+def add_course(
+    semester_plan_id: PydanticObjectId,
+    body: SemesterPlanCourseRequestModel,
+    claims: SessionClaims,
+):
+    """
+    Add a course to the SemesterPlan with the specified id.
+    """
+    updated_plan = add_semester_plan_course(semester_plan_id, body.code, claims.user_id)
+    if not updated_plan:
+        raise NotFound(debug_info="Semester plan not found")
+    semester_read = SemesterPlanRead.model_construct(**updated_plan.model_dump())
+    return SemesterPlanResponseModel(data=semester_read), 200
 
-    deleted_plan = delete_semester_plan(semester_plan_id)
-    semester_read = (
-        SemesterPlanRead.model_construct(**deleted_plan.model_dump())
-        if deleted_plan
-        else None
-    )
 
+@route.route("/<semester_plan_id>/courses/<code>", methods=["DELETE"])
+@auth_guard
+@validate(response_by_alias=True)
+def remove_course(
+    semester_plan_id: PydanticObjectId, code: CourseCode, claims: SessionClaims
+):
+    """
+    Remove a course from the SemesterPlan with the specified id.
+    """
+    updated_plan = remove_semester_plan_course(semester_plan_id, code, claims.user_id)
+    if not updated_plan:
+        raise NotFound(debug_info="Semester plan not found")
+    semester_read = SemesterPlanRead.model_construct(**updated_plan.model_dump())
     return SemesterPlanResponseModel(data=semester_read), 200
+
+
+@route.route("/<semester_plan_id>/courses/<code>/move", methods=["POST"])
+@auth_guard
+@validate(response_by_alias=True)
+def move_course(
+    semester_plan_id: PydanticObjectId,
+    code: CourseCode,
+    body: SemesterPlanCourseMoveRequestModel,
+    claims: SessionClaims,
+):
+    """
+    Move a course from the SemesterPlan with the specified id to another one of
+    the same CoursePlan, returning both.
+    """
+    if body.target_semester_plan_id == semester_plan_id:
+        raise BadRequest(debug_info="Cannot move a course to the same semester plan")
+    res = move_semester_plan_course(
+        semester_plan_id, body.target_semester_plan_id, code, claims.user_id
+    )
+    if not res:
+        raise NotFound(debug_info="Course or target semester plan not found")
+    source, target = res
+    return (
+        SemesterPlanMoveResponseModel(
+            data=SemesterPlanMoveData(
+                source=SemesterPlanRead.model_construct(**source.model_dump()),
+                target=SemesterPlanRead.model_construct(**target.model_dump()),
+            )
+        ),
+        200,
+    )
+
+
+@route.route("/batch", methods=["POST"])
+@auth_guard
+@validate(response_by_alias=True, exclude_none=True)
+def batch(body: SemesterPlanBatchRequestModel, claims: SessionClaims):
+    """
+    Apply a list of create, update, delete, add_course and remove_course
+    operations to the SemesterPlans of a CoursePlan in order, returning the
+    result of every operation.
+    """
+    results = apply_semester_plan_operations(
+        body.course_plan_id, body.operations, claims.user_id
+    )
+    if results is None:
+        raise NotFound(debug_info="Course plan not found")
+    return SemesterPlanBatchResponseModel(data=results), 200
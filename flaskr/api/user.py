@@ -1,11 +1,11 @@
 from datetime import datetime
 
-from flask import Blueprint, session, request
+from flask import Blueprint, request
 from flask_pydantic import validate  # type: ignore
 
 from flaskr.api import email_service
 from flaskr.api.exceptions import DuplicateResource, MethodNotAllowed
-from flaskr.api.auth_guard import auth_guard
+from flaskr.api.auth_guard import auth_guard, end_session, start_session
 from flaskr.api.exceptions import (
     InternalError,
     InvalidCredentials,
@@ -74,7 +74,7 @@ def signup(body: UserCreateRequestModel):
         # this case cannot happen under normal circumstances
         raise InternalError(debug_info="Unexpected Error: User not created")
 
-    session["username"] = user.username
+    start_session(user)
     user_read = UserRead.model_validate(user.model_dump())
     return UserResponseModel(data=user_read), 201
 
@@ -101,9 +101,9 @@ def login(body: UserLoginRequestModel):
     user = get_user_by_username(username)
     if not user or not PasswordHasher.verify_password(user.password_hash, password):
         raise InvalidCredentials()
-    session["username"] = username
     user = update_user(username, UserUpdate(last_login=datetime.now()))
     assert user is not None, "User should be updated successfully."
+    start_session(user)
     user_read = UserRead.model_validate(user.model_dump())
     return UserResponseModel(data=user_read), 200
 
@@ -111,7 +111,7 @@ def login(body: UserLoginRequestModel):
 @route.route("/logout", methods=["POST"])
 @validate()
 def logout():
-    session.pop("username", None)
+    end_session()
     return ResponseModel(), 200
 
 
@@ -0,0 +1,62 @@
+from flask import Blueprint
+from flask_pydantic import validate  # type: ignore
+
+from flaskr.api.args import parse_flag
+from flaskr.api.auth_guard import auth_guard
+from flaskr.api.hydrate import get_course_details
+from flaskr.api.respmodels import (
+    CoursePlanWithSemestersData,
+    WorkspaceData,
+    WorkspaceResponseModel,
+)
+from flaskr.db.course_plans import get_all_course_plans_with_semesters
+from flaskr.db.models import CoursePlanRead, SemesterPlanRead, User, UserRead
+
+route = Blueprint("workspace", __name__, url_prefix="/workspace")
+
+
+@route.route("/", methods=["GET"])
+@auth_guard
+@validate(response_by_alias=True, exclude_none=True)
+def read(user: User):
+    """
+    Return everything the planner needs on load: the user, all their course
+    plans with their semester plans and, with the `courses` flag, the basic
+    information of every course in the semester plans.
+    """
+    with_courses = parse_flag("courses")
+
+    assert user.id is not None, "User ID will never be None here"
+    course_plans = get_all_course_plans_with_semesters(user.id)
+
+    courses = None
+    if with_courses:
+        codes = [
+            code
+            for _, semester_plans in course_plans
+            for semester_plan in semester_plans
+            for code in semester_plan.courses
+        ]
+        courses = get_course_details(codes, "basic")
+
+    return (
+        WorkspaceResponseModel(
+            data=WorkspaceData(
+                user=UserRead.model_validate(user.model_dump()),
+                course_plans=[
+                    CoursePlanWithSemestersData(
+                        course_plan=CoursePlanRead.model_validate(
+                            course_plan.model_dump()
+                        ),
+                        semester_plans=[
+                            SemesterPlanRead.model_validate(sp.model_dump())
+                            for sp in semester_plans
+                        ],
+                    )
+                    for course_plan, semester_plans in course_plans
+                ],
+                courses=courses,
+            )
+        ),
+        200,
+    )
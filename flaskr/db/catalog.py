@@ -0,0 +1,155 @@
+import os
+import threading
+from hashlib import sha256
+from time import monotonic
+from typing import Any, Callable, TypeVar
+
+from flaskr.db.database import JSON, get_db, get_db_logger
+from flaskr.utils import LRUCache
+
+# Seconds between two checks of the course version stored in the database
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "30"))
+# Number of course search results cached per catalog version
+COURSE_SEARCH_CACHE_SIZE = int(os.getenv("COURSE_SEARCH_CACHE_SIZE", "1024"))
+
+T = TypeVar("T")
+
+_catalog: "Catalog | None" = None
+_catalog_lock = threading.Lock()
+_catalog_listeners: list[Callable[["Catalog"], None]] = []
+
+
+class Catalog:
+    """
+    In-memory snapshot of one version of the course catalog.
+
+    A snapshot is never modified after it is built. When a new version is
+    ingested each worker builds a new snapshot and swaps the reference, so
+    requests already holding the old snapshot finish undisturbed and anything
+    derived from it is invalidated together.
+    """
+
+    def __init__(self, stamp: tuple[Any, ...], courses: list[JSON]):
+        self.stamp = stamp
+        self.version: int | None = stamp[0]
+        self.etag = sha256(repr(stamp).encode()).hexdigest()[:16]
+        self.courses = courses
+        self.by_code = {course["code"]: course for course in courses}
+        self.search_cache: LRUCache[Any, Any] = LRUCache(COURSE_SEARCH_CACHE_SIZE)
+        self.checked_at = monotonic()
+        self._derived: dict[str, Any] = {}
+        # Reentrant as derived data may be built from other derived data
+        self._derived_lock = threading.RLock()
+
+    def is_fresh(self):
+        return monotonic() - self.checked_at < CATALOG_CHECK_INTERVAL
+
+    def derive(self, name: str, build: Callable[["Catalog"], T]) -> T:
+        """
+        Return data derived from this snapshot, building it on first use.
+
+        :param name: the unique name of the derived data.
+        :param build: the function building the data from the snapshot.
+        """
+        with self._derived_lock:
+            if name not in self._derived:
+                self._derived[name] = build(self)
+            return self._derived[name]
+
+    @property
+    def courses_by_code(self) -> list[JSON]:
+        """
+        The courses sorted by code.
+        """
+        return self.derive(
+            "courses_by_code",
+            lambda catalog: sorted(catalog.courses, key=lambda course: course["code"]),
+        )
+
+
+def get_catalog_stamp() -> tuple[Any, ...]:
+    """
+    Return the version and ingestion time of the courses in the database.
+    """
+    config = get_db().config.find_one({"key": "course_version"}) or {}
+    return config.get("value"), config.get("ingested_at")
+
+
+def load_catalog(stamp: tuple[Any, ...]):
+    """
+    Build a catalog snapshot from the courses collection.
+
+    :param stamp: the catalog stamp the courses belong to.
+    :return: the new Catalog object.
+    """
+    start_time = monotonic()
+    courses = get_db().courses.find({}).sort({"_id": 1}).to_list()
+    catalog = Catalog(stamp, courses)
+    get_db_logger().info(
+        "Loaded course catalog version {version} with {count} courses using {exec_time:.3f}s".format(
+            version=catalog.version,
+            count=len(courses),
+            exec_time=monotonic() - start_time,
+        )
+    )
+    return catalog
+
+
+def get_catalog():
+    """
+    Return the current catalog snapshot of this worker.
+
+    The database version is checked at most once every `CATALOG_CHECK_INTERVAL`
+    seconds. While one thread rebuilds the snapshot, other threads keep serving
+    from the previous one instead of waiting.
+    """
+    global _catalog
+    catalog = _catalog
+    if catalog and catalog.is_fresh():
+        return catalog
+
+    if not _catalog_lock.acquire(blocking=catalog is None):
+        assert catalog is not None
+        return catalog
+    try:
+        catalog = _catalog
+        if catalog and catalog.is_fresh():
+            return catalog
+        stamp = get_catalog_stamp()
+        if catalog and catalog.stamp == stamp:
+            catalog.checked_at = monotonic()
+            return catalog
+        catalog = _catalog = load_catalog(stamp)
+    finally:
+        _catalog_lock.release()
+
+    for listener in _catalog_listeners:
+        listener(catalog)
+    return catalog
+
+
+def add_catalog_listener(listener: Callable[[Catalog], None]):
+    """
+    Register a function called with every new catalog snapshot of this worker.
+
+    Listeners run on the requesting thread and should hand off slow work. A
+    listener registered again is only called once.
+    """
+    if listener not in _catalog_listeners:
+        _catalog_listeners.append(listener)
+
+
+def expire_catalog():
+    """
+    Force the next `get_catalog` call of this worker to check the database version.
+    """
+    catalog = _catalog
+    if catalog:
+        catalog.checked_at = float("-inf")
+
+
+def project_course(course: JSON, projection: dict[str, bool]) -> JSON:
+    """
+    Apply an exclusion projection (as built by the courses API) to a catalog course.
+    """
+    return {key: value for key, value in course.items() if projection.get(key, True)}
@@ -0,0 +1,217 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, NamedTuple
+
+from flaskr.db.catalog import Catalog
+from flaskr.db.database import JSON
+
+# Weights of the course fields in the term frequencies of a course
+FIELD_WEIGHTS = {"code": 3.0, "title": 2.0, "description": 1.0}
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Characters of description shown around the first match in a snippet
+SNIPPET_LENGTH = 160
+
+# Course codes, Latin words and runs of CJK characters, in that order
+TOKEN_REGEX = re.compile(
+    r"(?P<code>\b[A-Za-z]{4}-?\d{4}\b)"
+    r"|(?P<word>[A-Za-z0-9]+(?:'[A-Za-z]+)?)"
+    r"|(?P<cjk>[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)"
+)
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be by for from in into is it its of on or that the this
+    to with
+    """.split()
+)
+VOWELS = frozenset("aeiou")
+
+
+class Token(NamedTuple):
+    term: str
+    start: int
+    end: int
+
+
+def _has_vowel(stem: str):
+    return any(c in VOWELS for c in stem)
+
+
+def stem(word: str):
+    """
+    Reduce an English word to its stem with the plural and tense rules of the
+    Porter stemmer (step 1), e.g. "programming" and "programmed" to "program".
+    """
+    if len(word) <= 3 or not word.isalpha():
+        return word
+
+    if word.endswith("sses") or word.endswith("ies"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss") and not word.endswith("us"):
+        word = word[:-1]
+
+    for suffix in ["ing", "ed"]:
+        if word.endswith(suffix) and _has_vowel(word[: -len(suffix)]):
+            word = word[: -len(suffix)]
+            if word.endswith(("at", "bl", "iz")):
+                word += "e"
+            elif (
+                len(word) > 2
+                and word[-1] == word[-2]
+                and word[-1] not in VOWELS
+                and word[-1] not in "lsz"
+            ):
+                word = word[:-1]
+            break
+
+    if word.endswith("y") and len(word) > 2 and _has_vowel(word[:-1]):
+        word = word[:-1] + "i"
+    return word
+
+
+def tokenize(text: str) -> list[Token]:
+    """
+    Split text into search terms with their character offsets.
+
+    - Course codes, also hyphenated, give the full code, the department and
+      the number, e.g. "CSCI-3100" gives "csci3100", "csci" and "3100"
+    - Latin words are lowercased and stemmed, stop words are dropped
+    - CJK text gives overlapping character bigrams, e.g. "程式設計" gives
+      "程式", "式設" and "設計"
+    """
+    tokens: list[Token] = []
+    for match in TOKEN_REGEX.finditer(text):
+        start, end = match.span()
+        if match["code"]:
+            code = match["code"].lower().replace("-", "")
+            tokens.append(Token(code, start, end))
+            tokens.append(Token(code[:4], start, start + 4))
+            tokens.append(Token(code[4:], end - 4, end))
+        elif match["word"]:
+            word = match["word"].lower()
+            if word not in STOP_WORDS:
+                tokens.append(Token(stem(word), start, end))
+        else:
+            run = match["cjk"]
+            if len(run) == 1:
+                tokens.append(Token(run, start, end))
+            for i in range(len(run) - 1):
+                tokens.append(Token(run[i : i + 2], start + i, start + i + 2))
+    return tokens
+
+
+class CourseIndex:
+    """
+    In-memory inverted index over the code, title and description of the
+    courses of a catalog snapshot, ranked with BM25.
+    """
+
+    def __init__(self, courses: list[JSON]):
+        self.courses = courses
+        self.positions = {course["code"]: i for i, course in enumerate(courses)}
+        self.postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self.lengths: list[float] = []
+        # Offsets of every term in every field of every course
+        self.offsets: list[dict[str, list[tuple[str, int, int]]]] = []
+        for position, course in enumerate(courses):
+            frequencies: Counter[str] = Counter()
+            offsets: dict[str, list[tuple[str, int, int]]] = defaultdict(list)
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(course.get(field, "")):
+                    frequencies[token.term] += weight
+                    offsets[token.term].append((field, token.start, token.end))
+            self.offsets.append(dict(offsets))
+            for term, frequency in frequencies.items():
+                self.postings[term][position] = frequency
+            self.lengths.append(sum(frequencies.values()))
+        self.average_length = sum(self.lengths) / len(self.lengths) if courses else 0
+
+    def search(self, text: str, positions: Iterable[int] | None = None):
+        """
+        Rank the courses matching any term of the text.
+
+        :param text: the search text.
+        :param positions: if given, only these course positions are ranked.
+        :return: a list of (score, position) pairs by decreasing score, then
+            by position.
+        """
+        allowed = set(positions) if positions is not None else None
+        scores: dict[int, float] = defaultdict(float)
+        n = len(self.courses)
+        for term in {token.term for token in tokenize(text)}:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                if allowed is not None and position not in allowed:
+                    continue
+                norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * self.lengths[position] / self.average_length
+                )
+                scores[position] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return sorted(
+            ((score, position) for position, score in scores.items()),
+            key=lambda pair: (-pair[0], pair[1]),
+        )
+
+    def highlight(self, code: str, text: str) -> JSON | None:
+        """
+        Locate the terms of the text in a course from the stored offsets.
+
+        :param code: the course code.
+        :param text: the search text.
+        :return: the sorted, merged `[start, end)` spans of every field with a
+            match, and a snippet of the description around its first match
+            with the spans relative to the snippet, or None if the course is
+            not indexed.
+        """
+        position = self.positions.get(code)
+        if position is None:
+            return None
+
+        course_offsets = self.offsets[position]
+        field_spans: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for term in {token.term for token in tokenize(text)}:
+            for field, start, end in course_offsets.get(term, []):
+                field_spans[field].append((start, end))
+        spans = {field: _merge_spans(field_spans[field]) for field in field_spans}
+
+        highlight: JSON = {"spans": spans}
+        description = self.courses[position].get("description", "")
+        if description:
+            first = spans["description"][0][0] if "description" in spans else 0
+            start = max(
+                0, min(first - SNIPPET_LENGTH // 4, len(description) - SNIPPET_LENGTH)
+            )
+            # Do not cut a word at the start of the snippet
+            space = description.find(" ", start, first) if start > 0 else -1
+            if space != -1:
+                start = space + 1
+            end = min(len(description), start + SNIPPET_LENGTH)
+            highlight["snippet"] = description[start:end]
+            highlight["snippet_spans"] = [
+                (span_start - start, min(span_end, end) - start)
+                for span_start, span_end in spans.get("description", [])
+                if start <= span_start < end
+            ]
+        return highlight
+
+
+def _merge_spans(spans: list[tuple[int, int]]):
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def get_course_index(catalog: Catalog) -> CourseIndex:
+    """
+    Return the search index of a catalog snapshot, building it on first use.
+    """
+    return catalog.derive("course_index", lambda catalog: CourseIndex(catalog.courses))
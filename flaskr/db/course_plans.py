@@ -1,10 +1,21 @@
-from datetime import datetime, timezone
+import os
+from datetime import datetime, timedelta, timezone
 
 from bson import ObjectId
 from pymongo import ReturnDocument
+from pymongo.client_session import ClientSession
 
-from flaskr.db.database import get_db
-from flaskr.db.models import CoursePlan, CoursePlanUpdate
+from flaskr.db.database import JSON, get_db, run_transaction
+from flaskr.db.models import CoursePlan, CoursePlanUpdate, SemesterPlan
+
+# Seconds deleted course plans are remembered for delta syncs, clients syncing
+# from further back have to fetch all their course plans again
+COURSE_PLAN_TOMBSTONE_TTL = int(
+    os.getenv("COURSE_PLAN_TOMBSTONE_TTL", str(30 * 24 * 60 * 60))
+)
+# Seconds the time handed to clients for their next sync is set back by, so
+# that writes in flight during a sync are picked up by the next one
+COURSE_PLAN_SYNC_OVERLAP = int(os.getenv("COURSE_PLAN_SYNC_OVERLAP", "5"))
 
 
 def get_all_course_plans(user_id: ObjectId) -> list[CoursePlan]:
@@ -19,6 +30,38 @@ def get_all_course_plans(user_id: ObjectId) -> list[CoursePlan]:
     return [CoursePlan.model_validate(doc) for doc in docs]
 
 
+def get_course_plan_changes(user_id: ObjectId, since: datetime):
+    """
+    Return the CoursePlans of specified user changed since the given time,
+    including changes to their semester plans, and the deleted ones.
+
+    If the deletions cannot be reconstructed as their tombstones expired, the
+    client has to replace its course plans with all of them.
+
+    :param user_id: the ID of the user whose CoursePlans are to be fetched.
+    :param since: the time the client last synced at.
+    :return: the time to sync from next, whether all CoursePlans are returned,
+        the changed CoursePlan objects and the IDs of the deleted CoursePlans.
+    """
+    now = datetime.now(timezone.utc)
+    synced_at = now - timedelta(seconds=COURSE_PLAN_SYNC_OVERLAP)
+    if since > now or since < now - timedelta(seconds=COURSE_PLAN_TOMBSTONE_TTL):
+        return synced_at, True, get_all_course_plans(user_id), []
+
+    db = get_db()
+    # Served by the (user_id, updated_at) index
+    docs = db.course_plans.find({"user_id": user_id, "updated_at": {"$gte": since}})
+    course_plans = [CoursePlan.model_validate(doc) for doc in docs]
+    deleted = [
+        doc["course_plan_id"]
+        for doc in db.course_plan_tombstones.find(
+            {"user_id": user_id, "deleted_at": {"$gte": since}},
+            projection={"_id": False, "course_plan_id": True},
+        )
+    ]
+    return synced_at, False, course_plans, deleted
+
+
 def get_course_plan(course_plan_id: ObjectId, user_id: ObjectId) -> CoursePlan | None:
     """
     Return CoursePlan of specified ID.
@@ -31,6 +74,65 @@ def get_course_plan(course_plan_id: ObjectId, user_id: ObjectId) -> CoursePlan |
     return CoursePlan.model_validate(doc) if doc else None
 
 
+def _find_course_plans_with_semesters(match: JSON):
+    course_plans_collection = get_db().course_plans
+    docs = course_plans_collection.aggregate(
+        [
+            {"$match": match},
+            # Served by the (course_plan_id, year, semester) index
+            {
+                "$lookup": {
+                    "from": "semester_plans",
+                    "localField": "_id",
+                    "foreignField": "course_plan_id",
+                    "pipeline": [{"$sort": {"year": 1, "semester": 1}}],
+                    "as": "semester_plans",
+                }
+            },
+        ]
+    ).to_list()
+    res: list[tuple[CoursePlan, list[SemesterPlan]]] = []
+    for doc in docs:
+        semester_plans = doc.pop("semester_plans")
+        res.append(
+            (
+                CoursePlan.model_validate(doc),
+                [SemesterPlan.model_validate(sp) for sp in semester_plans],
+            )
+        )
+    return res
+
+
+def get_course_plan_with_semesters(
+    course_plan_id: ObjectId, user_id: ObjectId
+) -> tuple[CoursePlan, list[SemesterPlan]] | None:
+    """
+    Return CoursePlan of specified ID together with its SemesterPlans, in one
+    aggregation.
+
+    :param course_plan_id: the ID of the target CoursePlan.
+    :param user_id: the ID of the user who owns the course plan.
+    :return: the CoursePlan object and its SemesterPlan objects sorted by year
+        and semester, or None if not found.
+    """
+    res = _find_course_plans_with_semesters({"_id": course_plan_id, "user_id": user_id})
+    return res[0] if res else None
+
+
+def get_all_course_plans_with_semesters(
+    user_id: ObjectId,
+) -> list[tuple[CoursePlan, list[SemesterPlan]]]:
+    """
+    Return all CoursePlans of specified user together with their SemesterPlans,
+    in one aggregation.
+
+    :param user_id: the ID of the user whose CoursePlans are to be fetched.
+    :return: a list of CoursePlan objects, each with its SemesterPlan objects
+        sorted by year and semester.
+    """
+    return _find_course_plans_with_semesters({"user_id": user_id})
+
+
 def create_course_plan(
     description: str, name: str, user_id: ObjectId
 ) -> CoursePlan | None:
@@ -63,6 +165,61 @@ def create_course_plan(
     return CoursePlan.model_validate(doc) if doc else None
 
 
+def clone_course_plan(
+    course_plan_id: ObjectId, user_id: ObjectId
+) -> tuple[CoursePlan, list[SemesterPlan]] | None:
+    """
+    Copy CoursePlan of specified ID and all its SemesterPlans into a new
+    CoursePlan named after it, in a transaction where supported.
+
+    :param course_plan_id: the ID of the CoursePlan to copy.
+    :param user_id: the ID of the user who owns the course plan.
+    :return: the new CoursePlan object and its SemesterPlan objects sorted by
+        year and semester, or None if not found.
+    """
+    res = get_course_plan_with_semesters(course_plan_id, user_id)
+    if not res:
+        return None
+    course_plan, semester_plans = res
+
+    now = datetime.now(tz=timezone.utc)
+    # Dates are stored with millisecond precision, return them as stored
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    new_course_plan = CoursePlan(
+        _id=ObjectId(),
+        description=course_plan.description,
+        name=f"{course_plan.name} (copy)",
+        user_id=user_id,
+        updated_at=now,
+        favourite=False,
+    )
+    new_semester_plans = [
+        SemesterPlan(
+            _id=ObjectId(),
+            course_plan_id=new_course_plan.id,
+            courses=semester_plan.courses,
+            semester=semester_plan.semester,
+            year=semester_plan.year,
+            created_at=now,
+            user_id=user_id,
+        )
+        for semester_plan in semester_plans
+    ]
+
+    db = get_db()
+
+    def insert(session: ClientSession | None):
+        db.course_plans.insert_one(new_course_plan.model_dump(), session=session)
+        if new_semester_plans:
+            db.semester_plans.insert_many(
+                [semester_plan.model_dump() for semester_plan in new_semester_plans],
+                session=session,
+            )
+
+    run_transaction(insert)
+    return new_course_plan, new_semester_plans
+
+
 def update_course_plan(
     course_plan_id: ObjectId, course_plan_update: CoursePlanUpdate, user_id: ObjectId
 ) -> CoursePlan | None:
@@ -104,5 +261,17 @@ def delete_course_plan(course_plan_id: ObjectId, user_id: ObjectId):
         semester_plans_collection.delete_many({"course_plan_id": course_plan_id})
         # Delete the course plan
         doc = course_plans_collection.find_one_and_delete({"_id": course_plan_id})
-        return CoursePlan.model_validate(doc) if doc else None
+        if not doc:
+            return None
+        # Remembered for the delta syncs of other clients of the user
+        now = datetime.now(timezone.utc)
+        db.course_plan_tombstones.insert_one(
+            {
+                "course_plan_id": course_plan_id,
+                "user_id": user_id,
+                "deleted_at": now,
+                "expires_at": now + timedelta(seconds=COURSE_PLAN_TOMBSTONE_TTL),
+            }
+        )
+        return CoursePlan.model_validate(doc)
     return None
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from time import sleep
+
+from pymongo import UpdateOne
+
+from flaskr.db.database import JSON, get_db, get_db_logger
+
+# Fraction of course searches recorded for popularity statistics
+COURSE_QUERY_SAMPLE_RATE = float(os.getenv("COURSE_QUERY_SAMPLE_RATE", "0.1"))
+# Seconds between two flushes of the recorded searches to the database
+COURSE_QUERY_FLUSH_INTERVAL = float(os.getenv("COURSE_QUERY_FLUSH_INTERVAL", "60"))
+# Seconds a recorded search is kept after it was last seen, so searches made
+# once or twice do not pile up in the database
+COURSE_QUERY_TTL = int(os.getenv("COURSE_QUERY_TTL", str(30 * 24 * 60 * 60)))
+
+_query_lock = threading.Lock()
+_query_hits: Counter[str] = Counter()
+_query_params: dict[str, JSON] = {}
+_flusher: threading.Thread | None = None
+
+
+def record_course_query(
+    keywords: list[str],
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+    strict: bool,
+):
+    """
+    Record a sample of a course search in memory.
+
+    Samples are counted in memory and flushed to the `course_queries`
+    collection by the flusher thread, see `start_course_query_flusher`.
+
+    :param keywords: the normalized keywords of the search.
+    """
+    if random.random() >= COURSE_QUERY_SAMPLE_RATE:
+        return
+
+    params: JSON = {
+        "keywords": keywords,
+        "projection": projection,
+        "page": page,
+        "limit": limit,
+        "strict": strict,
+    }
+    key = json.dumps(params, sort_keys=True)
+    with _query_lock:
+        _query_hits[key] += 1
+        _query_params[key] = params
+
+
+def flush_course_queries():
+    """
+    Add the hit counts recorded in memory to the `course_queries` collection.
+    """
+    with _query_lock:
+        hits = _query_hits.copy()
+        params = {key: _query_params[key] for key in hits}
+        _query_hits.clear()
+        _query_params.clear()
+
+    if not hits:
+        return
+
+    now = datetime.now(timezone.utc)
+    get_db().course_queries.bulk_write(
+        [
+            UpdateOne(
+                {"_id": key},
+                {
+                    "$inc": {"hits": count},
+                    "$set": {
+                        **params[key],
+                        "last_seen": now,
+                        "expires_at": now + timedelta(seconds=COURSE_QUERY_TTL),
+                    },
+                },
+                upsert=True,
+            )
+            for key, count in hits.items()
+        ],
+        ordered=False,
+    )
+    get_db_logger().debug(
+        "Flushed {count} recorded course searches".format(count=len(hits))
+    )
+
+
+def _flush_course_queries_periodically():
+    while True:
+        sleep(COURSE_QUERY_FLUSH_INTERVAL)
+        try:
+            flush_course_queries()
+        except Exception:
+            get_db_logger().exception("Failed to flush the recorded course searches")
+
+
+def start_course_query_flusher():
+    """
+    Start the thread of this worker flushing the recorded course searches
+    every `COURSE_QUERY_FLUSH_INTERVAL` seconds, unless already started.
+    """
+    global _flusher
+    with _query_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_flush_course_queries_periodically,
+                name="course-query-flusher",
+                daemon=True,
+            )
+            _flusher.start()
+
+
+def get_popular_course_queries(limit: int) -> list[JSON]:
+    """
+    Return the parameters of the most frequent recorded course searches.
+
+    :param limit: the maximum number of searches to return.
+    """
+    return (
+        get_db()
+        .course_queries.find(
+            {},
+            projection={
+                "_id": False,
+                "hits": False,
+                "last_seen": False,
+                "expires_at": False,
+            },
+        )
+        .sort({"hits": -1})
+        .limit(limit)
+        .to_list()
+    )
@@ -0,0 +1,355 @@
+import operator
+import re
+import shlex
+from bisect import bisect_left
+from typing import Any, Callable, Iterable
+
+from flaskr.db.catalog import Catalog
+from flaskr.db.database import JSON
+
+# e.g. "MATH2028", "math 2028", "CSCI-31"
+COURSE_CODE_REGEX = re.compile(r"^([A-Za-z]{4})-?(\d{1,4})$")
+# e.g. "MATH"
+DEPARTMENT_REGEX = re.compile(r"^[A-Za-z]{4}$")
+# e.g. "2028", as in prerequisites like "MATH1030 or 1038"
+COURSE_NUMBER_REGEX = re.compile(r"^\d{1,4}$")
+# Connectives found in prerequisites strings, never part of a code
+CONNECTIVES = {"and", "or"}
+# Full or department-less course codes in free text, e.g. "MATH1030 or 1038"
+REQUISITE_CODE_REGEX = re.compile(r"\b([A-Z]{4})?\s?(\d{4})\b")
+# e.g. ">=3", "<4.5", "3"
+UNITS_REGEX = re.compile(r"^(>=|<=|>|<|=)?(\d+(?:\.\d+)?)$")
+UNITS_OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "=": operator.eq,
+}
+
+
+class CourseQuery:
+    """
+    Normalized form of a list of course search keywords.
+
+    Keywords shaped like course codes are rewritten into case-sensitive code
+    prefixes that can be answered with range scans on the `code` index:
+
+    - department and number, e.g. "math 2028" or "MATH-20", become "MATH2028"
+      and "MATH20"
+    - bare departments, e.g. "csci", become "CSCI"
+    - bare numbers become a prefix with the department of the preceding code
+      in the same keyword, e.g. the "1038" in "MATH1030 or 1038", or an
+      anchored pattern on the number part of any department otherwise
+
+    Separate keywords stay separate alternatives, e.g. "MATH" and "2028" match
+    any MATH course or any course numbered 2028, and a bare department never
+    carries over to a number, as four-letter words like "data" look the same.
+
+    Everything else is kept as a plain term, which is left to the full-text
+    search so that the code query never needs an unanchored scan.
+
+    Courses in `excluded_codes`, e.g. those not open to the major of the
+    user, are never matched.
+    """
+
+    def __init__(self, keywords: list[str], excluded_codes: Iterable[str] = ()):
+        self.keywords = [" ".join(keyword.split()) for keyword in keywords]
+        self.keywords = [keyword for keyword in self.keywords if keyword]
+        self.excluded_codes = frozenset(excluded_codes)
+        self.prefixes: list[str] = []
+        self.number_patterns: list[str] = []
+        self.terms: list[str] = []
+
+        for keyword in self.keywords:
+            self._add_keyword(keyword)
+
+    def _add_keyword(self, keyword: str):
+        tokens = [
+            token
+            for token in re.split(r"[\s,;/()]+", keyword)
+            if token and token.lower() not in CONNECTIVES
+        ]
+        # Department of the last course code of this keyword
+        department: str | None = None
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            next_token = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if match := COURSE_CODE_REGEX.match(token):
+                department = match[1].upper()
+                self._add_prefix(department + match[2])
+            elif DEPARTMENT_REGEX.match(token) and COURSE_NUMBER_REGEX.match(
+                next_token
+            ):
+                department = token.upper()
+                self._add_prefix(department + next_token)
+                i += 1
+            elif DEPARTMENT_REGEX.match(token):
+                self._add_prefix(token.upper())
+            elif COURSE_NUMBER_REGEX.match(token) and department:
+                self._add_prefix(department + token)
+            elif COURSE_NUMBER_REGEX.match(token):
+                pattern = f"^[A-Z]{{4}}{token}"
+                if pattern not in self.number_patterns:
+                    self.number_patterns.append(pattern)
+            elif token not in self.terms:
+                self.terms.append(token)
+            i += 1
+
+    def _add_prefix(self, prefix: str):
+        # A shorter prefix already covers every longer one
+        if any(prefix.startswith(existing) for existing in self.prefixes):
+            return
+        self.prefixes = [
+            existing for existing in self.prefixes if not existing.startswith(prefix)
+        ]
+        self.prefixes.append(prefix)
+
+    @property
+    def text(self):
+        """
+        The keywords for a full-text search.
+        """
+        return " ".join(self.keywords)
+
+    @property
+    def code_regex(self):
+        """
+        A regular expression (to be used case-insensitively) matching the same
+        codes as `code_filter`.
+        """
+        patterns = [f"^{re.escape(prefix)}" for prefix in self.prefixes]
+        patterns += self.number_patterns
+        # An empty query matches nothing
+        return "|".join(patterns) or "(?!)"
+
+    @property
+    def key(self):
+        """
+        A hashable key identifying equivalent queries.
+        """
+        return (
+            tuple(sorted(self.prefixes)),
+            tuple(sorted(self.number_patterns)),
+            tuple(sorted(term.lower() for term in self.terms)),
+            self.text.lower(),
+            tuple(sorted(self.excluded_codes)),
+        )
+
+    def code_filter(self) -> JSON:
+        """
+        Compile the query into a MongoDB filter on the `code` field.
+        """
+        clauses: list[JSON] = [
+            {"code": {"$gte": prefix, "$lt": _prefix_upper_bound(prefix)}}
+            for prefix in self.prefixes
+        ]
+        clauses += [{"code": {"$regex": pattern}} for pattern in self.number_patterns]
+        if not clauses:
+            return {"code": {"$in": []}}
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+    def exclude(self, mongo_filter: JSON) -> JSON:
+        """
+        Restrict a MongoDB filter to the courses not excluded from the query.
+        """
+        return _exclude_codes(mongo_filter, self.excluded_codes)
+
+    def matches_code(self, code: str):
+        """
+        Check whether a course code is matched by the query.
+        """
+        if code in self.excluded_codes:
+            return False
+        return re.search(self.code_regex, code, re.IGNORECASE) is not None
+
+
+def _prefix_upper_bound(prefix: str):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _exclude_codes(mongo_filter: JSON, excluded_codes: frozenset[str]) -> JSON:
+    if not excluded_codes:
+        return mongo_filter
+    return {"$and": [mongo_filter, {"code": {"$nin": sorted(excluded_codes)}}]}
+
+
+def extract_course_codes(text: str):
+    """
+    Extract the full course codes mentioned in a requisites string.
+
+    Numbers without a department take the department before them, e.g.
+    "(MATH1030 or 1038) and ENGG1120" yields MATH1030, MATH1038 and ENGG1120.
+    """
+    codes: set[str] = set()
+    department: str | None = None
+    for match in REQUISITE_CODE_REGEX.finditer(text):
+        department = match[1] or department
+        if department:
+            codes.add(department + match[2])
+    return frozenset(codes)
+
+
+def _build_requisite_codes(catalog: Catalog):
+    return {
+        course["code"]: (
+            extract_course_codes(course.get("prerequisites", "")),
+            extract_course_codes(course.get("corequisites", "")),
+        )
+        for course in catalog.courses
+    }
+
+
+def get_requisite_codes(catalog: Catalog) -> dict[str, tuple[frozenset[str], ...]]:
+    """
+    Return the prerequisite and corequisite codes of every course in the catalog.
+    """
+    return catalog.derive("requisite_codes", _build_requisite_codes)
+
+
+class CourseFilter:
+    """
+    Field-qualified course search parsed from a query string, e.g.
+    `dept:CSCI units:>=3 graded:true prereq:CSCI2100 operating systems`.
+
+    Supported fields:
+
+    - `dept:` and `code:` restrict the course code prefix, multiple values are
+      alternatives
+    - `units:` compares the units with `>=`, `<=`, `>`, `<` or `=` (default)
+    - `graded:` is `true` or `false`
+    - `prereq:` and `coreq:` require the course code among the requisites
+
+    All other words form the full-text part of the search. Quoted words are
+    kept together. Courses in `excluded_codes` are never matched.
+    """
+
+    def __init__(self, q: str, excluded_codes: Iterable[str] = ()):
+        self.excluded_codes = frozenset(excluded_codes)
+        self.prefixes: list[str] = []
+        self.units: list[tuple[str, float]] = []
+        self.graded: bool | None = None
+        self.prerequisites: list[str] = []
+        self.corequisites: list[str] = []
+        self.words: list[str] = []
+
+        for token in shlex.split(q):
+            field, sep, value = token.partition(":")
+            if not sep:
+                self.words.append(token)
+                continue
+
+            field = field.lower()
+            if field in ["dept", "code"]:
+                match = COURSE_CODE_REGEX.match(value) or DEPARTMENT_REGEX.match(value)
+                if not match or (field == "dept" and COURSE_CODE_REGEX.match(value)):
+                    raise ValueError(f"Invalid {field} value {value!r}")
+                self.prefixes.append(value.upper().replace("-", ""))
+            elif field == "units":
+                match = UNITS_REGEX.match(value)
+                if not match:
+                    raise ValueError(f"Invalid units value {value!r}")
+                self.units.append((match[1] or "=", float(match[2])))
+            elif field == "graded":
+                if value.lower() not in ["true", "false"]:
+                    raise ValueError(f"Invalid graded value {value!r}")
+                self.graded = value.lower() == "true"
+            elif field in ["prereq", "coreq"]:
+                codes = extract_course_codes(value.upper())
+                if len(codes) != 1:
+                    raise ValueError(f"Invalid {field} value {value!r}")
+                (self.prerequisites if field == "prereq" else self.corequisites).extend(
+                    codes
+                )
+            else:
+                raise ValueError(f"Unknown field {field!r}")
+
+    @property
+    def text(self):
+        """
+        The words for a full-text search.
+        """
+        return " ".join(self.words)
+
+    @property
+    def has_predicates(self):
+        return bool(
+            self.prefixes
+            or self.units
+            or self.graded is not None
+            or self.prerequisites
+            or self.corequisites
+        )
+
+    @property
+    def key(self):
+        """
+        A hashable key identifying equivalent filters.
+        """
+        return (
+            tuple(sorted(set(self.prefixes))),
+            tuple(sorted(set(self.units))),
+            self.graded,
+            tuple(sorted(set(self.prerequisites))),
+            tuple(sorted(set(self.corequisites))),
+            self.text.lower(),
+            tuple(sorted(self.excluded_codes)),
+        )
+
+    def exclude(self, mongo_filter: JSON) -> JSON:
+        """
+        Restrict a MongoDB filter to the courses not excluded from the filter.
+        """
+        return _exclude_codes(mongo_filter, self.excluded_codes)
+
+    def apply(self, catalog: Catalog) -> list[JSON]:
+        """
+        Apply the field predicates to the catalog, most selective first.
+
+        Code prefixes are resolved with binary searches over the courses sorted
+        by code, the remaining predicates only test the courses left.
+
+        :return: the matching courses sorted by code.
+        """
+        courses = catalog.courses_by_code
+        if self.prefixes:
+            codes = [course["code"] for course in courses]
+            candidates: list[JSON] = []
+            covered: str | None = None
+            for prefix in sorted(set(self.prefixes)):
+                # Sorted prefixes follow the shorter prefix covering them
+                if covered and prefix.startswith(covered):
+                    continue
+                covered = prefix
+                start = bisect_left(codes, prefix)
+                end = bisect_left(codes, _prefix_upper_bound(prefix))
+                candidates += courses[start:end]
+            courses = candidates
+
+        requisite_codes = (
+            get_requisite_codes(catalog)
+            if self.prerequisites or self.corequisites
+            else {}
+        )
+        return [course for course in courses if self._matches(course, requisite_codes)]
+
+    def _matches(
+        self, course: JSON, requisite_codes: dict[str, tuple[frozenset[str], ...]]
+    ):
+        if course["code"] in self.excluded_codes:
+            return False
+        if self.graded is not None and course["is_graded"] != self.graded:
+            return False
+        for op, units in self.units:
+            if not UNITS_OPERATORS[op](course["units"], units):
+                return False
+        if self.prerequisites or self.corequisites:
+            prerequisites, corequisites = requisite_codes.get(
+                course["code"], (frozenset(), frozenset())
+            )
+            if not prerequisites.issuperset(self.prerequisites):
+                return False
+            if not corequisites.issuperset(self.corequisites):
+                return False
+        return True
@@ -0,0 +1,119 @@
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from flaskr.db.database import JSON
+
+# Number of similar courses precomputed for every course
+RELATED_COURSES_COUNT = int(os.getenv("RELATED_COURSES_COUNT", "20"))
+# Dimensions of the latent semantic space courses are compared in
+RELATED_COURSES_DIMENSIONS = int(os.getenv("RELATED_COURSES_DIMENSIONS", "100"))
+# Maximum number of distinct terms considered, the most common ones are kept
+RELATED_COURSES_VOCABULARY = int(os.getenv("RELATED_COURSES_VOCABULARY", "4096"))
+
+WORD_REGEX = re.compile(r"[a-z][a-z0-9]+")
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be by for from in into is it its of on or that the this
+    to with will which their they students course courses including
+    """.split()
+)
+
+
+def _tokenize(text: str):
+    return [word for word in WORD_REGEX.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def _tf_idf(courses: list[JSON]) -> np.ndarray:
+    """
+    Build the L2-normalized TF-IDF matrix of the course titles and descriptions,
+    with title words counted twice.
+    """
+    counts = [
+        Counter(
+            _tokenize(course.get("title", "")) * 2
+            + _tokenize(course.get("description", ""))
+        )
+        for course in courses
+    ]
+    document_frequency = Counter(term for count in counts for term in count)
+    # Terms found in a single course cannot relate two courses
+    terms = [term for term, df in document_frequency.most_common() if df > 1]
+    terms = terms[:RELATED_COURSES_VOCABULARY]
+    columns = {term: i for i, term in enumerate(terms)}
+
+    n = len(courses)
+    matrix = np.zeros((n, len(terms)), dtype=np.float32)
+    for row, count in enumerate(counts):
+        for term, tf in count.items():
+            column = columns.get(term)
+            if column is not None:
+                idf = math.log((1 + n) / (1 + document_frequency[term])) + 1
+                matrix[row, column] = (1 + math.log(tf)) * idf
+    return _normalize_rows(matrix)
+
+
+def _normalize_rows(matrix: np.ndarray):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _truncated_svd(matrix: np.ndarray, rank: int):
+    """
+    Return the left singular vectors scaled by the singular values for the
+    `rank` largest singular values, using a randomized range finder for
+    matrices much larger than the rank.
+    """
+    if min(matrix.shape) <= 2 * rank:
+        u, s, _ = np.linalg.svd(matrix, full_matrices=False)
+        return u[:, :rank] * s[:rank]
+
+    rng = np.random.default_rng(0)
+    q, _ = np.linalg.qr(matrix @ rng.standard_normal((matrix.shape[1], rank + 10)))
+    # Power iterations sharpen the decay of the spectrum
+    for _ in range(2):
+        q, _ = np.linalg.qr(matrix @ (matrix.T @ q))
+    u, s, _ = np.linalg.svd(q.T @ matrix, full_matrices=False)
+    return (q @ u[:, :rank]) * s[:rank]
+
+
+def compute_related_courses(courses: list[JSON]) -> list[JSON]:
+    """
+    Compute the most similar courses of every course.
+
+    Courses are embedded with latent semantic analysis (TF-IDF followed by a
+    truncated SVD) of their titles and descriptions, and compared by cosine
+    similarity.
+
+    :param courses: the courses, each with a code, title and description.
+    :return: a list of documents for the `course_related` collection, with
+        the related course codes ordered by decreasing similarity.
+    """
+    if len(courses) < 2:
+        return []
+
+    tf_idf = _tf_idf(courses)
+    rank = min(RELATED_COURSES_DIMENSIONS, *tf_idf.shape)
+    embeddings = _normalize_rows(_truncated_svd(tf_idf, rank)) if rank else tf_idf
+    k = min(RELATED_COURSES_COUNT, len(courses) - 1)
+
+    docs: list[JSON] = []
+    block_size = 512
+    for start in range(0, len(courses), block_size):
+        similarities = embeddings[start : start + block_size] @ embeddings.T
+        for row, scores in enumerate(similarities, start):
+            scores[row] = -np.inf
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            top = top[scores[top] > 0]
+            docs.append(
+                {
+                    "code": courses[row]["code"],
+                    "related": [courses[i]["code"] for i in top],
+                    "scores": [round(float(scores[i]), 4) for i in top],
+                }
+            )
+    return docs
@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+from hashlib import sha256
+from itertools import groupby
+from tempfile import NamedTemporaryFile
+
+from bson import Binary
+from pymongo.database import Database
+
+from flaskr.db.catalog import Catalog, get_catalog
+from flaskr.db.database import JSON, get_db, get_db_logger
+
+
+def build_course_shards(courses: list[JSON]) -> list[JSON]:
+    """
+    Serialize and compress the courses of every department into one shard.
+
+    Shards are named after a digest of their content, so a department whose
+    courses did not change keeps its shard across catalog versions.
+
+    :param courses: the courses to ingest, without their original texts.
+    :return: a list of shard documents with the department, content digest,
+        course count and compressed data.
+    """
+    courses = sorted(
+        (
+            {key: value for key, value in course.items() if key != "_id"}
+            for course in courses
+        ),
+        key=lambda course: course["code"],
+    )
+    shards: list[JSON] = []
+    for department, department_courses in groupby(
+        courses, key=lambda course: course["code"][:4]
+    ):
+        department_courses = list(department_courses)
+        data = json.dumps(department_courses, separators=(",", ":")).encode()
+        shards.append(
+            {
+                "department": department,
+                "digest": sha256(data).hexdigest()[:16],
+                "count": len(department_courses),
+                # A fixed mtime keeps the compressed bytes reproducible
+                "data": Binary(gzip.compress(data, compresslevel=9, mtime=0)),
+            }
+        )
+    return shards
+
+
+def save_course_shards(db: Database[JSON], shards: list[JSON], version: int):
+    """
+    Store the shards of a catalog version in the `course_shards` collection.
+
+    Shards of the previous version are kept, as workers still serving the
+    previous catalog may hand out their URLs for a while, older ones are deleted.
+
+    :param db: the database.
+    :param shards: the shards built by `build_course_shards`.
+    :param version: the catalog version the shards belong to.
+    """
+    course_shards_collection = db.course_shards
+    previous_versions = course_shards_collection.distinct("versions")
+    previous_version = max((v for v in previous_versions if v != version), default=None)
+    for shard in shards:
+        course_shards_collection.update_one(
+            {"department": shard["department"], "digest": shard["digest"]},
+            {"$setOnInsert": shard, "$addToSet": {"versions": version}},
+            upsert=True,
+        )
+    course_shards_collection.update_many(
+        {"digest": {"$nin": [shard["digest"] for shard in shards]}},
+        {"$pull": {"versions": version}},
+    )
+    course_shards_collection.delete_many(
+        {"versions": {"$nin": [version, previous_version]}}
+    )
+
+
+def _load_course_shard_index(catalog: Catalog) -> dict[str, str]:
+    course_shards_collection = get_db().course_shards
+    return {
+        doc["department"]: doc["digest"]
+        for doc in course_shards_collection.find(
+            {"versions": catalog.version},
+            projection={"_id": False, "department": True, "digest": True},
+        )
+    }
+
+
+def get_course_shard_index():
+    """
+    Return the shard digest of every department in the current catalog.
+
+    :return: the catalog version and a dictionary from department to digest.
+    """
+    catalog = get_catalog()
+    return catalog.version, catalog.derive(
+        "course_shard_index", _load_course_shard_index
+    )
+
+
+def get_course_shard_path(department: str, digest: str, directory: str):
+    """
+    Return the path of a gzip-compressed course shard on the local disk.
+
+    Shards are written to `directory` from the database on first use. As the
+    content of a shard never changes for a given digest, a file once written
+    is served as is by every worker.
+
+    :param department: the four-letter department prefix.
+    :param digest: the digest of the shard content.
+    :param directory: the directory caching the shard files.
+    :return: the file path, or None if no such shard exists.
+    """
+    path = os.path.join(directory, f"{department}.{digest}.json.gz")
+    if os.path.exists(path):
+        return path
+
+    course_shards_collection = get_db().course_shards
+    doc = course_shards_collection.find_one(
+        {"department": department, "digest": digest}, projection={"data": True}
+    )
+    if not doc:
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    # Write then rename, so concurrent requests never read a partial file
+    with NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+        f.write(doc["data"])
+    # Readable by a reverse proxy serving the directory
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+    get_db_logger().debug(
+        "Wrote course shard {department} {digest} to {path}".format(
+            department=department, digest=digest, path=path
+        )
+    )
+    return path
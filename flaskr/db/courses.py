@@ -1,100 +1,732 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
 from time import time
 
-from flaskr.db.database import get_db, get_db_logger
+from pymongo.errors import ExecutionTimeout
 
+from flaskr.db.catalog import Catalog, add_catalog_listener, get_catalog, project_course
+from flaskr.db.course_index import get_course_index
+from flaskr.db.course_queries import get_popular_course_queries, record_course_query
+from flaskr.db.course_query import CourseFilter, CourseQuery
+from flaskr.db.database import JSON, get_db, get_db_logger
+from flaskr.db.models import CourseChange, CourseChangeSet, CourseOriginal, CourseRead
+from flaskr.utils import SingleFlight
+
+# Execution mode of non-strict course searches, either "aggregate" for a single
+# $or aggregation, "parallel" for concurrent code and text queries, or "index"
+# for the in-process search index of the catalog instead of the $text index
+COURSE_SEARCH_MODE = os.getenv("COURSE_SEARCH_MODE", "parallel")
+
+# Server-side time limit of a single course search query, searches running
+# longer are answered from the in-memory catalog by code only
+COURSE_SEARCH_TIME_LIMIT_MS = int(os.getenv("COURSE_SEARCH_TIME_LIMIT_MS", "1000"))
+
+# Number of popular course searches executed ahead of time for a new catalog
+COURSE_CACHE_WARM_QUERIES = int(os.getenv("COURSE_CACHE_WARM_QUERIES", "100"))
+
+# Programme codes listed in `not_for_major`, e.g. "PESH" and "ESHE" in "PESH and ESHE"
+PROGRAMME_CODE_REGEX = re.compile(r"\b[A-Z]{4}\b")
+
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="course-search")
+_search_flight = SingleFlight()
+
+
+def get_all_courses(
+    projection: dict[str, bool], page: int, limit: int, major: str | None = None
+):
+    """
+    Return a page of all courses.
+
+    :param major: if given, the courses not open to this major are left out.
+    """
+    catalog = get_catalog()
+    courses = _get_major_eligibility(catalog, major)[0] if major else catalog.courses
+    return [
+        project_course(course, projection)
+        for course in courses[(page - 1) * limit : page * limit]
+    ]
+
+
+def _build_major_exclusions(catalog: Catalog):
+    """
+    Index `not_for_major` into a bitmap of the excluded course positions in
+    `catalog.courses` for every major.
+    """
+    exclusions: dict[str, int] = {}
+    for position, course in enumerate(catalog.courses):
+        for major in set(PROGRAMME_CODE_REGEX.findall(course["not_for_major"])):
+            exclusions[major] = exclusions.get(major, 0) | 1 << position
+    return exclusions
+
+
+def _get_major_eligibility(
+    catalog: Catalog, major: str
+) -> tuple[list[JSON], frozenset[str]]:
+    """
+    Return the courses open to a major and the codes of those which are not.
+    """
+    major = major.strip().upper()
+
+    def build(catalog: Catalog):
+        exclusions = catalog.derive("major_exclusions", _build_major_exclusions)
+        # Bit i of the bitmap is character i of the reversed binary string
+        bits = format(exclusions.get(major, 0), f"0{len(catalog.courses)}b")[::-1]
+        eligible = [course for course, bit in zip(catalog.courses, bits) if bit == "0"]
+        excluded = frozenset(
+            course["code"] for course, bit in zip(catalog.courses, bits) if bit == "1"
+        )
+        return eligible, excluded
+
+    return catalog.derive(f"major_eligibility:{major}", build)
+
+
+def get_course(code: str, projection: dict[str, bool]):
+    """
+    Return the course with the given code.
+
+    The course is looked up in the in-memory catalog. Codes missing from the
+    catalog, e.g. right after a new version is ingested, fall back to the
+    unique `code` index.
+
+    :param code: the exact course code.
+    :param projection: the exclusion projection to apply.
+    :return: the course and the catalog etag it was served from, the etag is
+        None when the course was read from the database.
+    """
+    catalog = get_catalog()
+    course = catalog.by_code.get(code)
+    if course:
+        return project_course(course, projection), catalog.etag
 
-def get_all_courses(projection: dict[str, bool], page: int, limit: int):
     courses_collection = get_db().courses
     return (
-        courses_collection.find({}, projection=projection)
-        .skip((page - 1) * limit)
-        .limit(limit)
+        courses_collection.find_one({"code": code}, projection=projection or None),
+        None,
     )
 
 
+def get_courses_by_codes(codes: list[str], projection: dict[str, bool]):
+    """
+    Return the courses with the given codes.
+
+    Courses are looked up in the in-memory catalog, codes missing from it are
+    fetched with a single `$in` query on the `code` index.
+
+    :param codes: the exact course codes.
+    :param projection: the exclusion projection to apply.
+    :return: the courses found, in the order of their codes.
+    """
+    catalog = get_catalog()
+    codes = list(dict.fromkeys(codes))
+    courses = {
+        code: project_course(catalog.by_code[code], projection)
+        for code in codes
+        if code in catalog.by_code
+    }
+    missing = [code for code in codes if code not in courses]
+    if missing:
+        courses_collection = get_db().courses
+        for course in courses_collection.find(
+            {"code": {"$in": missing}}, projection=projection or None
+        ):
+            courses[course["code"]] = course
+    return [courses[code] for code in codes if code in courses]
+
+
+def get_related_courses(code: str, projection: dict[str, bool], limit: int):
+    """
+    Return the courses most similar to the course with the given code.
+
+    The neighbours are precomputed at ingestion and loaded once per catalog
+    snapshot, so a lookup is a dictionary access.
+
+    :param code: the exact course code.
+    :param projection: the exclusion projection to apply.
+    :param limit: the maximum number of related courses.
+    :return: the related courses by decreasing similarity, or None if the
+        course does not exist.
+    """
+    catalog = get_catalog()
+    if code not in catalog.by_code:
+        return None
+    related = catalog.derive("related_courses", _load_related_courses)
+    return [
+        project_course(catalog.by_code[related_code], projection)
+        for related_code in related.get(code, [])[:limit]
+        if related_code in catalog.by_code
+    ]
+
+
+def _load_related_courses(catalog: Catalog) -> dict[str, list[str]]:
+    course_related_collection = get_db().course_related
+    return {
+        doc["code"]: doc["related"]
+        for doc in course_related_collection.find({}, projection={"_id": False})
+    }
+
+
+def get_course_original(code: str):
+    """
+    Return the original source text of the course with the given code.
+
+    :param code: the course code.
+    :return: the CourseOriginal object or None if not found.
+    """
+    course_originals_collection = get_db().course_originals
+    doc = course_originals_collection.find_one({"code": code})
+    return CourseOriginal.model_validate(doc) if doc else None
+
+
 def get_courses(
     keywords: list[str],
     projection: dict[str, bool],
     page: int,
     limit: int,
     strict: bool,
+    major: str | None = None,
+    highlight: bool = False,
 ):
-    courses_collection = get_db().courses
+    """
+    Search courses by keywords.
 
-    # Time our search for research purpose
+    Identical searches running concurrently in this worker are executed once
+    and share the result.
+
+    :param major: if given, the courses not open to this major are left out.
+    :param highlight: whether to add the matches of the keywords to every course.
+    :return: the matching courses and whether the search was degraded to a
+        code-only search because it ran out of time.
+    """
+    catalog = get_catalog()
+    excluded_codes = _get_major_eligibility(catalog, major)[1] if major else ()
+    query = CourseQuery(keywords, excluded_codes)
+    record_course_query(query.keywords, projection, page, limit, strict)
+
+    key = _search_key(query, projection, page, limit, strict)
+    result = catalog.search_cache.get(key)
+    if result is not None:
+        return result, False
+
+    (result, degraded), shared = _search_flight.do(
+        key, lambda: _search(query, projection, page, limit, strict)
+    )
+    if shared:
+        get_db_logger().debug(
+            "Shared the result of an in-flight course search on keywords {keywords}".format(
+                keywords=keywords
+            )
+        )
+    elif not degraded:
+        catalog.search_cache.set(key, result)
+    if highlight:
+        result = _highlight_courses(catalog, result, query.text)
+    return result, degraded
+
+
+def filter_courses(
+    q: str,
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+    major: str | None = None,
+    highlight: bool = False,
+):
+    """
+    Search courses with a field-qualified query, see `CourseFilter`.
+
+    The field predicates are evaluated on the in-memory catalog first, so the
+    database only runs the full-text part of the query, restricted to the
+    remaining candidates.
+
+    :param major: if given, the courses not open to this major are left out.
+    :param highlight: whether to add the matches of the full-text part to
+        every course.
+    :return: the matching courses and whether the full-text part was dropped
+        because it ran out of time, leaving the courses matching the field
+        predicates, or none without any predicate.
+    :raises ValueError: if the query is invalid.
+    """
+    catalog = get_catalog()
+    excluded_codes = _get_major_eligibility(catalog, major)[1] if major else ()
+    course_filter = CourseFilter(q, excluded_codes)
+    key = ("filter", course_filter.key, tuple(sorted(projection.items())), page, limit)
+    result = catalog.search_cache.get(key)
+    if result is not None:
+        return result, False
+
+    (result, degraded), shared = _search_flight.do(
+        key, lambda: _filter(catalog, course_filter, projection, page, limit)
+    )
+    if not shared and not degraded:
+        catalog.search_cache.set(key, result)
+    if highlight:
+        result = _highlight_courses(catalog, result, course_filter.text)
+    return result, degraded
+
+
+def _highlight_courses(catalog: Catalog, courses: list[JSON], text: str):
+    """
+    Add the spans of the search terms and a description snippet to copies of
+    the courses, using the term offsets stored in the catalog search index.
+    """
+    index = get_course_index(catalog)
+    return [
+        (
+            {**course, "highlight": index.highlight(course["code"], text)}
+            if "code" in course
+            else course
+        )
+        for course in courses
+    ]
+
+
+def _filter(
+    catalog: Catalog,
+    course_filter: CourseFilter,
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+) -> tuple[list[JSON], bool]:
     start_time = time()
 
-    if strict:
-        result = (
-            courses_collection.find(
-                {
-                    "code": {
-                        "$regex": "|".join([keyword for keyword in keywords]),
-                        "$options": "i",
-                    }
-                }
+    candidates = course_filter.apply(catalog)
+    degraded = False
+    result: list[JSON] | None = None
+    if course_filter.text and (candidates or not course_filter.has_predicates):
+        try:
+            if COURSE_SEARCH_MODE == "index":
+                result = _filter_index(
+                    catalog, course_filter, candidates, projection, page, limit
+                )
+            else:
+                result = _filter_text(
+                    course_filter, candidates, projection, page, limit
+                )
+        except ExecutionTimeout:
+            get_db_logger().warning(
+                "Full-text part {text!r} of a course filter exceeded {time_limit}ms, falling back to its field predicates".format(
+                    text=course_filter.text, time_limit=COURSE_SEARCH_TIME_LIMIT_MS
+                )
             )
-            .sort({"code": 1})
-            .skip((page - 1) * limit)
-            .limit(limit)
+            degraded = True
+            # Without predicates the candidates are the whole catalog, which
+            # has nothing to do with the text
+            if not course_filter.has_predicates:
+                result = []
+    elif course_filter.text:
+        # No candidate left for the full-text part to rank
+        result = []
+    if result is None:
+        result = [
+            project_course(course, projection)
+            for course in candidates[(page - 1) * limit : page * limit]
+        ]
+
+    get_db_logger().info(
+        "Executed course filter with {count} candidates and text {text!r} with limit {limit} on page {page} using {exec_time:.3f}s".format(
+            count=len(candidates),
+            text=course_filter.text,
+            limit=limit,
+            page=page,
+            exec_time=time() - start_time,
         )
+    )
+    return result, degraded
+
+
+def _filter_index(
+    catalog: Catalog,
+    course_filter: CourseFilter,
+    candidates: list[JSON],
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+):
+    """
+    Rank the candidates left by the field predicates of a course filter with
+    the in-process index of the catalog.
+    """
+    index = get_course_index(catalog)
+    positions = (
+        [index.positions[course["code"]] for course in candidates]
+        if course_filter.has_predicates
+        else None
+    )
+    ranked = [
+        catalog.courses[position]
+        for _, position in index.search(course_filter.text, positions)
+    ]
+    ranked = [
+        course
+        for course in ranked
+        if course["code"] not in course_filter.excluded_codes
+    ]
+    return [
+        project_course(course, projection)
+        for course in ranked[(page - 1) * limit : page * limit]
+    ]
+
+
+def _filter_text(
+    course_filter: CourseFilter,
+    candidates: list[JSON],
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+):
+    """
+    Run the full-text part of a course filter, restricted to the candidates left
+    by its field predicates.
+    """
+    courses_collection = get_db().courses
+    text_filter: JSON = {"$text": {"$search": course_filter.text}}
+    if course_filter.has_predicates:
+        text_filter["code"] = {"$in": [course["code"] for course in candidates]}
     else:
-        # Search priority: first by code, then by title, then by description
-        pipeline = [
-            {
-                "$match": {
-                    "$or": [
-                        {
-                            "code": {
-                                "$regex": "|".join([keyword for keyword in keywords]),
-                                "$options": "i",
-                            }
-                        },
-                        {
-                            "$text": {
-                                "$search": " ".join(keyword for keyword in keywords)
-                            }
-                        },
-                    ]
-                }
-            },
-            {
-                "$addFields": {
-                    "overall_score": {
-                        "$cond": {
-                            "if": {
-                                "$regexMatch": {
-                                    "input": "$code",
-                                    "regex": "|".join(keywords),
-                                    "options": "i",
-                                }
-                            },
-                            "then": 0x3F3F3F3F,
-                            "else": {"$meta": "textScore"},
-                        }
-                    }
-                }
-            },
-            {"$sort": {"overall_score": -1, "code": 1}},
-            {"$skip": (page - 1) * limit},
-            {"$limit": limit},
-        ]
-        if projection:
-            pipeline.append({"$project": projection})
+        text_filter = course_filter.exclude(text_filter)
+
+    result = (
+        courses_collection.find(
+            text_filter, projection={**projection, "score": {"$meta": "textScore"}}
+        )
+        .sort({"score": {"$meta": "textScore"}, "code": 1})
+        .skip((page - 1) * limit)
+        .limit(limit)
+        .max_time_ms(COURSE_SEARCH_TIME_LIMIT_MS)
+        .to_list()
+    )
+    for course in result:
+        course.pop("score", None)
+    return result
+
+
+def warm_course_search_cache(catalog: Catalog):
+    """
+    Execute the most popular recorded course searches into the search cache of
+    a new catalog snapshot, so they are not all sent to the database cold.
+
+    Intended to run in a background thread, hence errors are logged instead of raised.
+    """
+    start_time = time()
+    try:
+        popular_queries = get_popular_course_queries(COURSE_CACHE_WARM_QUERIES)
+        for params in popular_queries:
+            query = CourseQuery(params["keywords"])
+            projection = params["projection"]
+            page, limit, strict = params["page"], params["limit"], params["strict"]
+            key = _search_key(query, projection, page, limit, strict)
+            if catalog.search_cache.get(key) is not None:
+                continue
+            result, degraded = _search(query, projection, page, limit, strict)
+            if not degraded:
+                catalog.search_cache.set(key, result)
+    except Exception:
+        get_db_logger().exception("Failed to warm the course search cache")
+        return
+
+    get_db_logger().info(
+        "Warmed the course search cache of catalog version {version} with {count} searches using {exec_time:.3f}s".format(
+            version=catalog.version,
+            count=len(popular_queries),
+            exec_time=time() - start_time,
+        )
+    )
+
+
+def _start_course_search_cache_warming(catalog: Catalog):
+    if COURSE_CACHE_WARM_QUERIES > 0:
+        Thread(target=warm_course_search_cache, args=(catalog,), daemon=True).start()
+
+
+def enable_course_search_cache_warming():
+    """
+    Warm the search cache of every new catalog snapshot of this worker in a
+    background thread.
+    """
+    add_catalog_listener(_start_course_search_cache_warming)
+
+
+def _search_key(
+    query: CourseQuery,
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+    strict: bool,
+):
+    return (query.key, tuple(sorted(projection.items())), page, limit, strict)
+
 
-        result = courses_collection.aggregate(pipeline).to_list()
+def _search(
+    query: CourseQuery,
+    projection: dict[str, bool],
+    page: int,
+    limit: int,
+    strict: bool,
+) -> tuple[list[JSON], bool]:
+    courses_collection = get_db().courses
+    keywords = query.keywords
+
+    # Time our search for research purpose
+    start_time = time()
+
+    degraded = False
+
+    try:
+        if strict:
+            result = (
+                courses_collection.find(
+                    query.exclude(query.code_filter()), projection=projection or None
+                )
+                .sort({"code": 1})
+                .skip((page - 1) * limit)
+                .limit(limit)
+                .max_time_ms(COURSE_SEARCH_TIME_LIMIT_MS)
+                .to_list()
+            )
+        elif COURSE_SEARCH_MODE == "parallel":
+            result = _search_parallel(query, projection, page, limit)
+        elif COURSE_SEARCH_MODE == "index":
+            result = _search_index(query, projection, page, limit)
+        else:
+            result = _search_aggregate(query, projection, page, limit)
+    except ExecutionTimeout:
+        get_db_logger().warning(
+            "Course search on keywords {keywords} exceeded {time_limit}ms, falling back to code search on the catalog".format(
+                keywords=keywords, time_limit=COURSE_SEARCH_TIME_LIMIT_MS
+            )
+        )
+        result = _search_catalog(query, projection, page, limit)
+        degraded = True
 
     end_time = time()
 
     get_db_logger().debug(result)
 
     get_db_logger().info(
-        "Executed course search on keywords {keywords} with limit {limit} on page {page} with strict mode {strict} using {exec_time:.3f}s".format(
+        "Executed course search on keywords {keywords} with limit {limit} on page {page} with strict mode {strict} in {mode} mode using {exec_time:.3f}s".format(
             keywords=keywords,
             limit=limit,
             page=page,
             strict="on" if strict else "off",
+            mode=COURSE_SEARCH_MODE,
             exec_time=end_time - start_time,
         )
     )
+    return result, degraded
+
+
+def _search_aggregate(
+    query: CourseQuery, projection: dict[str, bool], page: int, limit: int
+):
+    """
+    Search courses with a single aggregation over both code and text matches.
+    """
+    courses_collection = get_db().courses
+
+    # Search priority: first by code, then by title, then by description
+    pipeline = [
+        {
+            "$match": query.exclude(
+                {
+                    "$or": [
+                        query.code_filter(),
+                        {"$text": {"$search": query.text}},
+                    ]
+                }
+            )
+        },
+        {
+            "$addFields": {
+                "overall_score": {
+                    "$cond": {
+                        "if": {
+                            "$regexMatch": {
+                                "input": "$code",
+                                "regex": query.code_regex,
+                                "options": "i",
+                            }
+                        },
+                        "then": 0x3F3F3F3F,
+                        "else": {"$meta": "textScore"},
+                    }
+                }
+            }
+        },
+        {"$sort": {"overall_score": -1, "code": 1}},
+        {"$skip": (page - 1) * limit},
+        {"$limit": limit},
+    ]
+    if projection:
+        pipeline.append({"$project": projection})
+
+    return courses_collection.aggregate(
+        pipeline, maxTimeMS=COURSE_SEARCH_TIME_LIMIT_MS
+    ).to_list()
+
+
+def _search_parallel(
+    query: CourseQuery, projection: dict[str, bool], page: int, limit: int
+):
+    """
+    Search courses by running the code query and the text query concurrently.
+
+    Both queries are limited to `page * limit` results, the code matches are
+    ranked first by code and the remaining text matches follow by text score,
+    which is the same order `_search_aggregate` produces. The text query is
+    not waited for when the code matches alone fill the requested page.
+    """
+    courses_collection = get_db().courses
+    wanted = page * limit
+
+    def find_text_matches() -> list[JSON]:
+        return (
+            courses_collection.find(
+                query.exclude(
+                    {
+                        "$text": {"$search": query.text},
+                        # Leave code matches to the code query
+                        "code": {"$not": {"$regex": query.code_regex, "$options": "i"}},
+                    }
+                ),
+                projection={**projection, "score": {"$meta": "textScore"}},
+            )
+            .sort({"score": {"$meta": "textScore"}, "code": 1})
+            .limit(wanted)
+            .max_time_ms(COURSE_SEARCH_TIME_LIMIT_MS)
+            .to_list()
+        )
+
+    text_future = _search_executor.submit(find_text_matches)
+    result = (
+        courses_collection.find(
+            query.exclude(query.code_filter()), projection=projection or None
+        )
+        .sort({"code": 1})
+        .limit(wanted)
+        .max_time_ms(COURSE_SEARCH_TIME_LIMIT_MS)
+        .to_list()
+    )
+    if len(result) < wanted:
+        result += text_future.result()
+    else:
+        text_future.cancel()
+
+    result = result[(page - 1) * limit : wanted]
+    for course in result:
+        course.pop("score", None)
     return result
+
+
+def _search_index(
+    query: CourseQuery, projection: dict[str, bool], page: int, limit: int
+):
+    """
+    Search courses in the in-process index of the catalog, without touching
+    the database.
+
+    Results are in the same order as `_search_parallel`, code matches by code
+    followed by the remaining text matches by score.
+    """
+    catalog = get_catalog()
+    wanted = page * limit
+
+    result = [
+        course
+        for course in catalog.courses_by_code
+        if query.matches_code(course["code"])
+    ][:wanted]
+    if len(result) < wanted:
+        matched_codes = {course["code"] for course in result}
+        for _, position in get_course_index(catalog).search(query.text):
+            course = catalog.courses[position]
+            if (
+                course["code"] not in matched_codes
+                and course["code"] not in query.excluded_codes
+                and not query.matches_code(course["code"])
+            ):
+                result.append(course)
+                if len(result) == wanted:
+                    break
+
+    return [
+        project_course(course, projection)
+        for course in result[(page - 1) * limit : wanted]
+    ]
+
+
+def _search_catalog(
+    query: CourseQuery, projection: dict[str, bool], page: int, limit: int
+):
+    """
+    Search course codes in the in-memory catalog, without touching the database.
+    """
+    courses = [
+        course
+        for course in get_catalog().courses_by_code
+        if query.matches_code(course["code"])
+    ]
+    return [
+        project_course(course, projection)
+        for course in courses[(page - 1) * limit : page * limit]
+    ]
+
+
+def get_course_changes(since: int):
+    """
+    Return the changes to the course catalog after the given version.
+
+    Multiple changes to the same course are folded into one, e.g. a course
+    added and then changed is reported as added with its latest content.
+
+    :param since: the catalog version the client currently holds.
+    :return: the current catalog version, whether the client has to fetch the
+        whole catalog again, and the list of CourseChange objects.
+    """
+    catalog = get_catalog()
+    version = catalog.version
+    course_changes_collection = get_db().course_changes
+
+    first = course_changes_collection.find_one({}, sort=[("version", 1)])
+    if version is None or since > version:
+        return version, True, []
+    if first is None:
+        return version, since < version, []
+    first_change_set = CourseChangeSet.model_validate(first)
+    if (
+        first_change_set.previous_version is not None
+        and since < first_change_set.previous_version
+    ):
+        return version, True, []
+
+    docs = course_changes_collection.find(
+        {"version": {"$gt": since, "$lte": version}}
+    ).sort({"version": 1, "_id": 1})
+
+    first_kinds: dict[str, str] = {}
+    last_kinds: dict[str, tuple[str, int]] = {}
+    for doc in docs:
+        change_set = CourseChangeSet.model_validate(doc)
+        for kind in ["added", "changed", "removed"]:
+            for code in getattr(change_set, kind):
+                first_kinds.setdefault(code, kind)
+                last_kinds[code] = (kind, change_set.version)
+
+    changes: list[CourseChange] = []
+    for code, (kind, change_version) in sorted(last_kinds.items()):
+        course = catalog.by_code.get(code) if kind != "removed" else None
+        if kind != "removed" and course is None:
+            # The course is gone from the catalog snapshot we are serving
+            kind = "removed"
+        elif kind != "removed":
+            kind = "added" if first_kinds[code] == "added" else "changed"
+        changes.append(
+            CourseChange(
+                code=code,
+                change=kind,  # type: ignore
+                version=change_version,
+                course=CourseRead.model_validate(course) if course else None,
+            )
+        )
+    return version, False, changes
@@ -1,18 +1,38 @@
 import json
 import logging
 import os
+import re
+import threading
+from datetime import datetime, timezone
 from types import SimpleNamespace
-from typing import Any
+from typing import Any, Callable, TypeVar
+from uuid import uuid4
 
 from jsonschema import validate
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.client_session import ClientSession
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
 
+from flaskr.db.models import COURSE_CODE_PATTERN
 from flaskr.utils import RequestFormatter
 
 JSON = dict[str, Any]
 
 _mongo: MongoClient[dict[str, Any]] | None = None
 _db_logger: logging.Logger | None = None
+_ingest_lock = threading.Lock()
+# Whether the server supports transactions, unknown until the first one
+_transactions_supported: bool | None = None
+
+T = TypeVar("T")
+
+# Error code of transactions on a standalone server, which only replica sets
+# and sharded clusters support
+ILLEGAL_OPERATION = 20
+
+# Bump whenever the way courses are stored changes, forcing a re-ingestion
+COURSE_LAYOUT_VERSION = 4
 
 schema: JSON = {
     "type": "object",
@@ -52,53 +72,293 @@ schema: JSON = {
 }
 
 
-def init_db():
-    from dotenv import load_dotenv
+def load_course_data(course_data_filename: str) -> JSON:
+    """
+    Read and validate the course data file.
 
-    load_dotenv()
+    :param course_data_filename: path to the course data JSON file.
+    :return: the validated course data.
+    """
+    with open(course_data_filename) as f:
+        course_data = json.load(f)
 
-    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+    validate(instance=course_data, schema=schema)
+    return course_data
 
-    assert course_data_filename, "COURSE_DATA_FILENAME not set in the environment"
 
-    course_data = json.load(open(course_data_filename))
+def ingest_course_data(course_data: JSON):
+    """
+    Replace the courses collection with the given course data.
 
-    validate(instance=course_data, schema=schema)
+    The bulky `original` texts are stored in the separate `course_originals`
+    collection so that `courses` documents stay small. The most similar
+    courses of every course are precomputed into `course_related`, and the
+    courses of every department into a compressed shard in `course_shards`.
+    The new data is written to staging collections of the ingest which are renamed
+    over the live ones, so readers never observe a partially ingested catalog.
+
+    :param course_data: the validated course data.
+    """
+    # Imported here as they depend on this module
+    from flaskr.db.course_related import compute_related_courses
+    from flaskr.db.course_shards import build_course_shards, save_course_shards
 
     db = get_db()
-    db_course_version_config = db.config.find_one({"key": "course_version"})
-    if not db_course_version_config or db_course_version_config.get(
-        "value"
-    ) < course_data.get("version"):
-        db.config.find_one_and_update(
+    # Workers share the database, so every ingest stages into collections of
+    # its own, the lock only keeps the ingests of this process in order
+    suffix = uuid4().hex
+    staging = db[f"courses_staging_{suffix}"]
+    originals_staging = db[f"course_originals_staging_{suffix}"]
+    related_staging = db[f"course_related_staging_{suffix}"]
+    with _ingest_lock:
+        try:
+            staging.create_index("code", unique=True)
+            staging.create_index(
+                [("title", "text"), ("description", "text")],
+                default_language="en",
+                weights={"title": 2, "description": 1},
+            )
+            originals_staging.create_index("code", unique=True)
+            related_staging.create_index("code", unique=True)
+
+            json_courses = course_data.get("data")
+            insert_data: list[JSON] = []
+            for json_course in json_courses.values():
+                json_string = json.dumps(json_course.get("data"))
+                course = json.loads(
+                    json_string, object_hook=lambda d: SimpleNamespace(**d)
+                )
+                course.original = json_course.get("original")
+                course.parsed = json_course.get("parsed")
+                insert_data.append(course.__dict__)
+            change_set = _diff_course_data(db, insert_data)
+            originals = [
+                {"code": course["code"], "original": course.pop("original")}
+                for course in insert_data
+            ]
+            related = compute_related_courses(insert_data)
+            shards = build_course_shards(insert_data)
+            if insert_data:
+                staging.insert_many(insert_data)
+                originals_staging.insert_many(originals)
+            if related:
+                related_staging.insert_many(related)
+            staging.rename("courses", dropTarget=True)
+            originals_staging.rename("course_originals", dropTarget=True)
+            related_staging.rename("course_related", dropTarget=True)
+            save_course_shards(db, shards, course_data.get("version"))
+        finally:
+            # Left behind only if the ingest failed before renaming them
+            for collection in (staging, originals_staging, related_staging):
+                collection.drop()
+
+        previous_config = db.config.find_one_and_update(
             {"key": "course_version"},
-            {"$set": {"value": course_data.get("version")}},
+            {
+                "$set": {
+                    "value": course_data.get("version"),
+                    "layout": COURSE_LAYOUT_VERSION,
+                    "ingested_at": datetime.now(timezone.utc),
+                }
+            },
             upsert=True,
         )
-        db.courses.drop()
-        db.courses.create_index("code", unique=True)
-        db.courses.create_index(
-            [("title", "text"), ("description", "text")],
-            default_language="en",
-            weights={"title": 2, "description": 1},
+        if any(change_set.values()):
+            db.course_changes.insert_one(
+                {
+                    "version": course_data.get("version"),
+                    "previous_version": (
+                        previous_config.get("value") if previous_config else None
+                    ),
+                    "ingested_at": datetime.now(timezone.utc),
+                    **change_set,
+                }
+            )
+
+    get_db_logger().info(
+        "Ingested course data version {version} with {count} courses".format(
+            version=course_data.get("version"), count=len(insert_data)
         )
-        json_courses = course_data.get("data")
-        insert_data: list[JSON] = []
-        for json_course in json_courses.values():
-            json_string = json.dumps(json_course.get("data"))
-            course = json.loads(json_string, object_hook=lambda d: SimpleNamespace(**d))
-            course.original = json_course.get("original")
-            course.parsed = json_course.get("parsed")
-            insert_data.append(course.__dict__)
-        db.courses.insert_many(insert_data)
+    )
+
+    # Make this worker pick up the new catalog on its next request,
+    # other workers notice the version change on their next periodic check
+    from flaskr.db.catalog import expire_catalog
+
+    expire_catalog()
+
+
+def _diff_course_data(
+    db: Database[JSON], insert_data: list[JSON]
+) -> dict[str, list[str]]:
+    """
+    Compare the courses about to be ingested with the ones currently stored.
+
+    :return: the sorted codes of added, changed and removed courses.
+    """
+    current = {
+        course["code"]: course
+        for course in db.courses.find({}, projection={"_id": False})
+    }
+    for course_original in db.course_originals.find({}, projection={"_id": False}):
+        if course_original["code"] in current:
+            current[course_original["code"]]["original"] = course_original["original"]
+    new_codes = {course["code"] for course in insert_data}
+    return {
+        "added": sorted(new_codes - current.keys()),
+        "changed": sorted(
+            course["code"]
+            for course in insert_data
+            if course["code"] in current and current[course["code"]] != course
+        ),
+        "removed": sorted(current.keys() - new_codes),
+    }
+
+
+def reload_course_data():
+    """
+    Ingest the course data file again if it carries a newer version.
+
+    Intended to run in a background thread, hence errors are logged instead of raised.
+
+    :return: True if a new version was ingested.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    try:
+        course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+        assert course_data_filename, "COURSE_DATA_FILENAME not set in the environment"
 
+        course_data = load_course_data(course_data_filename)
+        if not _is_newer_course_version(course_data):
+            get_db_logger().info("Course data is up to date, skipping reload")
+            return False
+        ingest_course_data(course_data)
+        return True
+    except Exception:
+        get_db_logger().exception("Failed to reload course data")
+        return False
+
+
+def _is_newer_course_version(course_data: JSON):
+    db_course_version_config = get_db().config.find_one({"key": "course_version"})
+    return (
+        not db_course_version_config
+        or db_course_version_config.get("value") < course_data.get("version")
+        # Courses stored with an older layout have to be ingested again
+        or db_course_version_config.get("layout") != COURSE_LAYOUT_VERSION
+    )
+
+
+def _migrate_semester_plan_owners(db: Database[JSON]):
+    """
+    Copy the user ID of the course plans onto their semester plans created
+    before semester plans carried it, and delete the semester plans left
+    behind by deleted course plans, so nothing is left to migrate.
+    """
+    if not db.semester_plans.find_one({"user_id": None}, projection={"_id": True}):
+        return
+    db.semester_plans.aggregate(
+        [
+            {"$match": {"user_id": None}},
+            {
+                "$lookup": {
+                    "from": "course_plans",
+                    "localField": "course_plan_id",
+                    "foreignField": "_id",
+                    "as": "course_plan",
+                }
+            },
+            {"$unwind": "$course_plan"},
+            {"$project": {"user_id": "$course_plan.user_id"}},
+            {
+                "$merge": {
+                    "into": "semester_plans",
+                    "on": "_id",
+                    "whenMatched": "merge",
+                    "whenNotMatched": "discard",
+                }
+            },
+        ]
+    )
+    # Semester plans still without owner belong to deleted course plans and
+    # can no longer be reached
+    course_plan_ids = db.semester_plans.distinct("course_plan_id", {"user_id": None})
+    existing = set(db.course_plans.distinct("_id", {"_id": {"$in": course_plan_ids}}))
+    orphans = [
+        course_plan_id
+        for course_plan_id in course_plan_ids
+        if course_plan_id not in existing
+    ]
+    if orphans:
+        db.semester_plans.delete_many(
+            {"user_id": None, "course_plan_id": {"$in": orphans}}
+        )
+    get_db_logger().info("Migrated the owners of semester plans")
+
+
+def _migrate_semester_plan_courses(db: Database[JSON]):
+    """
+    Normalize the course codes of semester plans saved before updates checked
+    them, e.g. "csci 3100" becomes "CSCI3100", and drop the codes that are
+    still invalid, so every stored code can be removed or moved again.
+    """
+    requests: list[UpdateOne] = []
+    for semester_plan in db.semester_plans.find(
+        {"courses": {"$elemMatch": {"$not": {"$regex": COURSE_CODE_PATTERN}}}},
+        projection={"courses": True},
+    ):
+        courses: list[str] = []
+        for code in semester_plan["courses"]:
+            code = re.sub(r"[\s-]", "", str(code)).upper()
+            if re.match(COURSE_CODE_PATTERN, code) and code not in courses:
+                courses.append(code)
+        if courses != semester_plan["courses"]:
+            requests.append(
+                UpdateOne({"_id": semester_plan["_id"]}, {"$set": {"courses": courses}})
+            )
+    if requests:
+        db.semester_plans.bulk_write(requests, ordered=False)
+        get_db_logger().info("Migrated the courses of semester plans")
+
+
+def init_db():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+
+    assert course_data_filename, "COURSE_DATA_FILENAME not set in the environment"
+
+    course_data = load_course_data(course_data_filename)
+
+    db = get_db()
+    if _is_newer_course_version(course_data):
+        ingest_course_data(course_data)
+
+    db.course_changes.create_index("version")
+    db.course_queries.create_index("hits")
+    db.course_queries.create_index("expires_at", expireAfterSeconds=0)
+    db.course_shards.create_index(["department", "digest"], unique=True)
+    db.course_shards.create_index("versions")
     db.users.create_index("email", unique=True)
     db.users.create_index("username", unique=True, sparse=True)
+    # Covers the version checks of cached users
+    db.users.create_index(["username", "version", "_id"])
     db.semester_plans.create_index("course_plan_id")
+    db.semester_plans.create_index("user_id")
     db.semester_plans.create_index(["course_plan_id", "year", "semester"], unique=True)
     db.tokens.create_index("token", unique=True)
     db.tokens.create_index("expires_at", expireAfterSeconds=0)
-    db.course_plans.create_index("user_id")
+    # Also serves the queries on user_id alone
+    db.course_plans.create_index(["user_id", "updated_at"])
+    db.course_plan_tombstones.create_index(["user_id", "deleted_at"])
+    db.course_plan_tombstones.create_index("expires_at", expireAfterSeconds=0)
+    _migrate_semester_plan_owners(db)
+    _migrate_semester_plan_courses(db)
 
 
 def get_mongo_client():
@@ -120,12 +380,39 @@ def get_db():
     return get_mongo_client().database
 
 
+def run_transaction(callback: Callable[[ClientSession | None], T]) -> T:
+    """
+    Run a callback in a transaction, retried on transient errors.
+
+    Standalone servers do not support transactions, there the callback runs
+    once without one (its session is None) and its writes are not atomic.
+
+    :param callback: the function running the operations with the session.
+    :return: the return value of the callback.
+    """
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            with get_mongo_client().start_session() as session:
+                result = session.with_transaction(callback)
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            if _transactions_supported or e.code != ILLEGAL_OPERATION:
+                raise
+            _transactions_supported = False
+            get_db_logger().warning(
+                "Transactions are not supported by the server, running without"
+            )
+    return callback(None)
+
+
 def get_db_logger():
     global _db_logger
     if not _db_logger:
         _db_logger = logging.getLogger("database")
         _db_logger.setLevel(
-            logging.getLevelNamesMapping().get(os.getenv("LOGGING_LEVEL", "INFO")) # type: ignore
+            logging.getLevelNamesMapping().get(os.getenv("LOGGING_LEVEL", "INFO"))  # type: ignore
         )
 
         console_handler = logging.StreamHandler()
@@ -1,10 +1,14 @@
 from datetime import datetime, timezone
-from typing import ClassVar, Optional
+from typing import Annotated, ClassVar, Literal, Optional, Union
 
 from pydantic import BaseModel, ConfigDict, Field
 
 from flaskr.utils import PydanticObjectId
 
+# Course codes, e.g. "CSCI3100"
+COURSE_CODE_PATTERN = r"^[A-Z]{4}\d{4}$"
+CourseCode = Annotated[str, Field(pattern=COURSE_CODE_PATTERN)]
+
 
 class CoreModel(BaseModel):
     model_config = ConfigDict(serialize_by_alias=True)
@@ -24,6 +28,25 @@ class User(PreUser):
     major: str
     password_hash: str
     username: str
+    # Incremented on every update of the user
+    version: int = 0
+    # Incremented when the password changes, which revokes the user's sessions
+    credential_version: int = 0
+
+
+class SessionClaims(CoreModel):
+    """
+    Identity of the user logged in to a session, carried in the session cookie
+    signed with the app secret key.
+    """
+
+    user_id: PydanticObjectId
+    username: str
+    major: str
+    credential_version: int
+    expires_at: datetime
+    # When the claims were last checked against the user
+    checked_at: datetime
 
 
 class UserCreate(CoreModel):
@@ -61,13 +84,24 @@ class Course(CoreModel):
     is_graded: bool
     not_for_major: str
     not_for_taken: str
-    original: str
     parsed: bool
     prerequisites: str
     title: str
     units: float
 
 
+class CourseOriginal(CoreModel):
+    id: Optional[PydanticObjectId] = Field(alias="_id", default=None)
+    code: str
+    original: str
+
+
+class CourseHighlight(CoreModel):
+    spans: dict[str, list[tuple[int, int]]]
+    snippet: Optional[str] = None
+    snippet_spans: list[tuple[int, int]] = []
+
+
 class CourseRead(CoreModel):
     id: Optional[PydanticObjectId] = Field(alias="_id", default=None)
     code: Optional[str] = None
@@ -81,6 +115,24 @@ class CourseRead(CoreModel):
     prerequisites: Optional[str] = None
     title: Optional[str] = None
     units: Optional[float] = None
+    highlight: Optional[CourseHighlight] = None
+
+
+class CourseChangeSet(CoreModel):
+    id: Optional[PydanticObjectId] = Field(alias="_id", default=None)
+    version: int
+    previous_version: Optional[int]
+    ingested_at: datetime
+    added: list[str]
+    changed: list[str]
+    removed: list[str]
+
+
+class CourseChange(CoreModel):
+    code: str
+    change: Literal["added", "changed", "removed"]
+    version: int
+    course: Optional[CourseRead] = None
 
 
 class SemesterPlan(CoreModel):
@@ -90,6 +142,8 @@ class SemesterPlan(CoreModel):
     semester: int = Field(ge=1, le=3)
     year: int
     created_at: datetime
+    # Owner of the course plan, copied here to check ownership in one query
+    user_id: Optional[PydanticObjectId] = None
 
 
 class SemesterPlanRead(CoreModel):
@@ -99,6 +153,8 @@ class SemesterPlanRead(CoreModel):
     semester: int = Field(ge=1, le=3)
     year: int
     created_at: datetime
+    # The courses, in order, when requested with the `hydrate` argument
+    course_details: Optional[list[CourseRead]] = None
 
 
 class SemesterPlanCreate(CoreModel):
@@ -108,11 +164,52 @@ class SemesterPlanCreate(CoreModel):
 
 
 class SemesterPlanUpdate(CoreModel):
-    courses: Optional[list[str]] = None
+    courses: Optional[list[CourseCode]] = None
     semester: Optional[int] = Field(ge=1, le=3, default=None)
     year: Optional[int] = None
 
 
+class SemesterPlanCreateOperation(CoreModel):
+    op: Literal["create"]
+    courses: list[CourseCode] = []
+    semester: int = Field(ge=1, le=3)
+    year: int
+
+
+class SemesterPlanUpdateOperation(SemesterPlanUpdate):
+    op: Literal["update"]
+    semester_plan_id: PydanticObjectId
+
+
+class SemesterPlanDeleteOperation(CoreModel):
+    op: Literal["delete"]
+    semester_plan_id: PydanticObjectId
+
+
+class SemesterPlanCourseOperation(CoreModel):
+    op: Literal["add_course", "remove_course"]
+    semester_plan_id: PydanticObjectId
+    code: str = Field(pattern=COURSE_CODE_PATTERN)
+
+
+SemesterPlanOperation = Annotated[
+    Union[
+        SemesterPlanCreateOperation,
+        SemesterPlanUpdateOperation,
+        SemesterPlanDeleteOperation,
+        SemesterPlanCourseOperation,
+    ],
+    Field(discriminator="op"),
+]
+
+
+class SemesterPlanOperationResult(CoreModel):
+    # "skipped" operations were not applied as an earlier one failed
+    status: Literal["ok", "not_found", "error", "skipped"]
+    semester_plan_id: Optional[PydanticObjectId] = None
+    error: Optional[str] = None
+
+
 class CoursePlan(CoreModel):
     id: Optional[PydanticObjectId] = Field(alias="_id", default=None)
     description: str
@@ -1,16 +1,66 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Callable
 
 from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.client_session import ClientSession
 from pymongo.collection import ReturnDocument
+from pymongo.errors import BulkWriteError
 
-from flaskr.db.database import get_db
-from flaskr.db.models import SemesterPlan, SemesterPlanUpdate
+from flaskr.db.database import JSON, get_db, run_transaction
+from flaskr.db.models import (
+    SemesterPlan,
+    SemesterPlanCourseOperation,
+    SemesterPlanCreateOperation,
+    SemesterPlanDeleteOperation,
+    SemesterPlanOperation,
+    SemesterPlanOperationResult,
+    SemesterPlanUpdate,
+)
+
+# Error code of writes violating a unique index
+DUPLICATE_KEY = 11000
+
+
+def _owned(semester_plan_id: ObjectId, user_id: ObjectId | None):
+    # Semester plans carry the user ID of their course plan
+    if user_id is None:
+        return {"_id": semester_plan_id}
+    return {"_id": semester_plan_id, "user_id": user_id}
+
+
+def _touch_course_plan(course_plan_id: ObjectId, session: ClientSession | None = None):
+    # Changes to semester plans are picked up by delta syncs of the course plan
+    get_db().course_plans.update_one(
+        {"_id": course_plan_id},
+        {"$set": {"updated_at": datetime.now(timezone.utc)}},
+        session=session,
+    )
+
+
+def _write_and_touch(write: Callable[[ClientSession | None], JSON | None]):
+    """
+    Run a write returning a semester plan document and touch its course plan
+    in the same transaction.
+
+    Without transactions the touch is a second write, which still lands after
+    the change, so a delta sync in between only delays it to the next sync.
+    """
+
+    def callback(session: ClientSession | None):
+        doc = write(session)
+        if doc:
+            _touch_course_plan(doc["course_plan_id"], session=session)
+        return doc
+
+    return run_transaction(callback)
 
 
 def create_semester_plan(
     course_plan_id: ObjectId,
     semester: int,
     year: int,
+    user_id: ObjectId | None = None,
 ):
     # Ensure the compound key (year, semester) does not exist in the database
     if get_semester_plan_by_attributes(
@@ -24,17 +74,27 @@ def create_semester_plan(
         year=year,
         course_plan_id=ObjectId(course_plan_id),
         created_at=datetime.now(),  # Set the created_at field
+        user_id=user_id,
     )
 
     db = get_db().semester_plans
-    result = db.insert_one(semester_plan.__dict__)
-    semester_plan.id = result.inserted_id
+
+    def insert(session: ClientSession | None):
+        result = db.insert_one(semester_plan.__dict__, session=session)
+        _touch_course_plan(semester_plan.course_plan_id, session=session)
+        return result.inserted_id
+
+    semester_plan.id = run_transaction(insert)
     return semester_plan
 
 
-def get_semester_plan(semester_plan_id: ObjectId):
+def get_semester_plan(semester_plan_id: ObjectId, user_id: ObjectId | None = None):
+    """
+    Return the semester plan of the specified ID, only if it belongs to the
+    user when a user ID is given.
+    """
     db = get_db().semester_plans
-    doc = db.find_one({"_id": semester_plan_id})
+    doc = db.find_one(_owned(semester_plan_id, user_id))
     return SemesterPlan.model_validate(doc) if doc else None
 
 
@@ -46,22 +106,273 @@ def get_semester_plan_by_attributes(course_plan_id: ObjectId, semester: int, yea
     return SemesterPlan.model_validate(doc) if doc else None
 
 
-def update_semester_plan(semester_plan_id: ObjectId, updates: SemesterPlanUpdate):
+def update_semester_plan(
+    semester_plan_id: ObjectId,
+    updates: SemesterPlanUpdate,
+    user_id: ObjectId | None = None,
+):
+    """
+    Update the semester plan of the specified ID, only if it belongs to the
+    user when a user ID is given.
+    """
+    db = get_db().semester_plans
+    doc = _write_and_touch(
+        lambda session: db.find_one_and_update(
+            _owned(semester_plan_id, user_id),
+            {"$set": updates.model_dump(exclude_none=True)},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+    )
+    return SemesterPlan.model_validate(doc) if doc else None
+
+
+def delete_semester_plan(semester_plan_id: ObjectId, user_id: ObjectId | None = None):
+    """
+    Delete the semester plan of the specified ID, only if it belongs to the
+    user when a user ID is given.
+    """
     db = get_db().semester_plans
-    doc = db.find_one_and_update(
-        {"_id": semester_plan_id},
-        {"$set": updates.model_dump(exclude_none=True)},
-        return_document=ReturnDocument.AFTER,
+    doc = _write_and_touch(
+        lambda session: db.find_one_and_delete(
+            _owned(semester_plan_id, user_id), session=session
+        )
     )
     return SemesterPlan.model_validate(doc) if doc else None
 
 
-def delete_semester_plan(semester_plan_id: ObjectId):
+def add_semester_plan_course(
+    semester_plan_id: ObjectId, code: str, user_id: ObjectId | None = None
+):
+    """
+    Add a course to the semester plan of the specified ID, unless already in it.
+
+    :return: the updated SemesterPlan object, or None if not found.
+    """
     db = get_db().semester_plans
-    doc = db.find_one_and_delete({"_id": semester_plan_id})
+    doc = _write_and_touch(
+        lambda session: db.find_one_and_update(
+            _owned(semester_plan_id, user_id),
+            {"$addToSet": {"courses": code}},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+    )
     return SemesterPlan.model_validate(doc) if doc else None
 
 
+def remove_semester_plan_course(
+    semester_plan_id: ObjectId, code: str, user_id: ObjectId | None = None
+):
+    """
+    Remove a course from the semester plan of the specified ID, if in it.
+
+    :return: the updated SemesterPlan object, or None if not found.
+    """
+    db = get_db().semester_plans
+    doc = _write_and_touch(
+        lambda session: db.find_one_and_update(
+            _owned(semester_plan_id, user_id),
+            {"$pull": {"courses": code}},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+    )
+    return SemesterPlan.model_validate(doc) if doc else None
+
+
+def move_semester_plan_course(
+    semester_plan_id: ObjectId,
+    target_semester_plan_id: ObjectId,
+    code: str,
+    user_id: ObjectId | None = None,
+):
+    """
+    Move a course from a semester plan to another of the same course plan, in
+    a transaction.
+
+    :param semester_plan_id: the ID of the semester plan holding the course.
+    :param target_semester_plan_id: the ID of the semester plan to move it to.
+    :param code: the course code.
+    :param user_id: if given, both semester plans must belong to this user.
+    :return: the updated source and target SemesterPlan objects, or None if
+        the course is not in the source or the target is not in the same
+        course plan.
+    """
+    if semester_plan_id == target_semester_plan_id:
+        return None
+    db = get_db().semester_plans
+
+    def move(session: ClientSession | None):
+        source = db.find_one(
+            {**_owned(semester_plan_id, user_id), "courses": code},
+            projection={"course_plan_id": True},
+            session=session,
+        )
+        if not source:
+            return None
+        # The target is updated first, so that without a transaction a failure
+        # leaves the course in both semester plans rather than in neither
+        target = db.find_one_and_update(
+            {
+                **_owned(target_semester_plan_id, user_id),
+                "course_plan_id": source["course_plan_id"],
+            },
+            {"$addToSet": {"courses": code}},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not target:
+            return None
+        source = db.find_one_and_update(
+            {"_id": semester_plan_id},
+            {"$pull": {"courses": code}},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if not source:
+            return None
+        _touch_course_plan(source["course_plan_id"], session=session)
+        return (
+            SemesterPlan.model_validate(source),
+            SemesterPlan.model_validate(target),
+        )
+
+    return run_transaction(move)
+
+
+def apply_semester_plan_operations(
+    course_plan_id: ObjectId,
+    operations: list[SemesterPlanOperation],
+    user_id: ObjectId,
+):
+    """
+    Apply a batch of operations to the semester plans of a course plan with a
+    single ordered bulk write, in a transaction where supported.
+
+    Ownership of the course plan is checked once, operations on semester plans
+    not in the course plan are reported as not found and left out. Operations
+    apply in order until the first failing one, after which none apply. In a
+    transaction, a failure rolls back the earlier operations too.
+
+    :param course_plan_id: the ID of the course plan.
+    :param operations: the operations to apply.
+    :param user_id: the ID of the user who owns the course plan.
+    :return: the result of every operation, or None if the course plan is not
+        found.
+    """
+    db = get_db()
+    course_plans_collection = db.course_plans
+    semester_plans_collection = db.semester_plans
+    results: list[SemesterPlanOperationResult] = []
+    # Index of the operation of every write request
+    positions: list[int] = []
+    transactional = False
+
+    def apply(session: ClientSession | None):
+        nonlocal results, positions, transactional
+        transactional = session is not None
+        if not course_plans_collection.find_one(
+            {"_id": course_plan_id, "user_id": user_id},
+            projection={"_id": True},
+            session=session,
+        ):
+            return None
+        existing = {
+            doc["_id"]
+            for doc in semester_plans_collection.find(
+                {"course_plan_id": course_plan_id},
+                projection={"_id": True},
+                session=session,
+            )
+        }
+
+        results, positions = [], []
+        requests: list[InsertOne[JSON] | UpdateOne | DeleteOne] = []
+        for i, operation in enumerate(operations):
+            if isinstance(operation, SemesterPlanCreateOperation):
+                semester_plan = SemesterPlan(
+                    _id=ObjectId(),
+                    course_plan_id=course_plan_id,
+                    courses=operation.courses,
+                    semester=operation.semester,
+                    year=operation.year,
+                    created_at=datetime.now(),
+                    user_id=user_id,
+                )
+                assert semester_plan.id is not None
+                existing.add(semester_plan.id)
+                requests.append(InsertOne(semester_plan.model_dump()))
+                positions.append(i)
+                results.append(
+                    SemesterPlanOperationResult(
+                        status="ok", semester_plan_id=semester_plan.id
+                    )
+                )
+                continue
+
+            semester_plan_id = operation.semester_plan_id
+            if semester_plan_id not in existing:
+                results.append(
+                    SemesterPlanOperationResult(
+                        status="not_found", semester_plan_id=semester_plan_id
+                    )
+                )
+                continue
+
+            owned = {"_id": semester_plan_id, "course_plan_id": course_plan_id}
+            request: UpdateOne | DeleteOne | None = None
+            if isinstance(operation, SemesterPlanDeleteOperation):
+                existing.discard(semester_plan_id)
+                request = DeleteOne(owned)
+            elif isinstance(operation, SemesterPlanCourseOperation):
+                update = "$addToSet" if operation.op == "add_course" else "$pull"
+                request = UpdateOne(owned, {update: {"courses": operation.code}})
+            else:
+                data = operation.model_dump(
+                    exclude_none=True, exclude={"op", "semester_plan_id"}
+                )
+                # An update without any field is a no-op
+                request = UpdateOne(owned, {"$set": data}) if data else None
+            if request:
+                requests.append(request)
+                positions.append(i)
+            results.append(
+                SemesterPlanOperationResult(
+                    status="ok", semester_plan_id=semester_plan_id
+                )
+            )
+
+        if requests:
+            semester_plans_collection.bulk_write(
+                requests, ordered=True, session=session
+            )
+            _touch_course_plan(course_plan_id, session=session)
+        return results
+
+    try:
+        return run_transaction(apply)
+    except BulkWriteError as e:
+        write_error = e.details["writeErrors"][0]
+        failed = positions[write_error["index"]]
+        for i, result in enumerate(results):
+            if result.status != "ok":
+                continue
+            if i == failed:
+                result.status = "error"
+                result.error = (
+                    "Semester plan with same semester and year already exists"
+                    if write_error["code"] == DUPLICATE_KEY
+                    else write_error["errmsg"]
+                )
+            elif i > failed or transactional:
+                result.status = "skipped"
+        # Without a transaction, the operations before the failing one applied
+        if not transactional and write_error["index"] > 0:
+            _touch_course_plan(course_plan_id)
+        return results
+
+
 def get_semester_plans_by_course_plan(course_plan_id: ObjectId):
     db = get_db().semester_plans
     docs = db.find({"course_plan_id": course_plan_id})
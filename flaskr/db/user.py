@@ -1,11 +1,22 @@
+import os
 from datetime import datetime, timezone
 from hashlib import sha256
+from time import monotonic
 
+from bson import ObjectId
 from pymongo.collection import ReturnDocument
 
 from flaskr.db.database import get_db
 from flaskr.db.models import PreUser, ResetToken, User, UserCreate, UserUpdate
-from flaskr.utils import KeyGenerator, PasswordHasher
+from flaskr.utils import KeyGenerator, LRUCache, PasswordHasher
+
+# Number of users cached per worker for resolving sessions
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+# Seconds a cached user is trusted before its version is checked again, which
+# bounds how long an update made by another worker goes unnoticed
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "5"))
+
+_user_cache: LRUCache[str, tuple[User, float]] = LRUCache(USER_CACHE_SIZE)
 
 
 def activate_user(pre_user: PreUser, user_create: UserCreate):
@@ -33,9 +44,13 @@ def activate_user(pre_user: PreUser, user_create: UserCreate):
     userdb = get_db().users
     doc = userdb.find_one_and_update(
         {"_id": user.id},
-        {"$set": user.model_dump(exclude_none=True, exclude={"id"})},
+        {
+            "$set": user.model_dump(exclude_none=True, exclude={"id", "version"}),
+            "$inc": {"version": 1},
+        },
         return_document=ReturnDocument.AFTER,
     )
+    _user_cache.pop(user.username)
 
     return User.model_validate(doc) if doc else None
 
@@ -74,6 +89,68 @@ def get_user_by_username(username: str):
     return User.model_validate(doc) if doc else None
 
 
+def get_cached_user_by_username(username: str):
+    """
+    Fetch a user by username through the user cache of this worker.
+
+    A cached user is returned as is for `USER_CACHE_TTL` seconds. After that
+    only its ID and version are read, from the `(username, version, _id)`
+    index, and the full user is fetched again if either changed, e.g. when the
+    username was registered again by another user.
+
+    Note: Remember to parse with `UserRead` model to avoid exposing sensitive data.
+    """
+    entry = _user_cache.get(username)
+    if entry:
+        user, checked_at = entry
+        if monotonic() - checked_at < USER_CACHE_TTL:
+            return user.model_copy()
+
+        userdb = get_db().users
+        doc = userdb.find_one(
+            {"username": username}, projection={"_id": True, "version": True}
+        )
+        if doc and doc["_id"] == user.id and doc.get("version", 0) == user.version:
+            _user_cache.set(username, (user, monotonic()))
+            return user.model_copy()
+
+    user = get_user_by_username(username)
+    if user:
+        _user_cache.set(username, (user, monotonic()))
+    else:
+        _user_cache.pop(username)
+    return user.model_copy() if user else None
+
+
+def get_user_credentials(user_id: ObjectId):
+    """
+    Fetch the fields of a user that sessions carry, to revalidate them.
+
+    :return: a document with the username, major and credential version, or
+        None if the user does not exist.
+    """
+    userdb = get_db().users
+    doc = userdb.find_one(
+        {"_id": user_id},
+        projection={
+            "_id": False,
+            "username": True,
+            "major": True,
+            "credential_version": True,
+        },
+    )
+    if doc:
+        doc.setdefault("credential_version", 0)
+    return doc
+
+
+def clear_user_cache():
+    """
+    Drop all users cached by this worker.
+    """
+    _user_cache.clear()
+
+
 def get_user_by_email(email: str):
     """
     Fetch a user by email.
@@ -96,14 +173,19 @@ def update_user(username: str, user_update: UserUpdate):
     """
     userdb = get_db().users
     data = user_update.model_dump(exclude_none=True, exclude={"password"})
+    increments = {"version": 1}
     if user_update.password:
         data["password_hash"] = PasswordHasher.hash_password(user_update.password)
+        increments["credential_version"] = 1
 
     doc = userdb.find_one_and_update(
         {"username": username},
-        {"$set": data},
+        {"$set": data, "$inc": increments},
         return_document=ReturnDocument.AFTER,
     )
+    _user_cache.pop(username)
+    if user_update.username:
+        _user_cache.pop(user_update.username)
     return User.model_validate(doc) if doc else None
 
 
@@ -113,6 +195,7 @@ def delete_user(username: str):
     """
 
     userdb = get_db().users
+    _user_cache.pop(username)
     user = userdb.find_one({"username": username})
     if user:
         doc = userdb.find_one_and_delete(user)
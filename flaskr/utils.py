@@ -1,9 +1,13 @@
 import logging
 import secrets
 import string
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from hashlib import sha256
 from logging import LogRecord
-from typing import Any, Literal, Mapping
+from time import monotonic
+from typing import Any, Callable, Generic, Hashable, Literal, Mapping, TypeVar
 
 from argon2 import PasswordHasher as ArgonPasswordHasher
 from bson import ObjectId
@@ -94,6 +98,94 @@ class PasswordHasher:
             return False
 
 
+R = TypeVar("R")
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe least recently used cache with an optional time to live.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single execution.
+
+    Callers arriving while a call with their key is in flight wait for it and
+    share its result (or exception) instead of executing it again. Shared
+    results must not be mutated by the callers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future[Any]] = {}
+
+    def do(self, key: Hashable, func: Callable[[], R]) -> tuple[R, bool]:
+        """
+        Execute `func` unless a call with the same key is already in flight.
+
+        :return: the result and whether it was shared from another call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            shared = future is not None
+            if not future:
+                future = self._calls[key] = Future()
+
+        if shared:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
 class DataProjection:
     user = {"license_key_hash": False, "password_hash": False}
 
@@ -5,6 +5,7 @@ from flask import Flask
 
 from flaskr import create_app
 from flaskr.db.database import get_mongo_client
+from flaskr.db.user import clear_user_cache
 
 # Use a separate database name for testing to avoid clashing with production data.
 TEST_DB_NAME = "TESTDB"
@@ -38,15 +39,20 @@ def get_db(monkeypatch: pytest.MonkeyPatch):
     # Note: setattr must be done to all files that imports get_db directly
     # https://stackoverflow.com/a/45466846
     monkeypatch.setattr("flaskr.db.database.get_db", mock_get_db)
+    monkeypatch.setattr("flaskr.db.catalog.get_db", mock_get_db)
     monkeypatch.setattr("flaskr.db.user.get_db", mock_get_db)
     monkeypatch.setattr("flaskr.db.course_plans.get_db", mock_get_db)
     monkeypatch.setattr("flaskr.db.courses.get_db", mock_get_db)
+    monkeypatch.setattr("flaskr.db.course_queries.get_db", mock_get_db)
+    monkeypatch.setattr("flaskr.db.course_shards.get_db", mock_get_db)
     monkeypatch.setattr("flaskr.db.semester_plans.get_db", mock_get_db)
 
     yield mock_get_db
     # Clean up the test database after tests
     if mock_used:
         get_mongo_client().drop_database(TEST_DB_NAME)
+    # Cached users would outlive the dropped database
+    clear_user_cache()
 
 
 @pytest.fixture
@@ -1,18 +1,26 @@
 import random
+import time
 from datetime import datetime, timedelta, timezone
 
 import pytest
 from flask.testing import FlaskClient
 
-from flaskr.api.exceptions import NotFound, Unauthorized
+from flaskr.api.exceptions import BadRequest, NotFound, Unauthorized
 from flaskr.api.respmodels import (
     CoursePlanResponseModel,
+    CoursePlanSyncResponseModel,
     CoursePlanWithSemestersResponseModel,
     ResponseModel,
 )
 from flaskr.db.course_plans import create_course_plan
-from flaskr.db.semester_plans import create_semester_plan
-from flaskr.db.models import CoursePlan, CoursePlanRead, CoursePlanUpdate, User
+from flaskr.db.semester_plans import create_semester_plan, update_semester_plan
+from flaskr.db.models import (
+    CoursePlan,
+    CoursePlanRead,
+    CoursePlanUpdate,
+    SemesterPlanUpdate,
+    User,
+)
 from tests.utils import GetDatabase, random_string, random_user
 
 
@@ -129,6 +137,65 @@ def test_get_all_course_plans(
         )
 
 
+def test_sync_course_plans(
+    logged_in_client: FlaskClient, course_plans: list[CoursePlan]
+):
+    semester_plan = create_semester_plan(
+        course_plan_id=course_plans[0].id, semester=1, year=2025
+    )
+    assert semester_plan is not None and semester_plan.id is not None
+    time.sleep(0.01)
+    # Stored times only keep milliseconds
+    now = datetime.now(timezone.utc)
+    since = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    time.sleep(0.01)
+
+    # Semester plan changes count as changes of their course plan
+    update_semester_plan(semester_plan.id, SemesterPlanUpdate(courses=["CSCI3100"]))
+    response = logged_in_client.delete(f"/api/course-plans/{course_plans[1].id}")
+    assert response.status_code == 200
+
+    response = logged_in_client.get(
+        "/api/course-plans/", query_string={"since": since.isoformat()}
+    )
+    assert response.status_code == 200
+    res = CoursePlanSyncResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert not res.data.full_sync
+    assert [plan.id for plan in res.data.course_plans] == [course_plans[0].id]
+    assert res.data.deleted == [course_plans[1].id]
+    assert res.data.synced_at < datetime.now(timezone.utc)
+
+    # Nothing changed since the previous sync
+    response = logged_in_client.get(
+        "/api/course-plans/",
+        query_string={"since": datetime.now(timezone.utc).isoformat()},
+    )
+    res = CoursePlanSyncResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.course_plans == [] and res.data.deleted == []
+
+    # Deletions that long ago are forgotten, all course plans are returned
+    response = logged_in_client.get(
+        "/api/course-plans/",
+        query_string={"since": (since - timedelta(days=365)).isoformat()},
+    )
+    res = CoursePlanSyncResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.full_sync
+    assert len(res.data.course_plans) == len(course_plans) - 1
+    assert res.data.deleted == []
+
+
+def test_sync_course_plans_with_invalid_since(logged_in_client: FlaskClient):
+    response = logged_in_client.get(
+        "/api/course-plans/", query_string={"since": "yesterday"}
+    )
+    assert response.status_code == BadRequest.status_code
+    res = ResponseModel.model_validate(response.json)
+    assert isinstance(res.error, BadRequest)
+
+
 def test_get_course_plan(logged_in_client: FlaskClient, course_plans: list[CoursePlan]):
     for plan in course_plans:
         response = logged_in_client.get(f"/api/course-plans/{plan.id}")
@@ -148,6 +215,68 @@ def test_get_course_plan(logged_in_client: FlaskClient, course_plans: list[Cours
         assert isinstance(course_plans_response.data.semester_plans, list)
 
 
+def test_get_hydrated_course_plan(
+    logged_in_client: FlaskClient, course_plans: list[CoursePlan], test_user: User
+):
+    plan = course_plans[0]
+    assert plan.id is not None
+    for semester, courses in [(2, ["CSCI3100"]), (1, ["MATH2028", "CSCI3100"])]:
+        semester_plan = create_semester_plan(plan.id, semester, 2025, test_user.id)
+        assert semester_plan is not None and semester_plan.id is not None
+        update_semester_plan(semester_plan.id, SemesterPlanUpdate(courses=courses))
+
+    response = logged_in_client.get(f"/api/course-plans/{plan.id}?hydrate=basic")
+    assert response.status_code == 200
+    res = CoursePlanWithSemestersResponseModel.model_validate(response.json)
+    assert res.data is not None
+    details = [
+        [course.code for course in semester_plan.course_details or []]
+        for semester_plan in res.data.semester_plans
+    ]
+    assert details == [["MATH2028", "CSCI3100"], ["CSCI3100"]]
+
+
+def test_clone_course_plan(
+    logged_in_client: FlaskClient,
+    course_plans: list[CoursePlan],
+    test_user: User,
+    test_user2: User,
+):
+    plan = course_plans[0]
+    assert plan.id is not None
+    for semester, courses in [(2, ["CSCI3100"]), (1, ["MATH2028", "CSCI3100"])]:
+        semester_plan = create_semester_plan(plan.id, semester, 2025, test_user.id)
+        assert semester_plan is not None and semester_plan.id is not None
+        update_semester_plan(semester_plan.id, SemesterPlanUpdate(courses=courses))
+
+    response = logged_in_client.post(f"/api/course-plans/{plan.id}/clone")
+    assert response.status_code == 200
+    res = CoursePlanWithSemestersResponseModel.model_validate(response.json)
+    assert res.data is not None
+    clone = res.data.course_plan
+    assert clone.id != plan.id
+    assert clone.name == f"{plan.name} (copy)"
+    assert clone.description == plan.description
+    assert clone.user_id == test_user.id
+    assert [
+        (semester_plan.semester, semester_plan.courses)
+        for semester_plan in res.data.semester_plans
+    ] == [(1, ["MATH2028", "CSCI3100"]), (2, ["CSCI3100"])]
+
+    # The clone is a plan of its own
+    response = logged_in_client.get(f"/api/course-plans/{clone.id}")
+    assert response.status_code == 200
+    assert CoursePlanWithSemestersResponseModel.model_validate(response.json) == res
+    response = logged_in_client.get("/api/course-plans/")
+    assert len(response.get_json()["data"]) == len(course_plans) + 1
+
+    with logged_in_client.session_transaction() as session:
+        session.clear()
+        session["username"] = test_user2.username
+    response = logged_in_client.post(f"/api/course-plans/{plan.id}/clone")
+    assert response.status_code == NotFound.status_code
+
+
 def update_subtest(
     plan: CoursePlan,
     logged_in_client: FlaskClient,
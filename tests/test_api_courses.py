@@ -1,12 +1,21 @@
+import gzip
 import json
 import os
 
 import pytest
 from flask.testing import FlaskClient
-
-from flaskr.api.exceptions import BadRequest
-from flaskr.api.respmodels import CoursesResponseModel
+from pymongo.errors import ExecutionTimeout
+
+from flaskr.api.exceptions import BadRequest, NotFound, Unauthorized
+from flaskr.api.respmodels import (
+    CourseOriginalResponseModel,
+    CourseResponseModel,
+    CourseShardsResponseModel,
+    CoursesResponseModel,
+)
+from flaskr.db.catalog import get_catalog
 from flaskr.db.models import Course
+from tests.utils import GetDatabase, random_user
 
 
 @pytest.mark.parametrize(
@@ -249,3 +258,367 @@ def test_course_fetch_limit_value(limit, page, valid, client: FlaskClient):
     else:
         assert response.status_code == BadRequest.status_code
         assert res.status == "ERROR"
+
+
+def test_course_original(client: FlaskClient):
+    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+    assert course_data_filename is not None, "COURSE_DATA_FILENAME is not set"
+    course_data = json.load(open(course_data_filename))
+
+    # Listings never carry the original text
+    response = client.get("/api/courses/?limit=2147483647")
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert all(course.original is None for course in res.data)
+
+    response = client.get("/api/courses/MATH2028/original")
+    assert response.status_code == 200
+    res = CourseOriginalResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    assert res.data is not None
+    assert res.data.code == "MATH2028"
+    assert res.data.original == course_data["data"]["MATH2028"]["original"]
+
+    response = client.get("/api/courses/ZZZZ9999/original")
+    assert response.status_code == NotFound.status_code
+    res = CourseOriginalResponseModel.model_validate(response.json)
+    assert res.status == "ERROR"
+
+
+def test_course_detail(client: FlaskClient):
+    response = client.get("/api/courses/MATH2028")
+    assert response.status_code == 200
+    res = CourseResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    assert res.data is not None
+    assert res.data.code == "MATH2028"
+    assert res.data.title == "Honours Advanced Calculus II"
+    assert "max-age" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+
+    # Codes are case insensitive
+    response = client.get("/api/courses/math2028")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/api/courses/MATH2028", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Another projection is another representation
+    response = client.get("/api/courses/MATH2028?basic=true")
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    res = CourseResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert set(res.data.model_dump(exclude_none=True, by_alias=False).keys()) == set(
+        ("id", "code", "title", "units")
+    )
+
+    response = client.get("/api/courses/ZZZZ9999")
+    assert response.status_code == NotFound.status_code
+    res = CourseResponseModel.model_validate(response.json)
+    assert res.status == "ERROR"
+
+
+@pytest.mark.parametrize(
+    "input",
+    [
+        (["MATH"]),
+        (["engiNEERing", "matheMAtics"]),
+        (["Badminton"]),
+        (["PHED", "calculus"]),
+    ],
+)
+def test_search_modes_agree(
+    input: list[str], client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Test if the parallel search mode returns the same pages as the aggregation mode
+    """
+    results: dict[str, list] = {}
+    for mode in ["aggregate", "parallel"]:
+        monkeypatch.setattr("flaskr.db.courses.COURSE_SEARCH_MODE", mode)
+        # Do not let the other mode answer from the search cache
+        get_catalog().search_cache.clear()
+        results[mode] = []
+        for page in [1, 2, 3]:
+            response = client.get(
+                f"/api/courses/?limit=2&page={page}&basic=true&{'&'.join(f'keywords[]={x}' for x in input)}"
+            )
+            assert response.status_code == 200
+            res = CoursesResponseModel.model_validate(response.json)
+            assert res.status == "OK"
+            assert res.data is not None
+            results[mode].append([course.code for course in res.data])
+    assert results["aggregate"] == results["parallel"]
+
+
+@pytest.mark.parametrize(
+    "input, expected",
+    [
+        (["math 2028"], ["MATH2028"]),
+        # Separate keywords are alternatives, any MATH course or any 2028
+        (["math", "2028"], ["MATH2028", "MATH2070"]),
+        (["csci-3100"], ["CSCI3100"]),
+        ([".*"], []),
+    ],
+)
+def test_normalized_course_code_search(
+    input: list[str], expected: list[str], client: FlaskClient
+):
+    """
+    Test if course code shaped keywords are normalized and other keywords are escaped
+    """
+    response = client.get(
+        f"/api/courses/?strict=true&{'&'.join(f'keywords[]={x}' for x in input)}"
+    )
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    assert res.data is not None
+    assert [course.code for course in res.data] == expected
+
+
+def test_search_time_limit_degrades(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Test if a search running out of time falls back to a code search on the catalog
+    """
+
+    def timeout(*args, **kwargs):
+        raise ExecutionTimeout("operation exceeded time limit")
+
+    with monkeypatch.context() as m:
+        m.setattr("flaskr.db.courses._search_parallel", timeout)
+        m.setattr("flaskr.db.courses._search_aggregate", timeout)
+
+        response = client.get("/api/courses/?keywords[]=MATH&keywords[]=calculus")
+        assert response.status_code == 200
+        res = CoursesResponseModel.model_validate(response.json)
+        assert res.status == "OK"
+        assert res.degraded is True
+        assert res.data is not None
+        assert len(res.data) >= 1
+        assert all(course.code.startswith("MATH") for course in res.data)
+
+    response = client.get("/api/courses/?keywords[]=MATH&keywords[]=calculus")
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.degraded is None
+
+
+def test_course_filter_time_limit_degrades(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Test if a filter whose full-text part runs out of time falls back to its
+    field predicates, and to no course without any
+    """
+
+    def timeout(*args, **kwargs):
+        raise ExecutionTimeout("operation exceeded time limit")
+
+    monkeypatch.setattr("flaskr.db.courses._filter_text", timeout)
+    monkeypatch.setattr("flaskr.db.courses._filter_index", timeout)
+
+    response = client.get("/api/courses/", query_string={"q": "dept:MATH calculus"})
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.degraded is True
+    assert res.data is not None and len(res.data) >= 1
+    assert all(course.code.startswith("MATH") for course in res.data)
+
+    response = client.get("/api/courses/", query_string={"q": "calculus"})
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.degraded is True
+    assert res.data == []
+
+
+@pytest.mark.parametrize(
+    "q, valid",
+    [
+        ("dept:CSCI units:>=3", True),
+        ("dept:CSCI units:>=3 graded:true programming", True),
+        ("units:lots", False),
+        ("semester:1", False),
+    ],
+)
+def test_course_filter_query(q: str, valid: bool, client: FlaskClient):
+    """
+    Test if field-qualified queries only return courses satisfying every field
+    """
+    response = client.get("/api/courses/", query_string={"q": q})
+    if not valid:
+        assert response.status_code == 400
+        return
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    for course in res.data:
+        assert course.code is not None and course.code.startswith("CSCI")
+        assert course.units is not None and course.units >= 3
+
+
+def test_course_filter_keywords_conflict(client: FlaskClient):
+    response = client.get("/api/courses/?q=dept:CSCI&keywords[]=CSCI")
+    assert response.status_code == 400
+
+
+def test_related_courses(client: FlaskClient):
+    response = client.get("/api/courses/MATH2028/related?basic=true&limit=3")
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert len(res.data) <= 3
+    assert "MATH2028" not in [course.code for course in res.data]
+
+    response = client.get("/api/courses/MATH2028/related?limit=0")
+    assert response.status_code == 400
+
+    response = client.get("/api/courses/XXXX0000/related")
+    assert response.status_code == 404
+
+
+def test_course_shards(client: FlaskClient):
+    """
+    Test if the department shards together hold every course exactly once
+    """
+    response = client.get("/api/courses/shards")
+    assert response.status_code == 200
+    res = CourseShardsResponseModel.model_validate(response.json)
+    assert res.data is not None
+
+    codes: list[str] = []
+    for department, url in res.data.shards.items():
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in response.headers["Cache-Control"]
+        courses = json.loads(gzip.decompress(response.data))
+        response.close()
+        assert all(course["code"].startswith(department) for course in courses)
+        codes += [course["code"] for course in courses]
+
+        # Clients without gzip support get the plain JSON
+        response = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert [course["code"] for course in response.json] == [
+            course["code"] for course in courses
+        ]
+
+    response = client.get("/api/courses/?limit=10000")
+    all_codes = [course["code"] for course in response.json["data"]]
+    assert sorted(codes) == sorted(all_codes)
+
+    response = client.get("/api/courses/shards/MATH.0000000000000000.json.gz")
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "for_me, status_code",
+    [
+        ("true", Unauthorized.status_code),
+        ("false", 200),
+        ("FALSE", 200),
+        ("yes", BadRequest.status_code),
+    ],
+)
+def test_courses_for_me_without_session(
+    for_me: str, status_code: int, client: FlaskClient
+):
+    """
+    Test if only a true for_me flag requires a session
+    """
+    response = client.get(f"/api/courses/?for_me={for_me}")
+    assert response.status_code == status_code
+
+
+@pytest.mark.parametrize(
+    "major, excluded", [("ESHE", True), ("eshe", True), ("CSCI", False)]
+)
+def test_courses_for_me(
+    major: str, excluded: bool, client: FlaskClient, get_db: GetDatabase
+):
+    """
+    Test if courses not open to the major of the user are left out with for_me
+    """
+    response = client.get("/api/courses/?for_me=true")
+    assert response.status_code == Unauthorized.status_code
+
+    user = random_user()
+    user.major = major
+    get_db().users.insert_one(user.model_dump(exclude_none=True))
+    with client.session_transaction() as session:
+        session["username"] = user.username
+
+    # PHED1042 is not for PESH and ESHE majors
+    for query in [
+        "limit=10000",
+        "q=dept:PHED",
+        "keywords[]=PHED",
+        "strict=true&keywords[]=PHED",
+    ]:
+        response = client.get(f"/api/courses/?{query}")
+        all_codes = [course["code"] for course in response.json["data"]]
+        assert "PHED1042" in all_codes
+
+        response = client.get(f"/api/courses/?{query}&for_me=true")
+        assert response.status_code == 200
+        codes = [course["code"] for course in response.json["data"]]
+        if excluded:
+            assert codes == [code for code in all_codes if code != "PHED1042"]
+        else:
+            assert codes == all_codes
+
+
+def test_index_search_mode(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    """
+    Test if the index search mode ranks code matches first, then text matches
+    """
+    monkeypatch.setattr("flaskr.db.courses.COURSE_SEARCH_MODE", "index")
+    response = client.get(
+        "/api/courses/?basic=true&keywords[]=PHED&keywords[]=calculus"
+    )
+    assert response.status_code == 200
+    codes = [course["code"] for course in response.json["data"]]
+    phed_codes = sorted(
+        course["code"]
+        for course in get_catalog().courses
+        if course["code"].startswith("PHED")
+    )
+    assert codes[: len(phed_codes)] == phed_codes
+    assert any(code.startswith("MATH") for code in codes[len(phed_codes) :])
+
+    response = client.get("/api/courses/", query_string={"q": "dept:MATH calculus"})
+    assert response.status_code == 200
+    assert response.json["data"]
+    assert all(course["code"].startswith("MATH") for course in response.json["data"])
+
+
+def test_search_highlight(client: FlaskClient):
+    """
+    Test if highlighted search results point at the matched text
+    """
+    response = client.get(
+        "/api/courses/?basic=true&strict=true&highlight=true&keywords[]=PHED"
+    )
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.data
+    for course in res.data:
+        assert course.code is not None and course.highlight is not None
+        assert [
+            course.code[start:end] for start, end in course.highlight.spans["code"]
+        ] == ["PHED"]
+        assert course.highlight.snippet is not None
+
+    # Highlighting is only added on request, also for cached results
+    response = client.get("/api/courses/?basic=true&strict=true&keywords[]=PHED")
+    assert all("highlight" not in course for course in response.json["data"])
+    response = client.get(
+        "/api/courses/?basic=true&strict=true&highlight=false&keywords[]=PHED"
+    )
+    assert response.status_code == 200
+    assert response.json["data"]
+    assert all("highlight" not in course for course in response.json["data"])
@@ -2,10 +2,16 @@ from datetime import datetime
 from typing import Any
 
 import pytest
+from bson import ObjectId
 from flask.testing import FlaskClient
 
 from flaskr.api.exceptions import BadRequest, DuplicateResource, NotFound, Unauthorized
-from flaskr.api.respmodels import ResponseModel, SemesterPlanResponseModel
+from flaskr.api.respmodels import (
+    ResponseModel,
+    SemesterPlanBatchResponseModel,
+    SemesterPlanMoveResponseModel,
+    SemesterPlanResponseModel,
+)
 from flaskr.db.models import CoursePlan, SemesterPlanCreate, SemesterPlanRead, User
 from tests.utils import GetDatabase, random_string, random_user
 
@@ -140,6 +146,51 @@ def test_get_semester_plan(logged_in_client: FlaskClient, test_course_plan: Cour
     assert data.data.year == semester_plan_data.year
 
 
+def test_get_hydrated_semester_plan(
+    logged_in_client: FlaskClient, test_course_plan: CoursePlan
+):
+    assert test_course_plan.id is not None
+    semester_plan_data = SemesterPlanCreate(
+        course_plan_id=test_course_plan.id,
+        semester=1,
+        year=2025,
+    )
+    create_response = logged_in_client.post(
+        "/api/semester-plans/", json=semester_plan_data.model_dump(mode="json")
+    )
+    semester_plan_id = create_response.get_json()["data"]["_id"]
+    logged_in_client.patch(
+        f"/api/semester-plans/{semester_plan_id}",
+        json={"courses": ["MATH2028", "XXXX0000", "CSCI3100"]},
+    )
+
+    response = logged_in_client.get(f"/api/semester-plans/{semester_plan_id}")
+    assert "course_details" not in response.get_json()["data"]
+
+    response = logged_in_client.get(
+        f"/api/semester-plans/{semester_plan_id}?hydrate=basic"
+    )
+    assert response.status_code == 200
+    course_details = response.get_json()["data"]["course_details"]
+    # Unknown codes are left out
+    assert [course["code"] for course in course_details] == ["MATH2028", "CSCI3100"]
+    assert course_details[1]["title"] == "Software Engineering"
+    assert "description" not in course_details[1]
+
+    response = logged_in_client.get(
+        f"/api/semester-plans/{semester_plan_id}?hydrate=full"
+    )
+    assert response.status_code == 200
+    course_details = response.get_json()["data"]["course_details"]
+    assert [course["code"] for course in course_details] == ["MATH2028", "CSCI3100"]
+    assert "description" in course_details[1]
+
+    response = logged_in_client.get(
+        f"/api/semester-plans/{semester_plan_id}?hydrate=everything"
+    )
+    assert response.status_code == BadRequest.status_code
+
+
 def test_update_semester_plan(
     logged_in_client: FlaskClient, test_course_plan: CoursePlan
 ):
@@ -170,6 +221,13 @@ def test_update_semester_plan(
     assert data["data"]["year"] == updated_data["year"]
     assert data["data"]["courses"] == ["ENGG1110", "CSCI1130"]
 
+    # Only course codes can be saved, as only those can be removed or moved
+    for courses in [["engg1110"], ["ENGG 1110"], ["x"]]:
+        response = logged_in_client.patch(
+            f"/api/semester-plans/{created_data['_id']}", json={"courses": courses}
+        )
+        assert response.status_code == BadRequest.status_code
+
 
 def test_delete_semester_plan(
     logged_in_client: FlaskClient, test_course_plan: CoursePlan
@@ -358,3 +416,167 @@ def test_different_user_access_same_semester_plan(
     _cross_access(logged_in_client_2, semester_plan)
     # User 1 access user 2 semester plan should get error
     _cross_access(logged_in_client, semester_plan_2)
+
+
+def test_semester_plan_course_edits(
+    logged_in_client: FlaskClient,
+    logged_in_client_2: FlaskClient,
+    test_course_plan: CoursePlan,
+):
+    assert test_course_plan.id is not None
+    semester_plan_ids: list[str] = []
+    for semester in [1, 2]:
+        response = logged_in_client.post(
+            "/api/semester-plans/",
+            json=SemesterPlanCreate(
+                course_plan_id=test_course_plan.id, semester=semester, year=2025
+            ).model_dump(mode="json"),
+        )
+        semester_plan_ids.append(response.get_json()["data"]["_id"])
+    first, second = semester_plan_ids
+
+    for code in ["CSCI3100", "MATH2028"]:
+        response = logged_in_client.post(
+            f"/api/semester-plans/{first}/courses", json={"code": code}
+        )
+        assert response.status_code == 200
+    assert response.get_json()["data"]["courses"] == ["CSCI3100", "MATH2028"]
+    response = logged_in_client.post(
+        f"/api/semester-plans/{first}/courses", json={"code": "not a code"}
+    )
+    assert response.status_code == BadRequest.status_code
+
+    # Course codes in paths are validated like in request bodies
+    response = logged_in_client.post(
+        f"/api/semester-plans/{first}/courses/csci3100/move",
+        json={"target_semester_plan_id": second},
+    )
+    assert response.status_code == BadRequest.status_code
+    response = logged_in_client.delete(f"/api/semester-plans/{first}/courses/csci3100")
+    assert response.status_code == BadRequest.status_code
+
+    response = logged_in_client.post(
+        f"/api/semester-plans/{first}/courses/CSCI3100/move",
+        json={"target_semester_plan_id": second},
+    )
+    assert response.status_code == 200
+    res = SemesterPlanMoveResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.source.courses == ["MATH2028"]
+    assert res.data.target.courses == ["CSCI3100"]
+    response = logged_in_client.post(
+        f"/api/semester-plans/{first}/courses/CSCI3100/move",
+        json={"target_semester_plan_id": second},
+    )
+    assert response.status_code == NotFound.status_code
+    response = logged_in_client.post(
+        f"/api/semester-plans/{first}/courses/MATH2028/move",
+        json={"target_semester_plan_id": first},
+    )
+    assert response.status_code == BadRequest.status_code
+
+    # Other users can edit neither semester plan
+    response = logged_in_client_2.delete(
+        f"/api/semester-plans/{second}/courses/CSCI3100"
+    )
+    assert response.status_code == NotFound.status_code
+    response = logged_in_client_2.post(
+        f"/api/semester-plans/{first}/courses/MATH2028/move",
+        json={"target_semester_plan_id": second},
+    )
+    assert response.status_code == NotFound.status_code
+
+    response = logged_in_client.delete(f"/api/semester-plans/{second}/courses/CSCI3100")
+    assert response.status_code == 200
+    assert response.get_json()["data"]["courses"] == []
+
+
+def test_semester_plan_batch(
+    logged_in_client: FlaskClient,
+    logged_in_client_2: FlaskClient,
+    test_course_plan: CoursePlan,
+    test_course_plan_2: CoursePlan,
+):
+    assert test_course_plan.id is not None
+    response = logged_in_client.post(
+        "/api/semester-plans/",
+        json=SemesterPlanCreate(
+            course_plan_id=test_course_plan.id, semester=1, year=2025
+        ).model_dump(mode="json"),
+    )
+    first = response.get_json()["data"]["_id"]
+    response = logged_in_client.post(
+        "/api/semester-plans/",
+        json=SemesterPlanCreate(
+            course_plan_id=test_course_plan.id, semester=2, year=2025
+        ).model_dump(mode="json"),
+    )
+    second = response.get_json()["data"]["_id"]
+    unknown = str(ObjectId())
+
+    operations: list[JSON] = [
+        {"op": "create", "semester": 1, "year": 2026, "courses": ["CSCI3100"]},
+        {"op": "add_course", "semester_plan_id": first, "code": "MATH2028"},
+        {"op": "update", "semester_plan_id": first, "courses": ["ENGG1110"]},
+        {"op": "remove_course", "semester_plan_id": unknown, "code": "MATH2028"},
+        {"op": "delete", "semester_plan_id": second},
+        {"op": "add_course", "semester_plan_id": second, "code": "MATH2028"},
+    ]
+    body = {"course_plan_id": str(test_course_plan.id), "operations": operations}
+    response = logged_in_client.post("/api/semester-plans/batch", json=body)
+    assert response.status_code == 200
+    res = SemesterPlanBatchResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert [result.status for result in res.data] == [
+        "ok",
+        "ok",
+        "ok",
+        "not_found",
+        "ok",
+        "not_found",
+    ]
+    created = res.data[0].semester_plan_id
+    response = logged_in_client.get(f"/api/semester-plans/{created}")
+    assert response.get_json()["data"]["courses"] == ["CSCI3100"]
+    assert response.get_json()["data"]["year"] == 2026
+    response = logged_in_client.get(f"/api/semester-plans/{first}")
+    assert response.get_json()["data"]["courses"] == ["ENGG1110"]
+    response = logged_in_client.get(f"/api/semester-plans/{second}")
+    assert response.status_code == NotFound.status_code
+
+    # Operations after a failing one are skipped
+    operations = [
+        {"op": "create", "semester": 1, "year": 2025},
+        {"op": "add_course", "semester_plan_id": first, "code": "MATH2028"},
+    ]
+    body = {"course_plan_id": str(test_course_plan.id), "operations": operations}
+    response = logged_in_client.post("/api/semester-plans/batch", json=body)
+    assert response.status_code == 200
+    res = SemesterPlanBatchResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert [result.status for result in res.data] == ["error", "skipped"]
+    response = logged_in_client.get(f"/api/semester-plans/{first}")
+    assert response.get_json()["data"]["courses"] == ["ENGG1110"]
+
+    # Course plans of other users are not found
+    response = logged_in_client_2.post("/api/semester-plans/batch", json=body)
+    assert response.status_code == NotFound.status_code
+
+    body["operations"] = [{"op": "rename", "semester_plan_id": first}]
+    response = logged_in_client.post("/api/semester-plans/batch", json=body)
+    assert response.status_code == BadRequest.status_code
+
+    # Course codes are validated like in the single course routes
+    for operation in [
+        {"op": "add_course", "semester_plan_id": first, "code": "not a code"},
+        {"op": "remove_course", "semester_plan_id": first, "code": "csci3100"},
+        {"op": "create", "semester": 3, "year": 2025, "courses": ["MATH2028", "x"]},
+        {"op": "update", "semester_plan_id": first, "courses": ["math2028"]},
+    ]:
+        body["operations"] = [operation]
+        response = logged_in_client.post("/api/semester-plans/batch", json=body)
+        assert response.status_code == BadRequest.status_code
+        res = ResponseModel.model_validate(response.json)
+        assert isinstance(res.error, BadRequest)
+    response = logged_in_client.get(f"/api/semester-plans/{first}")
+    assert response.get_json()["data"]["courses"] == ["ENGG1110"]
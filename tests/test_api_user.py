@@ -26,8 +26,8 @@ from flaskr.api.respmodels import (
     UserResponseModel,
     LicenseKeyResponseModel,
 )
-from flaskr.db.models import User, UserCreate, UserRead
-from flaskr.db.user import create_precreated_user
+from flaskr.db.models import SessionClaims, User, UserCreate, UserRead, UserUpdate
+from flaskr.db.user import create_precreated_user, update_user
 from tests.utils import GetDatabase, random_user
 
 
@@ -263,6 +263,46 @@ def test_sessions(client: FlaskClient):
     _test_session(None)
 
 
+def test_session_claims(monkeypatch: MonkeyPatch, client: FlaskClient):
+    user = random_user()
+    key, _ = create_precreated_user(user.email)
+    response = client.post(
+        "/api/user/signup",
+        json=UserCreate.model_validate(
+            {**user.model_dump(), "license_key": key, "password": user.password_hash}
+        ).model_dump(),
+    )
+    res = UserResponseModel.model_validate(response.json)
+    assert res.data is not None
+    with client.session_transaction() as session:
+        claims = SessionClaims.model_validate(session["claims"])
+    assert claims.user_id == res.data.id
+    assert claims.major == user.major
+    assert client.get("/api/course-plans/").status_code == 200
+
+    # The claims are trusted until they are revalidated
+    update_user(user.username, UserUpdate(password="new_password"))
+    assert client.get("/api/course-plans/").status_code == 200
+    with monkeypatch.context() as m:
+        m.setattr("flaskr.api.auth_guard.SESSION_REVALIDATE_INTERVAL", 0)
+        response = client.get("/api/course-plans/")
+    assert response.status_code == Unauthorized.status_code
+    with client.session_transaction() as session:
+        assert session.get("claims") is None
+
+    # Expired sessions end
+    response = client.post(
+        "/api/user/login",
+        json={"username": user.username, "password": "new_password"},
+    )
+    assert response.status_code == 200
+    assert client.get("/api/course-plans/").status_code == 200
+    with client.session_transaction() as session:
+        session["claims"] = {**session["claims"], "expires_at": "2000-01-01T00:00Z"}
+    response = client.get("/api/course-plans/")
+    assert response.status_code == Unauthorized.status_code
+
+
 def test_forgot_verify_reset_password(
     monkeypatch: MonkeyPatch, client: FlaskClient, get_db: GetDatabase
 ):
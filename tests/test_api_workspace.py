@@ -0,0 +1,105 @@
+import pytest
+from bson import ObjectId
+from flask.testing import FlaskClient
+
+from flaskr.api.exceptions import BadRequest, Unauthorized
+from flaskr.api.respmodels import ResponseModel, WorkspaceResponseModel
+from flaskr.db.course_plans import create_course_plan
+from flaskr.db.models import SemesterPlanUpdate, User, UserRead
+from flaskr.db.semester_plans import create_semester_plan, update_semester_plan
+from tests.utils import GetDatabase, random_string, random_user
+
+
+@pytest.fixture
+def test_user(get_db: GetDatabase):
+    user = random_user()
+    user.id = get_db().users.insert_one(user.model_dump(exclude_none=True)).inserted_id
+    return user
+
+
+@pytest.fixture
+def logged_in_client(test_user: User, client: FlaskClient):
+    with client.session_transaction() as session:
+        session["username"] = test_user.username
+    yield client
+
+
+def test_unauthenticated_access(client: FlaskClient):
+    response = client.get("/api/workspace/")
+    assert response.status_code == Unauthorized.status_code
+    res = ResponseModel.model_validate(response.json)
+    assert isinstance(res.error, Unauthorized)
+
+
+def test_empty_workspace(logged_in_client: FlaskClient, test_user: User):
+    response = logged_in_client.get("/api/workspace/?courses=true")
+    assert response.status_code == 200
+    res = WorkspaceResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.user == UserRead.model_validate(test_user.model_dump())
+    assert res.data.course_plans == []
+    assert res.data.courses == []
+
+
+def test_workspace(logged_in_client: FlaskClient, test_user: User):
+    assert test_user.id is not None
+    plan_ids = []
+    for _ in range(3):
+        course_plan = create_course_plan(
+            description=random_string(20), name=random_string(), user_id=test_user.id
+        )
+        assert course_plan is not None and course_plan.id is not None
+        plan_ids.append(course_plan.id)
+        for semester, year in [(2, 2025), (1, 2025)]:
+            semester_plan = create_semester_plan(
+                course_plan.id, semester, year, user_id=test_user.id
+            )
+            assert semester_plan is not None and semester_plan.id is not None
+            update_semester_plan(
+                semester_plan.id,
+                SemesterPlanUpdate(courses=["CSCI3100", "MATH2028", "XXXX0000"]),
+            )
+
+    # Course plans of other users are not included
+    create_course_plan(description="", name=random_string(), user_id=ObjectId())
+
+    response = logged_in_client.get("/api/workspace/")
+    assert response.status_code == 200
+    res = WorkspaceResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.courses is None
+    assert sorted(plan.course_plan.id for plan in res.data.course_plans) == sorted(
+        plan_ids
+    )
+    for plan in res.data.course_plans:
+        assert [(sp.year, sp.semester) for sp in plan.semester_plans] == [
+            (2025, 1),
+            (2025, 2),
+        ]
+
+    response = logged_in_client.get("/api/workspace/?courses=false")
+    assert response.status_code == 200
+    res = WorkspaceResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.courses is None
+
+    response = logged_in_client.get("/api/workspace/?courses=true")
+    assert response.status_code == 200
+    res = WorkspaceResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.courses is not None
+    # Unknown codes are left out, every course is included once
+    assert [course.code for course in res.data.courses] == ["CSCI3100", "MATH2028"]
+    assert response.json["data"]["courses"][0].keys() == {
+        "_id",
+        "code",
+        "title",
+        "units",
+    }
+
+
+def test_invalid_courses_flag(logged_in_client: FlaskClient):
+    response = logged_in_client.get("/api/workspace/?courses=yes")
+    assert response.status_code == BadRequest.status_code
+    res = ResponseModel.model_validate(response.json)
+    assert isinstance(res.error, BadRequest)
@@ -0,0 +1,119 @@
+import pytest
+
+from flaskr.db.course_index import CourseIndex, stem, tokenize
+
+
+@pytest.mark.parametrize(
+    "word, expected",
+    [
+        ("programming", "program"),
+        ("programmed", "program"),
+        ("programs", "program"),
+        ("studies", "studi"),
+        ("study", "studi"),
+        ("classes", "class"),
+        ("calculus", "calculus"),
+        ("operating", "operate"),
+        ("3100", "3100"),
+    ],
+)
+def test_stem(word: str, expected: str):
+    assert stem(word) == expected
+
+
+def test_tokenize():
+    text = "Object-oriented programming (CSCI-3100) 程式設計"
+    tokens = tokenize(text)
+    assert [token.term for token in tokens] == [
+        "object",
+        "orient",
+        "program",
+        "csci3100",
+        "csci",
+        "3100",
+        "程式",
+        "式設",
+        "設計",
+    ]
+    # Offsets point back into the original text
+    assert [text[token.start : token.end] for token in tokens] == [
+        "Object",
+        "oriented",
+        "programming",
+        "CSCI-3100",
+        "CSCI",
+        "3100",
+        "程式",
+        "式設",
+        "設計",
+    ]
+    assert [token.term for token in tokenize("The art of 數")] == ["art", "數"]
+
+
+def test_course_index_search():
+    courses = [
+        {
+            "code": "CSCI3150",
+            "title": "Operating Systems",
+            "description": "Processes and threads.",
+        },
+        {
+            "code": "CSCI1130",
+            "title": "Java Programming",
+            "description": "An introduction to programming.",
+        },
+        {"code": "CHLL1000", "title": "中國語文", "description": "中文寫作與閱讀。"},
+        {
+            "code": "MATH1010",
+            "title": "Calculus",
+            "description": "Limits and derivatives.",
+        },
+    ]
+    index = CourseIndex(courses)
+
+    def search(text: str, positions: list[int] | None = None):
+        return [
+            courses[position]["code"] for _, position in index.search(text, positions)
+        ]
+
+    assert search("operating system") == ["CSCI3150"]
+    assert search("programs") == ["CSCI1130"]
+    assert search("csci-1130") == ["CSCI1130", "CSCI3150"]
+    assert search("中文") == ["CHLL1000"]
+    assert search("derivative limit") == ["MATH1010"]
+    assert search("java calculus", positions=[3]) == ["MATH1010"]
+    assert search("biology") == []
+
+
+def test_course_index_highlight():
+    description = (
+        "An introduction to software engineering. " * 5 + "Students program in teams."
+    )
+    index = CourseIndex(
+        [
+            {
+                "code": "CSCI3100",
+                "title": "Software Engineering",
+                "description": description,
+            }
+        ]
+    )
+
+    highlight = index.highlight("CSCI3100", "csci software-engineering teams")
+    assert highlight is not None
+    assert highlight["spans"]["code"] == [(0, 4)]
+    assert highlight["spans"]["title"] == [(0, 8), (9, 20)]
+    # The snippet shows the first match in the description with some context
+    assert highlight["snippet"].startswith("An introduction to software")
+    assert highlight["snippet_spans"][:2] == [(19, 27), (28, 39)]
+
+    highlight = index.highlight("CSCI3100", "teams")
+    assert highlight is not None
+    snippet = highlight["snippet"]
+    assert description.endswith(snippet)
+    assert [snippet[start:end] for start, end in highlight["snippet_spans"]] == [
+        "teams"
+    ]
+
+    assert index.highlight("CSCI3100", "biology")["spans"] == {}
+    assert index.highlight("MATH1010", "calculus") is None
@@ -2,14 +2,17 @@ import random
 from datetime import datetime, timedelta, timezone
 
 import pytest
+from bson import ObjectId
 
 from flaskr.db.course_plans import (
     create_course_plan,
     delete_course_plan,
     get_course_plan,
+    get_course_plan_with_semesters,
     update_course_plan,
 )
 from flaskr.db.models import CoursePlan, CoursePlanUpdate, User
+from flaskr.db.semester_plans import create_semester_plan
 from tests.utils import GetDatabase, random_string, random_user
 
 
@@ -77,6 +80,39 @@ def test_get_course_plan(course_plans: list[CoursePlan], test_user: User):
         assert db_plan == course_plan
 
 
+def test_get_course_plan_with_semesters(
+    course_plans: list[CoursePlan], test_user: User
+):
+    """
+    Test fetching a course plan with its semester plans sorted by year and semester.
+    """
+    assert test_user.id is not None
+    course_plan = course_plans[0]
+    assert course_plan.id is not None
+    for semester, year in [(2, 2025), (1, 2026), (3, 2024), (1, 2025)]:
+        create_semester_plan(course_plan.id, semester, year, user_id=test_user.id)
+    assert course_plans[1].id is not None
+    create_semester_plan(course_plans[1].id, 1, 2025, user_id=test_user.id)
+
+    res = get_course_plan_with_semesters(course_plan.id, test_user.id)
+    assert res is not None
+    db_plan, semester_plans = res
+    # Creating the semester plans touched the course plan
+    assert db_plan.model_dump(exclude={"updated_at"}) == course_plan.model_dump(
+        exclude={"updated_at"}
+    )
+    assert db_plan.updated_at > course_plan.updated_at
+    assert [(plan.year, plan.semester) for plan in semester_plans] == [
+        (2024, 3),
+        (2025, 1),
+        (2025, 2),
+        (2026, 1),
+    ]
+    assert all(plan.course_plan_id == course_plan.id for plan in semester_plans)
+
+    assert get_course_plan_with_semesters(course_plan.id, ObjectId()) is None
+
+
 def test_update_course_plan(course_plans: list[CoursePlan], test_user: User):
     """
     Test updating course plans.
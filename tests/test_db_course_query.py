@@ -0,0 +1,189 @@
+import pytest
+
+from flaskr.db.catalog import Catalog
+from flaskr.db.course_query import CourseFilter, CourseQuery, extract_course_codes
+
+
+@pytest.mark.parametrize(
+    "keywords, prefixes, number_patterns, terms",
+    [
+        (["MATH2028"], ["MATH2028"], [], []),
+        (["math 2028"], ["MATH2028"], [], []),
+        # Separate keywords are separate alternatives
+        (["math", "2028"], ["MATH"], ["^[A-Z]{4}2028"], []),
+        (["MATH1030", "1038"], ["MATH1030"], ["^[A-Z]{4}1038"], []),
+        # Only course codes lend their department to later numbers
+        (["data science 2028"], ["DATA"], ["^[A-Z]{4}2028"], ["science"]),
+        (
+            ["MATH1030 data science 1038"],
+            ["MATH1030", "DATA", "MATH1038"],
+            [],
+            ["science"],
+        ),
+        (["csci-31"], ["CSCI31"], [], []),
+        (["ENGG", "CSCI", "CENG", "MATH"], ["ENGG", "CSCI", "CENG", "MATH"], [], []),
+        (["MATH", "MATH2028"], ["MATH"], [], []),
+        (["MATH1030 or 1038"], ["MATH1030", "MATH1038"], [], []),
+        (["2028"], [], ["^[A-Z]{4}2028"], []),
+        (["engiNEERing"], [], [], ["engiNEERing"]),
+        ([".*"], [], [], [".*"]),
+        (["  ", ""], [], [], []),
+    ],
+)
+def test_course_query_normalization(
+    keywords: list[str],
+    prefixes: list[str],
+    number_patterns: list[str],
+    terms: list[str],
+):
+    query = CourseQuery(keywords)
+    assert query.prefixes == prefixes
+    assert query.number_patterns == number_patterns
+    assert query.terms == terms
+
+
+def test_course_query_code_filter():
+    query = CourseQuery(["math 2028"])
+    assert query.code_filter() == {"code": {"$gte": "MATH2028", "$lt": "MATH2029"}}
+
+    query = CourseQuery(["CSCI", "2028"])
+    assert query.code_filter() == {
+        "$or": [
+            {"code": {"$gte": "CSCI", "$lt": "CSCJ"}},
+            {"code": {"$regex": "^[A-Z]{4}2028"}},
+        ]
+    }
+
+    # Plain words are left to the full-text search
+    query = CourseQuery(["CSCI", ".*"])
+    assert query.code_filter() == {"code": {"$gte": "CSCI", "$lt": "CSCJ"}}
+    assert CourseQuery(["operating systems"]).code_filter() == {"code": {"$in": []}}
+
+    # Nothing to look for matches nothing
+    assert CourseQuery([]).code_filter() == {"code": {"$in": []}}
+
+
+@pytest.mark.parametrize(
+    "keywords, code, expected",
+    [
+        (["math 2028"], "MATH2028", True),
+        (["math 2028"], "MATH2070", False),
+        (["2028"], "MATH2028", True),
+        (["2028"], "MATH1028", False),
+        (["MATH", "2028"], "CSCI2028", True),
+        (["MATH", "2028"], "MATH1010", True),
+        (["CSCI"], "CSCI3100", True),
+        ([".*"], "CSCI3100", False),
+        (["sci"], "CSCI3100", False),
+        ([], "CSCI3100", False),
+    ],
+)
+def test_course_query_matches_code(keywords: list[str], code: str, expected: bool):
+    assert CourseQuery(keywords).matches_code(code) is expected
+
+
+def test_course_query_key():
+    assert (
+        CourseQuery(["MATH", "calculus"]).key == CourseQuery(["math", " calculus "]).key
+    )
+    assert CourseQuery(["MATH2028"]).key != CourseQuery(["MATH2070"]).key
+
+
+@pytest.mark.parametrize(
+    "text, codes",
+    [
+        ("MATH1030", {"MATH1030"}),
+        ("(MATH1030 or 1038) and ENGG1120", {"MATH1030", "MATH1038", "ENGG1120"}),
+        ("CSCI 2100 or ESTR2102", {"CSCI2100", "ESTR2102"}),
+        ("1038", set()),
+        ("", set()),
+    ],
+)
+def test_extract_course_codes(text: str, codes: set[str]):
+    assert extract_course_codes(text) == codes
+
+
+def test_course_filter_parsing():
+    course_filter = CourseFilter(
+        'dept:csci code:ENGG-1 units:>=3 units:<4 graded:false prereq:csci2100 "operating systems"'
+    )
+    assert course_filter.prefixes == ["CSCI", "ENGG1"]
+    assert course_filter.units == [(">=", 3.0), ("<", 4.0)]
+    assert course_filter.graded is False
+    assert course_filter.prerequisites == ["CSCI2100"]
+    assert course_filter.corequisites == []
+    assert course_filter.text == "operating systems"
+    assert course_filter.has_predicates
+
+    assert not CourseFilter("calculus").has_predicates
+    assert (
+        CourseFilter("dept:MATH calculus").key
+        == CourseFilter("calculus  DEPT:math").key
+    )
+
+
+@pytest.mark.parametrize(
+    "q",
+    [
+        "dept:CSCI3100",
+        "code:3100",
+        "units:many",
+        "graded:maybe",
+        "prereq:CSCI",
+        "foo:bar",
+        '"open',
+    ],
+)
+def test_course_filter_invalid(q: str):
+    with pytest.raises(ValueError):
+        CourseFilter(q)
+
+
+def test_course_filter_apply():
+    courses = [
+        {
+            "code": code,
+            "units": units,
+            "is_graded": graded,
+            "prerequisites": prereq,
+            "corequisites": "",
+        }
+        for code, units, graded, prereq in [
+            ("CSCI3100", 3.0, True, "CSCI2100"),
+            ("CSCI2100", 3.0, True, ""),
+            ("CSCI1130", 3.0, True, ""),
+            ("CSCJ1000", 1.0, False, ""),
+            ("MATH2028", 3.0, True, "MATH1030 or 1038"),
+            ("MATH1030", 3.0, True, ""),
+        ]
+    ]
+    catalog = Catalog((1, None), courses)
+
+    def apply(q: str):
+        return [course["code"] for course in CourseFilter(q).apply(catalog)]
+
+    assert apply("dept:CSCI") == ["CSCI1130", "CSCI2100", "CSCI3100"]
+    assert apply("dept:CSCI code:CSCI2 code:MATH1") == [
+        "CSCI1130",
+        "CSCI2100",
+        "CSCI3100",
+        "MATH1030",
+    ]
+    assert apply("units:<3") == ["CSCJ1000"]
+    assert apply("graded:false units:1") == ["CSCJ1000"]
+    assert apply("prereq:MATH1038") == ["MATH2028"]
+    assert apply("dept:MATH prereq:CSCI2100") == []
+
+
+def test_course_query_excluded_codes():
+    query = CourseQuery(["PHED"], excluded_codes=["PHED1042"])
+    assert query.matches_code("PHED1073")
+    assert not query.matches_code("PHED1042")
+    assert query.key != CourseQuery(["PHED"]).key
+    assert query.exclude(query.code_filter()) == {
+        "$and": [
+            {"code": {"$gte": "PHED", "$lt": "PHEE"}},
+            {"code": {"$nin": ["PHED1042"]}},
+        ]
+    }
+    assert CourseQuery(["PHED"]).exclude({}) == {}
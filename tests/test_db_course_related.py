@@ -0,0 +1,48 @@
+from flaskr.db.course_related import compute_related_courses
+
+
+def test_compute_related_courses():
+    courses = [
+        {
+            "code": "MATH1010",
+            "title": "Calculus I",
+            "description": "Limits and derivatives of functions.",
+        },
+        {
+            "code": "MATH1020",
+            "title": "Calculus II",
+            "description": "Integrals and series of functions.",
+        },
+        {
+            "code": "MATH2010",
+            "title": "Advanced Calculus",
+            "description": "Derivatives and integrals in several variables.",
+        },
+        {
+            "code": "CSCI1130",
+            "title": "Java Programming",
+            "description": "Programming with objects in Java.",
+        },
+        {
+            "code": "CSCI1120",
+            "title": "C++ Programming",
+            "description": "Programming with objects in C++.",
+        },
+        {"code": "PHED1000", "title": "Swimming", "description": "Basic strokes."},
+    ]
+    related = {doc["code"]: doc for doc in compute_related_courses(courses)}
+    assert set(related) == {course["code"] for course in courses}
+
+    assert related["CSCI1130"]["related"][0] == "CSCI1120"
+    assert set(related["MATH1010"]["related"][:2]) == {"MATH1020", "MATH2010"}
+    # Nothing in common with any other course
+    assert related["PHED1000"]["related"] == []
+
+    for doc in related.values():
+        assert doc["code"] not in doc["related"]
+        assert doc["scores"] == sorted(doc["scores"], reverse=True)
+
+
+def test_compute_related_courses_small_catalog():
+    assert compute_related_courses([]) == []
+    assert compute_related_courses([{"code": "MATH1010", "title": "Calculus I"}]) == []
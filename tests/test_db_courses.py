@@ -1,11 +1,23 @@
 import json
 import os
+from datetime import datetime, timezone
+from threading import Event
 from typing import Any
 
+import pytest
 from flask.testing import FlaskClient
 
-from flaskr.api.respmodels import CoursesResponseModel
-from flaskr.db.database import init_db
+from flaskr.api.exceptions import BadRequest, MethodNotAllowed
+from flaskr.api.respmodels import (
+    CourseChangesResponseModel,
+    CoursesResponseModel,
+    ResponseModel,
+)
+from flaskr.db.catalog import get_catalog
+from flaskr.db.course_queries import flush_course_queries, get_popular_course_queries
+from flaskr.db.courses import warm_course_search_cache
+from flaskr.db.database import ingest_course_data, init_db, reload_course_data
+from tests.utils import GetDatabase
 
 JSON = dict[str, Any]
 
@@ -71,3 +83,152 @@ def test_courses_version_upgrade(client: FlaskClient):
     assert len(res.data) == 0
 
     os.environ["COURSE_DATA_FILENAME"] = course_data_filename
+
+
+def test_courses_reload(client: FlaskClient):
+    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+    assert course_data_filename is not None, "COURSE_DATA_FILENAME is not set"
+
+    # Same version as the ingested one, nothing to do
+    assert reload_course_data() is False
+
+    course_data = json.load(open(course_data_filename))
+    course_data["version"] += 1
+    course_data["data"].pop("CSCI3100")
+
+    with open("courses_new.json", "w") as f:
+        json.dump(course_data, f)
+
+    os.environ["COURSE_DATA_FILENAME"] = "courses_new.json"
+    try:
+        assert reload_course_data() is True
+    finally:
+        os.remove("courses_new.json")
+        os.environ["COURSE_DATA_FILENAME"] = course_data_filename
+
+    assert get_catalog().version == course_data["version"]
+    assert "CSCI3100" not in get_catalog().by_code
+
+    response = client.get("/api/courses/?limit=2147483647")
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    assert res.data is not None
+    assert len(res.data) == len(course_data["data"])
+
+
+def test_courses_reload_endpoint(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    reloaded = Event()
+    monkeypatch.setattr("flaskr.api.courses.reload_course_data", reloaded.set)
+
+    response = client.post("/api/courses/reload")
+    assert response.status_code == 202
+    res = ResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    # The reload runs in the background
+    assert reloaded.wait(timeout=5)
+
+    response = client.post(
+        "/api/courses/reload", environ_base={"REMOTE_ADDR": "10.0.0.1"}
+    )
+    assert response.status_code == MethodNotAllowed.status_code
+    res = ResponseModel.model_validate(response.json)
+    assert res.status == "ERROR"
+
+
+def test_courses_changes(client: FlaskClient):
+    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+    assert course_data_filename is not None, "COURSE_DATA_FILENAME is not set"
+
+    course_data = json.load(open(course_data_filename))
+    version = course_data.get("version")
+
+    new_course_data = json.loads(json.dumps(course_data))
+    new_course_data["version"] = version + 1
+    new_course_data["data"].pop("CSCI3100")
+    new_course_data["data"]["MATH2028"]["data"]["units"] = 4.0
+    new_course_data["data"]["ZZZZ9999"] = json.loads(
+        json.dumps(new_course_data["data"]["PHED1073"])
+    )
+    new_course_data["data"]["ZZZZ9999"]["data"]["code"] = "ZZZZ9999"
+    ingest_course_data(new_course_data)
+
+    response = client.get(f"/api/courses/changes?since={version}")
+    assert response.status_code == 200
+    res = CourseChangesResponseModel.model_validate(response.json)
+    assert res.status == "OK"
+    assert res.data is not None
+    assert res.data.version == version + 1
+    assert res.data.full_sync is False
+    changes = {change.code: change for change in res.data.changes}
+    assert set(changes.keys()) == {"CSCI3100", "MATH2028", "ZZZZ9999"}
+    assert changes["CSCI3100"].change == "removed"
+    assert changes["CSCI3100"].course is None
+    assert changes["MATH2028"].change == "changed"
+    assert changes["MATH2028"].course is not None
+    assert changes["MATH2028"].course.units == 4.0
+    assert changes["ZZZZ9999"].change == "added"
+
+    # Up to date clients get nothing
+    response = client.get(f"/api/courses/changes?since={version + 1}")
+    res = CourseChangesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.full_sync is False
+    assert res.data.changes == []
+
+    # The first ingestion is recorded as well, so old clients can still catch up
+    response = client.get("/api/courses/changes?since=0")
+    res = CourseChangesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.full_sync is False
+    assert {change.code for change in res.data.changes} == set(
+        new_course_data["data"].keys()
+    ) | {"CSCI3100"}
+
+    # Clients from the future must resynchronize
+    response = client.get(f"/api/courses/changes?since={version + 2}")
+    res = CourseChangesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert res.data.full_sync is True
+
+    response = client.get("/api/courses/changes?since=foo")
+    assert response.status_code == BadRequest.status_code
+
+
+def test_course_search_cache_warming(
+    client: FlaskClient, get_db: GetDatabase, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr("flaskr.db.course_queries.COURSE_QUERY_SAMPLE_RATE", 1.0)
+
+    for _ in range(3):
+        response = client.get("/api/courses/?keywords[]=MATH&basic=true")
+        assert response.status_code == 200
+    response = client.get("/api/courses/?keywords[]=calculus")
+    assert response.status_code == 200
+    flush_course_queries()
+
+    popular_queries = get_popular_course_queries(1)
+    assert len(popular_queries) == 1
+    assert popular_queries[0]["keywords"] == ["MATH"]
+    # Recorded searches expire unless seen again
+    assert all(
+        doc["expires_at"] > datetime.now(timezone.utc)
+        for doc in get_db().course_queries.find()
+    )
+
+    # A new catalog version starts with an empty search cache
+    course_data_filename = os.getenv("COURSE_DATA_FILENAME")
+    assert course_data_filename is not None, "COURSE_DATA_FILENAME is not set"
+    course_data = json.load(open(course_data_filename))
+    course_data["version"] += 1
+    ingest_course_data(course_data)
+
+    catalog = get_catalog()
+    warm_course_search_cache(catalog)
+    assert len(catalog.search_cache) == 2
+
+    response = client.get("/api/courses/?keywords[]=MATH&basic=true")
+    assert response.status_code == 200
+    res = CoursesResponseModel.model_validate(response.json)
+    assert res.data is not None
+    assert all(course.code.startswith("MATH") for course in res.data)
@@ -1,12 +1,20 @@
 from datetime import datetime
 
 import pytest
+from bson import ObjectId
 
+from flaskr.db.database import (
+    _migrate_semester_plan_courses,
+    _migrate_semester_plan_owners,
+)
 from flaskr.db.models import CoursePlan, SemesterPlanUpdate, User
 from flaskr.db.semester_plans import (
+    add_semester_plan_course,
     create_semester_plan,
     delete_semester_plan,
     get_semester_plan,
+    move_semester_plan_course,
+    remove_semester_plan_course,
     update_semester_plan,
 )
 from tests.utils import GetDatabase, random_string, random_user
@@ -178,3 +186,130 @@ def test_different_course_plans_create_same_compound_key_semester_plan(
         assert semester_plan.course_plan_id == test_course_plan.id
         assert semester_plan.semester == 1
         assert semester_plan.year == 2025
+
+
+def test_semester_plan_ownership(
+    test_user: User, test_course_plan: CoursePlan, get_db: GetDatabase
+):
+    assert test_course_plan.id is not None
+    assert test_user.id is not None
+    semester_plan = create_semester_plan(
+        course_plan_id=test_course_plan.id,
+        semester=1,
+        year=2025,
+        user_id=test_user.id,
+    )
+    assert semester_plan is not None
+    assert semester_plan.id is not None
+
+    # Semester plans of other users are neither read nor changed
+    other_user_id = ObjectId()
+    assert get_semester_plan(semester_plan.id, other_user_id) is None
+    updates = SemesterPlanUpdate(courses=["CSCI3100"])
+    assert update_semester_plan(semester_plan.id, updates, other_user_id) is None
+    assert delete_semester_plan(semester_plan.id, other_user_id) is None
+
+    fetched_plan = get_semester_plan(semester_plan.id, test_user.id)
+    assert fetched_plan is not None
+    assert fetched_plan.user_id == test_user.id
+    assert fetched_plan.courses == []
+    updated_plan = update_semester_plan(semester_plan.id, updates, test_user.id)
+    assert updated_plan is not None
+    assert updated_plan.courses == ["CSCI3100"]
+    assert delete_semester_plan(semester_plan.id, test_user.id) is not None
+    assert get_semester_plan(semester_plan.id) is None
+
+
+def test_semester_plan_owner_migration(
+    test_user: User, test_course_plan: CoursePlan, get_db: GetDatabase
+):
+    db = get_db()
+    semester_plan_id = db.semester_plans.insert_one(
+        {"course_plan_id": test_course_plan.id, "semester": 1, "year": 2025}
+    ).inserted_id
+    # Left behind by a deleted course plan
+    orphan_id = db.semester_plans.insert_one(
+        {"course_plan_id": ObjectId(), "semester": 1, "year": 2025}
+    ).inserted_id
+
+    _migrate_semester_plan_owners(db)
+    semester_plan = db.semester_plans.find_one({"_id": semester_plan_id})
+    assert semester_plan is not None
+    assert semester_plan["user_id"] == test_user.id
+    assert db.semester_plans.find_one({"_id": orphan_id}) is None
+    # Nothing is left for the next start
+    assert db.semester_plans.find_one({"user_id": None}) is None
+
+
+def test_semester_plan_courses_migration(
+    test_user: User, test_course_plan: CoursePlan, get_db: GetDatabase
+):
+    db = get_db()
+    semester_plan_id = db.semester_plans.insert_one(
+        {
+            "course_plan_id": test_course_plan.id,
+            "courses": ["csci 3100", "MATH2028", "x", "CSCI-3100"],
+            "semester": 1,
+            "year": 2025,
+            "user_id": test_user.id,
+        }
+    ).inserted_id
+    valid_id = db.semester_plans.insert_one(
+        {
+            "course_plan_id": test_course_plan.id,
+            "courses": ["ENGG1110"],
+            "semester": 2,
+            "year": 2025,
+            "user_id": test_user.id,
+        }
+    ).inserted_id
+
+    _migrate_semester_plan_courses(db)
+    semester_plan = db.semester_plans.find_one({"_id": semester_plan_id})
+    assert semester_plan is not None
+    assert semester_plan["courses"] == ["CSCI3100", "MATH2028"]
+    semester_plan = db.semester_plans.find_one({"_id": valid_id})
+    assert semester_plan is not None
+    assert semester_plan["courses"] == ["ENGG1110"]
+
+
+def test_semester_plan_course_edits(
+    test_user: User, test_two_course_plans: list[CoursePlan], get_db: GetDatabase
+):
+    assert test_user.id is not None
+    first_course_plan, second_course_plan = test_two_course_plans
+    assert first_course_plan.id is not None and second_course_plan.id is not None
+    first = create_semester_plan(first_course_plan.id, 1, 2025, test_user.id)
+    second = create_semester_plan(first_course_plan.id, 2, 2025, test_user.id)
+    other = create_semester_plan(second_course_plan.id, 1, 2025, test_user.id)
+    assert first and second and other
+    assert first.id and second.id and other.id
+
+    for code in ["CSCI3100", "MATH2028", "CSCI3100"]:
+        updated_plan = add_semester_plan_course(first.id, code, test_user.id)
+        assert updated_plan is not None
+    assert updated_plan.courses == ["CSCI3100", "MATH2028"]
+    assert add_semester_plan_course(first.id, "ENGG1110", ObjectId()) is None
+
+    res = move_semester_plan_course(first.id, second.id, "CSCI3100", test_user.id)
+    assert res is not None
+    source, target = res
+    assert source.courses == ["MATH2028"]
+    assert target.courses == ["CSCI3100"]
+    # The course must be in the source, the target in the same course plan
+    assert move_semester_plan_course(first.id, second.id, "CSCI3100") is None
+    assert move_semester_plan_course(first.id, other.id, "MATH2028") is None
+    assert move_semester_plan_course(first.id, first.id, "MATH2028") is None
+    other_user_id = ObjectId()
+    assert (
+        move_semester_plan_course(first.id, second.id, "MATH2028", other_user_id)
+        is None
+    )
+    fetched_plan = get_semester_plan(first.id)
+    assert fetched_plan is not None
+    assert fetched_plan.courses == ["MATH2028"]
+
+    updated_plan = remove_semester_plan_course(first.id, "MATH2028", test_user.id)
+    assert updated_plan is not None
+    assert updated_plan.courses == []
+    assert remove_semester_plan_course(first.id, "MATH2028", other_user_id) is None
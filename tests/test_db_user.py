@@ -1,5 +1,7 @@
 from datetime import datetime, timezone
 
+import pytest
+
 from flaskr.db import user as pkg
 from flaskr.db.models import PreUser, ResetToken, UserCreate, UserUpdate
 from flaskr.utils import KeyGenerator
@@ -126,6 +128,8 @@ def test_update_delete_user(get_db: GetDatabase):
     assert pkg.get_user_by_username(original_user.username) is None
     assert pkg.get_user_by_username(res.username) == res
     original_user.username = res.username
+    assert res.version == original_user.version + 1
+    original_user.version = res.version
     assert res == original_user
 
     original_user = pkg.get_user_by_username(users[1])
@@ -140,6 +144,7 @@ def test_update_delete_user(get_db: GetDatabase):
     assert res.last_login.timestamp() == tm.timestamp()
     assert res.last_login.timestamp() >= original_user.last_login.timestamp()
     original_user.last_login = res.last_login
+    original_user.version = res.version
     assert res == original_user
 
     original_user = pkg.get_user_by_username(users[2])
@@ -154,6 +159,10 @@ def test_update_delete_user(get_db: GetDatabase):
     assert res.major == "new_major"
     original_user.password_hash = res.password_hash
     original_user.major = res.major
+    original_user.version = res.version
+    # Changing the password revokes the sessions of the user
+    assert res.credential_version == original_user.credential_version + 1
+    original_user.credential_version = res.credential_version
     assert res == original_user
 
     assert pkg.delete_user(original_user.username) is not None
@@ -217,3 +226,50 @@ def test_reset_token(get_db: GetDatabase):
     assert token is not None
     assert KeyGenerator.verify_key(key1, token.token_hash) is False
     assert KeyGenerator.verify_key(key2, token.token_hash) is True
+
+
+def test_cached_user(get_db: GetDatabase, monkeypatch: pytest.MonkeyPatch):
+    userdb = get_db().users
+    user = random_user()
+    userdb.insert_one(user.model_dump(exclude_none=True))
+
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None
+    assert cached_user.username == user.username
+
+    # Served from the cache without reading the database
+    with monkeypatch.context() as m:
+        m.setattr("flaskr.db.user.get_db", lambda: pytest.fail())
+        assert pkg.get_cached_user_by_username(user.username) == cached_user
+
+    # Updates through this worker are visible immediately
+    pkg.update_user(user.username, UserUpdate(major="new_major"))
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None and cached_user.major == "new_major"
+
+    # Updates by other workers are noticed once the cached user expires
+    userdb.update_one(
+        {"username": user.username},
+        {"$set": {"major": "other_major"}, "$inc": {"version": 1}},
+    )
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None and cached_user.major == "new_major"
+    monkeypatch.setattr("flaskr.db.user.USER_CACHE_TTL", 0)
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None and cached_user.major == "other_major"
+
+    # A username registered again is not served from the entry of the old user
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None
+    userdb.delete_one({"username": user.username})
+    new_user = random_user()
+    new_user.username = user.username
+    new_user.major = "another_major"
+    new_user.version = cached_user.version
+    new_user.id = userdb.insert_one(new_user.model_dump(exclude_none=True)).inserted_id
+    cached_user = pkg.get_cached_user_by_username(user.username)
+    assert cached_user is not None
+    assert cached_user.id == new_user.id and cached_user.major == "another_major"
+
+    userdb.delete_one({"username": user.username})
+    assert pkg.get_cached_user_by_username(user.username) is None
@@ -1,4 +1,8 @@
+import threading
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
 
 from flaskr import utils
 from flaskr.db.models import UserCreate
@@ -57,3 +61,78 @@ def test_password_hasher():
     assert (
         utils.PasswordHasher.verify_password("123k12op3123qk123", "asdl120123") is False
     )  # garbage
+
+
+def test_single_flight():
+    flight = utils.SingleFlight()
+    started = threading.Event()
+    joined = threading.Semaphore(0)
+    calls: list[int] = []
+
+    class Calls(dict):
+        # Signals every caller finding the call in flight
+        def get(self, key, default=None):
+            future = super().get(key, default)
+            if future is not None:
+                joined.release()
+            return future
+
+    flight._calls = Calls()
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        # Finish only once all followers share the call
+        for _ in range(3):
+            assert joined.acquire(timeout=5)
+        return ["result"]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "key", slow_call)
+        assert started.wait(5)
+        followers = [executor.submit(flight.do, "key", slow_call) for _ in range(3)]
+
+        assert leader.result() == (["result"], False)
+        for follower in followers:
+            result, shared = follower.result()
+            assert result == ["result"]
+            assert shared is True
+    assert len(calls) == 1
+
+    # Finished calls are not cached
+    assert flight.do("key", lambda: ["new result"]) == (["new result"], False)
+
+    # Exceptions are raised to the caller and do not stay in flight
+    def failing_call():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", failing_call)
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+def test_lru_cache(monkeypatch: pytest.MonkeyPatch):
+    cache: utils.LRUCache[str, int] = utils.LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used entry
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+    cache.pop("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+    now = 0.0
+    monkeypatch.setattr("flaskr.utils.monotonic", lambda: now)
+    cache = utils.LRUCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    now = 0.04
+    assert cache.get("a") == 1
+    now = 0.05
+    assert cache.get("a") is None